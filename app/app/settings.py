@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -63,6 +64,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the time of the other middleware is part of the requests'.
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,16 +99,107 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# The connections are kept open for 'DB_CONN_MAX_AGE' seconds (0 closes
+# them at the end of every request), and checked before the first query
+# of each request. With 'DB_POOL_SIZE', the closed connections go back to
+# a pool shared by the threads of each worker instead, see 'core.db.pool'.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(
+            os.environ.get('DB_CONN_MAX_AGE', 0 if DB_POOL_SIZE else 60)
+        ),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))
+        ),
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'IDLE_TIMEOUT': int(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        } if DB_POOL_SIZE else None,
     }
 }
 
+# The hosts of the read replicas of the database, comma separated, become
+# the 'replica_1', 'replica_2', ... databases. The GETs of the recipe APIs
+# read from them, see 'core.db.routers'.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+    start=1,
+):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        # The tests read the replicas' data from the test database.
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# After a write, the reads of the user stick to the primary for this many
+# seconds, which should be more than the replication lag. A replica more
+# than 'REPLICA_MAX_LAG' seconds behind (checked every
+# 'REPLICA_LAG_CHECK_INTERVAL' seconds) isn't read from.
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = float(
+    os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+#
+# The default, LocMemCache, is local to each worker process. Deployments
+# running more than one worker must use a cache shared by all of them
+# (e.g. FileBasedCache, memcached or Redis), otherwise a write seen by one
+# worker won't invalidate the cached responses of the others.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # The revoked access tokens, see 'user.tokens'. An entry culled to
+    # make room would let a revoked token back in, so this cache is kept
+    # apart from the responses & never culls its entries: deployments
+    # with more than one host must point it at a server shared by all of
+    # them (e.g. Redis without eviction). A cache lost as a whole, e.g.
+    # on a restart, is filled again from the database.
+    'tokens': {
+        'BACKEND': os.environ.get(
+            'TOKEN_CACHE_BACKEND',
+            os.environ.get(
+                'CACHE_BACKEND',
+                'django.core.cache.backends.locmem.LocMemCache',
+            ),
+        ),
+        'LOCATION': os.environ.get('TOKEN_CACHE_LOCATION', 'tokens'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10 ** 7)
+            ),
+        },
+    },
+}
+
+# How long (in seconds) the responses of the recipe APIs are cached.
+# Writes invalidate them right away, this only limits how long an unused
+# response takes up space in the cache.
+RECIPE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -158,10 +252,63 @@ AUTH_USER_MODEL = 'core.User'
 
 # Configure the Django rest_framework to use the drf_spectacular
 # that's purpose is to make API documentation easier.
+# JSON is rendered & parsed with 'orjson' (see 'core.renderers'), swap
+# in DRF's 'JSONRenderer' & 'JSONParser' to go back to the 'json' module.
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Lifetimes (in seconds) of the signed access & refresh tokens issued by
+# the user API. Access tokens are checked without a database query, so
+# keep them short lived.
+ACCESS_TOKEN_LIFETIME = int(os.environ.get('ACCESS_TOKEN_LIFETIME', 5 * 60))
+REFRESH_TOKEN_LIFETIME = int(
+    os.environ.get('REFRESH_TOKEN_LIFETIME', 7 * 24 * 60 * 60)
+)
+
+# The number of users whose tag (or ingredient) names each worker keeps in
+# memory for the autocomplete, see 'recipe.autocomplete'.
+AUTOCOMPLETE_MAX_INDEXES = int(
+    os.environ.get('AUTOCOMPLETE_MAX_INDEXES', 1000)
+)
+
+# Functions run with 'core.tasks.run_after_commit' (e.g. processing the
+# uploaded recipe images) run in a pool of this many threads, or right
+# away in the request when eager, as in the tests, so they don't leave
+# threads using the test database behind.
+BACKGROUND_TASK_WORKERS = int(os.environ.get('BACKGROUND_TASK_WORKERS', 2))
+BACKGROUND_TASKS_EAGER = bool(int(os.environ.get(
+    'BACKGROUND_TASKS_EAGER',
+    sys.argv[1:2] == ['test'],
+)))
+
+# Every worker saves its request metrics to a file of 'METRICS_DIR' this
+# often (in seconds), see 'core.metrics'. The directory is local to the
+# host: each host is scraped on its own. '/api/metrics/' is open to the
+# admins, and to the requests with 'Authorization: Bearer <METRICS_TOKEN>'.
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/django-metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Serve the recipe, tag & ingredient APIs with async views, for ASGI (see
+# 'core.asynchronous' & 'SERVER=asgi' in 'scripts/run.sh').
+ASYNC_VIEWS = bool(int(os.environ.get('ASYNC_VIEWS', 0)))
+# The async views run in a pool of this many threads per process, each
+# with its own database connection: at most as many as the pool of
+# 'DB_POOL_SIZE' holds, when there's one, as more would only wait for it.
+ASYNC_VIEW_THREADS = int(
+    os.environ.get('ASYNC_VIEW_THREADS', DB_POOL_SIZE or 8)
+)
+
 # Make the image uploads work through the browser interface.
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
@@ -24,6 +24,7 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/metrics/', core_views.MetricsView.as_view(), name='metrics'),
     # Will look at our code and generate the schema
     # file that we need for our project
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
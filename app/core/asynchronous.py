@@ -0,0 +1,198 @@
+"""
+Running the views of the APIs as async views, under ASGI.
+
+Django 4.0 has no async ORM, the queries still have to run in a thread.
+Under ASGI, Django runs every sync view in a thread of its own, started
+for the request, and so with a new database connection for every request.
+'async_view()' runs the view in the threads of a pool of the process
+instead, which keep their connections from one request to the next (as
+long as 'CONN_MAX_AGE' allows), while the event loop reads the requests &
+writes the responses of the slow clients without holding any thread. The
+pool has 'settings.ASYNC_VIEW_THREADS' threads, so a worker never holds
+more connections than that.
+
+Django 4.0 also reads the streamed responses in the event loop, where the
+queries of e.g. a streamed list can't run. 'StreamingASGIHandler' reads
+them in a thread of the pool instead, a few parts ahead of the client, so
+they're still sent as they're made.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+# The most parts of a streamed response read ahead of the client.
+STREAM_READ_AHEAD = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the thread pool of this process, creating it when needed."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_VIEW_THREADS,
+                thread_name_prefix='async-view',
+            )
+    return _executor
+
+
+def database_sync_to_async(func):
+    """
+    Return an async version of 'func', which uses the database, running
+    in the pool of threads.
+
+    Django closes the connections that are too old (or broken) when a
+    request starts & ends, but only the connections of the thread the
+    request ran in, so it's done here in the thread of the pool.
+    """
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @functools.wraps(func)
+    async def run(*args, **kwargs):
+        # The context variables, e.g. the query counter of the request
+        # (see 'core.metrics'), are seen by the thread too.
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_executor(),
+            functools.partial(context.run, call, *args, **kwargs),
+        )
+
+    return run
+
+
+async def iterate_in_thread(iterable):
+    """
+    Yield the items of a sync iterable, iterated in a thread of the pool,
+    at most 'STREAM_READ_AHEAD' items ahead.
+
+    All of them are read in the same thread, as the database connection
+    of a cursor can't be used from another one.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(STREAM_READ_AHEAD)
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    break
+                put((True, item))
+        finally:
+            put((False, None))
+
+    task = asyncio.ensure_future(database_sync_to_async(produce)())
+    try:
+        while True:
+            more, item = await queue.get()
+            if not more:
+                break
+            yield item
+        # Raises the error of the iteration, if any.
+        await task
+    finally:
+        # The client went away: stop the thread, which may be waiting
+        # for room in the queue.
+        stopped.set()
+        while not task.done():
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                {getter, task},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            getter.cancel()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    The ASGI handler of Django, with the streamed responses read in a
+    thread of the pool (see 'iterate_in_thread()') rather than in the
+    event loop.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # Like Django's, which keeps the case of the headers.
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip(),
+            ))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = iterate_in_thread(response)
+        try:
+            async for part in parts:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            await parts.aclose()
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """Return the ASGI application, like Django's function of that name."""
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
+
+
+def _render(view, request, *args, **kwargs):
+    """Call the view & render its response, all in the same thread."""
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    return response
+
+
+def async_view(view):
+    """
+    Return an async version of a (DRF) view, running in the pool of
+    threads (see 'database_sync_to_async()').
+
+    The attributes DRF, its router & drf-spectacular read on the views
+    (e.g. 'cls' & 'actions') are kept.
+    """
+    run = database_sync_to_async(functools.partial(_render, view))
+
+    async def view_async(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+
+    functools.update_wrapper(view_async, view)
+    return view_async
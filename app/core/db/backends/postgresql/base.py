@@ -0,0 +1,124 @@
+"""
+PostgreSQL backend with health checks of the persistent connections, and
+an optional pool of connections (see 'core.db.pool').
+
+It takes two settings in the database's dictionary, next to Django's:
+    - 'CONN_HEALTH_CHECKS': check that a persistent connection still works
+      (with a 'SELECT 1') before the first query of each request, & open a
+      new one if it doesn't, like the option of the same name of Django
+      4.1. A connection taken from the pool is checked too.
+    - 'POOL': e.g. {'SIZE': 10, 'IDLE_TIMEOUT': 300, 'TIMEOUT': 10}, to
+      give the closed connections back to a pool shared by the threads of
+      the process, instead of closing them. None for no pool.
+
+The pool is for the servers, not the test runner: the idle connections
+to the test database would keep it from being dropped.
+"""
+import psycopg2
+from core.db import pool
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+
+def _is_usable(connection):
+    """Return whether a psycopg2 connection still works."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def _reset(connection):
+    """
+    Roll back what a connection left unfinished, before it goes back to
+    the pool. Return whether it can be used again.
+    """
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL database wrapper with health checks & a pool."""
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    @property
+    def connection_pool(self):
+        """Return the pool of the database, or None if it has none."""
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return pool.get_pool(
+            self.alias,
+            self.settings_dict['NAME'],
+            options,
+            check=_is_usable if self.health_check_enabled else None,
+        )
+
+    def get_new_connection(self, conn_params):
+        connection_pool = self.connection_pool
+        if connection_pool is None:
+            return super().get_new_connection(conn_params)
+
+        try:
+            connection = connection_pool.get(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params,
+                ),
+            )
+        except pool.PoolTimeout as exc:
+            # Raised like the errors of psycopg2, as an 'OperationalError'.
+            raise psycopg2.OperationalError(str(exc)) from exc
+        # Set by 'get_new_connection()' when the connection was opened,
+        # maybe by the connection of another thread.
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level',
+            connection.isolation_level,
+        )
+        return connection
+
+    def _close(self):
+        connection_pool = self.connection_pool
+        if connection_pool is None or self.connection is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            connection_pool.put(self.connection, _reset(self.connection))
+
+    def connect(self):
+        super().connect()
+        # A new connection works, no need to check it.
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Called when the requests start & end, the next request checks
+        # the connection again.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.health_check_enabled
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+                pool.count_reconnect(self.alias)
+        super().ensure_connection()
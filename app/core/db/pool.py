@@ -0,0 +1,212 @@
+"""
+A pool of database connections, shared by the threads of a process.
+
+Django opens one connection per thread, and by default closes it at the
+end of every request, so each request pays for the TCP, TLS & login
+handshakes. With a pool (see 'core.db.backends.postgresql'), closing a
+connection gives it back to the pool instead, and the next request of any
+thread of the process, e.g. the background tasks of 'core.tasks' under
+uwsgi's '--enable-threads', takes it from there.
+
+The pool holds at most 'size' connections. A thread asking for one when
+they're all in use waits up to 'timeout' seconds for one to be given
+back, then gets a 'PoolTimeout'. Connections idle for more than
+'idle_timeout' seconds are closed, so the pool shrinks back when the
+traffic drops.
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+
+# The pools of the process, by (database alias, database name).
+_pools = {}
+# The persistent connections (without a pool) found broken by a health
+# check & opened again, by database alias.
+_reconnects = Counter()
+_pools_lock = threading.Lock()
+_pid = None
+
+
+class PoolTimeout(Exception):
+    """No connection was given back to the pool in time."""
+
+
+class ConnectionPool:
+    """
+    A pool of connections of one database.
+
+    'connect()' is given to 'get()' since it depends on the Django
+    connection asking for one. 'check(connection)', if given, returns
+    whether a connection taken from the pool still works; a broken one is
+    closed & replaced by a new one, which counts as a reconnect.
+    """
+
+    def __init__(self, size, idle_timeout=300, timeout=10, check=None):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.check = check
+        self._condition = threading.Condition()
+        # The idle connections & when they were given back, the most
+        # recent last, so the ones in use are the warmest.
+        self._idle = deque()
+        self._in_use = 0
+        self._stats = dict.fromkeys([
+            'checkouts', 'waits', 'wait_seconds', 'timeouts', 'connects',
+            'reconnects', 'idle_closed',
+        ], 0)
+
+    def _close_idle(self):
+        """Close the connections idle for too long, holding the lock."""
+        expired = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < expired:
+            connection, returned_at = self._idle.popleft()
+            self._stats['idle_closed'] += 1
+            _close_quietly(connection)
+
+    def _available(self):
+        """Return whether a connection can be taken, holding the lock."""
+        return self._idle or self._in_use < self.size
+
+    def _checkout(self):
+        """
+        Return an idle connection, or None if a new one may be opened,
+        waiting for one to be given back when the pool is full.
+        """
+        with self._condition:
+            self._close_idle()
+            if not self._available():
+                self._stats['waits'] += 1
+                start = time.monotonic()
+                available = self._condition.wait_for(
+                    self._available,
+                    self.timeout,
+                )
+                self._stats['wait_seconds'] += time.monotonic() - start
+                if not available:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available in the pool of '
+                        f'{self.size} after {self.timeout} seconds.'
+                    )
+
+            self._in_use += 1
+            if self._idle:
+                connection, returned_at = self._idle.pop()
+                return connection
+            return None
+
+    def get(self, connect):
+        """Return a connection, from the pool or opened with 'connect()'."""
+        connection = self._checkout()
+        try:
+            if connection is not None and self.check and not self.check(
+                connection,
+            ):
+                _close_quietly(connection)
+                connection = None
+                with self._condition:
+                    self._stats['reconnects'] += 1
+            if connection is None:
+                connection = connect()
+                with self._condition:
+                    self._stats['connects'] += 1
+        except BaseException:
+            # The place taken for the connection is free again.
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._stats['checkouts'] += 1
+        return connection
+
+    def put(self, connection, usable=True):
+        """Give a connection back, closing it if it isn't 'usable'."""
+        with self._condition:
+            self._in_use -= 1
+            if usable and not connection.closed:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._condition.notify()
+        if connection is not None:
+            _close_quietly(connection)
+
+    def stats(self):
+        """Return the counters & the gauges of the pool."""
+        with self._condition:
+            self._close_idle()
+            return {
+                **self._stats,
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            }
+
+
+def _close_quietly(connection):
+    """Close a connection, which may already be broken."""
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def _check_pid():
+    """
+    Forget the pools of the parent process in a forked worker, e.g.
+    uwsgi's, which can't share their connections. Holding the lock.
+    """
+    global _pid
+    if _pid != os.getpid():
+        _pools.clear()
+        _reconnects.clear()
+        _pid = os.getpid()
+
+
+def get_pool(alias, name, options, check=None):
+    """
+    Return the pool of the database 'alias', creating it from the 'POOL'
+    options of the database ('SIZE', 'IDLE_TIMEOUT' & 'TIMEOUT'). There's
+    a pool per database name too, as the test runner renames them.
+    """
+    key = (alias, name)
+    with _pools_lock:
+        _check_pid()
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                size=options.get('SIZE', 10),
+                idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                timeout=options.get('TIMEOUT', 10),
+                check=check,
+            )
+        return _pools[key]
+
+
+def count_reconnect(alias):
+    """Count a persistent connection opened again after a health check."""
+    with _pools_lock:
+        _check_pid()
+        _reconnects[alias] += 1
+
+
+def get_stats():
+    """
+    Return the stats of the connections of this process, by alias: the
+    reconnects, & the stats of the pool if the database has one.
+    """
+    with _pools_lock:
+        _check_pid()
+        pools = dict(_pools)
+        reconnects = dict(_reconnects)
+    stats = {
+        alias: {'reconnects': count}
+        for alias, count in reconnects.items()
+    }
+    for (alias, name), pool in pools.items():
+        pool_stats = pool.stats()
+        pool_stats['reconnects'] += reconnects.get(alias, 0)
+        stats[alias] = pool_stats
+    return stats
@@ -0,0 +1,143 @@
+"""
+Routing the reads of the API to the read replicas of the database.
+
+Only the reads of the requests that opted in (see
+'recipe.views.ReplicaReadMixin') go to a replica, e.g. the GETs of the
+recipes, tags & ingredients: everything else, writes, commands &
+background tasks included, uses the primary ('default').
+
+A replica can be a little behind the primary, so a user who just wrote
+something would not find it in the next list. After a write request, or
+any change to the user's recipes, tags or ingredients (see
+'mark_written()'), the user's reads stick to the primary for
+'settings.REPLICA_STICKY_SECONDS' (a flag in the shared cache, so it
+holds across workers), which should be more than the usual replication
+lag.
+
+The lag of each replica is checked every
+'settings.REPLICA_LAG_CHECK_INTERVAL' seconds; a replica more than
+'settings.REPLICA_MAX_LAG' seconds behind, or down, is skipped until the
+next check, and without any replica left the reads go to the primary.
+"""
+import contextvars
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Where the reads of the current request go, None outside the requests
+# that opted in.
+_read_database = contextvars.ContextVar('read_database', default=None)
+
+# The lag of the replicas, by alias, as (when it was checked, lag).
+_lags = {}
+_lags_lock = threading.Lock()
+
+
+def _sticky_key(user_id):
+    """Return the cache key of the flag of a user reading the primary."""
+    return f'replica:sticky:{user_id}'
+
+
+def mark_written(user_id):
+    """
+    Send the reads of the user to the primary for a while, after their
+    data changed, whatever changed it: a request, the admin, a command...
+    """
+    cache.set(_sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def start_request(user_id, read_only):
+    """
+    Route the reads of the current request of the user: to a replica if
+    'read_only', unless the user wrote something a moment ago, else to
+    the primary, and those of the next requests of the user too, for a
+    while. Return a token for 'end_request()'.
+    """
+    if not read_only and user_id is not None:
+        mark_written(user_id)
+
+    database = DEFAULT_DB_ALIAS
+    if read_only and settings.DATABASE_REPLICAS:
+        database = get_replica(user_id) or DEFAULT_DB_ALIAS
+    return _read_database.set(database)
+
+
+def end_request(token):
+    """Stop routing the reads of the request to the replicas."""
+    _read_database.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Return how many seconds the replica is behind the primary, or
+    infinity if it can't be reached.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        # No streaming replication to check, e.g. SQLite in the tests.
+        return 0
+    try:
+        with connection.cursor() as cursor:
+            # A replica that replayed all it received is up to date,
+            # however old its last transaction is.
+            cursor.execute(
+                'SELECT CASE WHEN pg_last_wal_receive_lsn() '
+                '= pg_last_wal_replay_lsn() THEN 0 ELSE EXTRACT(EPOCH FROM '
+                'now() - pg_last_xact_replay_timestamp()) END'
+            )
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        return math.inf
+    return float(lag or 0)
+
+
+def _get_lag(alias):
+    """Return the lag of a replica, checking it again if it's old."""
+    now = time.monotonic()
+    with _lags_lock:
+        checked_at, lag = _lags.get(alias, (None, None))
+    if checked_at is None or (
+        now - checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL
+    ):
+        lag = replica_lag(alias)
+        with _lags_lock:
+            _lags[alias] = (now, lag)
+    return lag
+
+
+def get_replica(user_id):
+    """Return the replica to read from for the user, or None."""
+    if user_id is not None and cache.get(_sticky_key(user_id)):
+        return None
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if _get_lag(alias) <= settings.REPLICA_MAX_LAG
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaRouter:
+    """Send the reads of the requests that opted in to the replicas."""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # The related objects come from where the instance came from.
+            return instance._state.db
+
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas have the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
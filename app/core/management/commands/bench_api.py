@@ -0,0 +1,634 @@
+"""
+Django command to benchmark the API end to end.
+"""
+import io
+import json
+import math
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+import django
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import URLResolver, reverse
+from PIL import Image
+from recipe import urls as recipe_urls
+from recipe.search import update_index
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from user import tokens
+from user import urls as user_urls
+
+# The words of the titles, so the searches have something to find.
+WORDS = [
+    'chicken', 'curry', 'soup', 'salad', 'pasta', 'rice', 'beans', 'lemon',
+    'garlic', 'tomato', 'spicy', 'quick', 'vegan', 'baked', 'grilled',
+    'roasted', 'creamy', 'crispy', 'mushroom', 'pepper',
+]
+
+PASSWORD = 'bench-password'
+
+
+def percentile(ordered, percent):
+    """Return the nearest-rank percentile of a sorted list."""
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank - 1, 0)]
+
+
+def route_names(urlconf, namespace):
+    """Return the names of the routes of a URL configuration."""
+    names = set()
+    patterns = list(urlconf.urlpatterns)
+    while patterns:
+        pattern = patterns.pop()
+        if isinstance(pattern, URLResolver):
+            patterns.extend(pattern.url_patterns)
+        elif pattern.name:
+            names.add(f'{namespace}:{pattern.name}')
+    return names
+
+
+class Endpoint:
+    """
+    A request made again & again by the benchmark.
+
+    'url' & 'data' are either values or functions of the state returned
+    by 'setup', which runs before every request, untimed, e.g. to create
+    the recipe a DELETE deletes. 'user' is who makes the request: the
+    'member' whose recipes are listed, the 'admin' or None (anonymous).
+    """
+
+    def __init__(self, name, route, url, method='get', data=None,
+                 setup=None, user='member'):
+        self.name = name
+        self.route = route
+        self.url = url
+        self.method = method
+        self.data = data
+        self.setup = setup
+        self.user = user
+
+    def request(self, bench):
+        """Return the arguments of the next request."""
+        state = self.setup(bench) if self.setup else None
+        url = self.url(state) if callable(self.url) else self.url
+        data = self.data(state) if callable(self.data) else self.data
+        # A setup issuing tokens makes the request with its access token.
+        user = self.user
+        if isinstance(state, dict) and 'access' in state:
+            user = state['access']
+        return url, data, user
+
+
+class Command(BaseCommand):
+    """
+    Django command to measure the speed of every route of the API.
+
+    A synthetic dataset is generated from a seed, so two runs with the same
+    options get the same data, in a test database created (& destroyed)
+    for the run, or with '--no-test-db' in the configured database, in a
+    transaction rolled back at the end. Every route of 'recipe.urls' &
+    'user.urls' is then requested through the test client, like a real
+    client would, with a signed access token.
+
+    The report is JSON, with the p50, p95 & p99 latency, the throughput,
+    the SQL queries per request & the peak memory of a request for each
+    endpoint, so the reports of two releases can be compared.
+    """
+    help = 'Benchmark every route of the API, report the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--recipes', type=int, default=200,
+                            help='Recipes per user.')
+        parser.add_argument('--tags', type=int, default=3,
+                            help='Tags per recipe.')
+        parser.add_argument('--ingredients', type=int, default=5,
+                            help='Ingredients per recipe.')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='Untimed requests per endpoint first.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--endpoints',
+                            help='Comma separated names of the endpoints '
+                                 'to run, all of them by default.')
+        parser.add_argument('--output', help='Write the JSON to this file.')
+        parser.add_argument('--no-test-db', action='store_true',
+                            help='Use the configured database, in a '
+                                 'transaction that is rolled back.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        media_root = tempfile.mkdtemp()
+        # Tokens that outlive the run, & the images processed right away,
+        # so their time is part of the upload they belong to.
+        settings = override_settings(
+            MEDIA_ROOT=media_root,
+            BACKGROUND_TASKS_EAGER=True,
+            ACCESS_TOKEN_LIFETIME=24 * 60 * 60,
+        )
+        try:
+            with settings:
+                if options['no_test_db']:
+                    with transaction.atomic():
+                        report = self._run()
+                        transaction.set_rollback(True)
+                else:
+                    report = self._run_in_test_db()
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _run_in_test_db(self):
+        """Run the benchmark in a new test database."""
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0,
+            autoclobber=True,
+            serialize=False,
+        )
+        try:
+            return self._run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _run(self):
+        """Create the dataset, run the endpoints, return the report."""
+        start = time.perf_counter()
+        self._create_dataset()
+        dataset_seconds = time.perf_counter() - start
+
+        endpoints = self._endpoints()
+        covered = {endpoint.route for endpoint in endpoints}
+        missing = (
+            route_names(recipe_urls, 'recipe')
+            | route_names(user_urls, 'user')
+        ) - covered
+        if missing:
+            self.stderr.write(
+                f'Routes not benchmarked: {", ".join(sorted(missing))}'
+            )
+        if self.options['endpoints']:
+            names = set(self.options['endpoints'].split(','))
+            unknown = names - {endpoint.name for endpoint in endpoints}
+            if unknown:
+                raise CommandError(
+                    f'Unknown endpoints: {", ".join(sorted(unknown))}'
+                )
+            endpoints = [e for e in endpoints if e.name in names]
+
+        return {
+            'environment': {
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'dataset': {
+                'users': self.options['users'],
+                'recipes_per_user': self.options['recipes'],
+                'tags_per_recipe': self.options['tags'],
+                'ingredients_per_recipe': self.options['ingredients'],
+                'seed': self.options['seed'],
+                'seconds': round(dataset_seconds, 3),
+            },
+            'requests': self.options['requests'],
+            'endpoints': {
+                endpoint.name: self._measure(endpoint)
+                for endpoint in endpoints
+            },
+        }
+
+    def _create_dataset(self):
+        """Create the users, tags, ingredients & recipes of the run."""
+        options = self.options
+        rng = self.rng
+        password = make_password(PASSWORD)
+        User = get_user_model()
+        users = User.objects.bulk_create([
+            User(email=f'bench-{i}@example.com', password=password)
+            for i in range(options['users'])
+        ])
+        # 'bulk_create' doesn't set the ids on every database.
+        users = list(User.objects.filter(
+            email__startswith='bench-',
+        ).order_by('id'))
+        self.admin = User.objects.create_superuser(
+            'bench-admin@example.com',
+            PASSWORD,
+        )
+
+        for user in users:
+            pools = {}
+            for model, per_recipe, prefix in (
+                (Tag, options['tags'], 'Tag'),
+                (Ingredient, options['ingredients'], 'Ingredient'),
+            ):
+                model.objects.bulk_create([
+                    model(user=user, name=f'{prefix} {j}')
+                    for j in range(max(per_recipe * 5, 10))
+                ])
+                pools[model] = list(
+                    model.objects.filter(user=user).values_list(
+                        'id',
+                        flat=True,
+                    )
+                )
+
+            Recipe.objects.bulk_create([
+                Recipe(
+                    user=user,
+                    title=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                    description=' '.join(rng.choices(WORDS, k=20)),
+                    time_minutes=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 9999)) / 100,
+                    link=f'https://example.com/{rng.getrandbits(32)}',
+                )
+                for _ in range(options['recipes'])
+            ], batch_size=1000)
+            recipe_ids = list(Recipe.objects.filter(
+                user=user,
+            ).values_list('id', flat=True))
+            for field, model, column, count in (
+                ('tags', Tag, 'tag_id', options['tags']),
+                ('ingredients', Ingredient, 'ingredient_id',
+                 options['ingredients']),
+            ):
+                through = getattr(Recipe, field).through
+                through.objects.bulk_create([
+                    through(recipe_id=recipe_id, **{column: target_id})
+                    for recipe_id in recipe_ids
+                    for target_id in rng.sample(pools[model], count)
+                ], batch_size=1000)
+            update_index(recipe_ids)
+
+        self.member = users[0]
+        self.recipe_ids = list(Recipe.objects.filter(
+            user=self.member,
+        ).values_list('id', flat=True))
+        self.tag_ids = list(Tag.objects.filter(
+            user=self.member,
+        ).values_list('id', flat=True))
+        self.ingredient_ids = list(Ingredient.objects.filter(
+            user=self.member,
+        ).values_list('id', flat=True))
+        self.created = 0
+        # The signed tokens don't say who is staff, the admin uses a DRF
+        # token, like the admins of the API do.
+        self.credentials = {
+            'member': 'Bearer {}'.format(
+                tokens.issue_tokens(self.member)['access'],
+            ),
+            'admin': f'Token {Token.objects.create(user=self.admin).key}',
+        }
+
+    def _new_recipe(self, bench=None):
+        """Create a recipe of the member, for the requests changing one."""
+        recipe = Recipe.objects.create(
+            user=self.member,
+            title='Bench recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        return {'id': recipe.id}
+
+    def _new_object(self, model):
+        """Return a setup creating a tag or ingredient of the member."""
+        def setup(bench):
+            self.created += 1
+            obj = model.objects.create(
+                user=self.member,
+                name=f'Bench {self.created}',
+            )
+            return {'id': obj.id}
+        return setup
+
+    def _new_tokens(self, bench=None):
+        """Return a new pair of tokens, to refresh or revoke."""
+        return tokens.issue_tokens(self.member)
+
+    def _recipe_data(self, state=None):
+        """Return the body of a new recipe."""
+        return {
+            'title': ' '.join(self.rng.sample(WORDS, 3)).capitalize(),
+            'time_minutes': self.rng.randint(5, 180),
+            'price': '12.50',
+            'link': 'https://example.com/new',
+            'description': ' '.join(self.rng.choices(WORDS, k=20)),
+            'tags': [{'name': 'Tag 1'}, {'name': 'Bench tag'}],
+            'ingredients': [{'name': 'Ingredient 2'}],
+        }
+
+    def _image(self, state=None):
+        """Return a small JPEG to upload."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'orange').save(buffer, format='JPEG')
+        buffer.seek(0)
+        buffer.name = 'bench.jpg'
+        return {'image': buffer}
+
+    def _endpoints(self):
+        """Return the endpoints to benchmark, covering every route."""
+        rng = self.rng
+
+        def recipe_url(state=None):
+            return reverse(
+                'recipe:recipe-detail',
+                args=[state['id'] if state else rng.choice(self.recipe_ids)],
+            )
+
+        def attr_url(name, ids):
+            def url(state=None):
+                return reverse(
+                    f'recipe:{name}-detail',
+                    args=[state['id'] if state else rng.choice(ids)],
+                )
+            return url
+
+        recipes_url = reverse('recipe:recipe-list')
+        endpoints = [
+            Endpoint('api root', 'recipe:api-root', reverse(
+                'recipe:api-root',
+            )),
+            Endpoint('recipe list', 'recipe:recipe-list', recipes_url),
+            Endpoint(
+                'recipe list page',
+                'recipe:recipe-list',
+                f'{recipes_url}?page_size=20',
+            ),
+            Endpoint(
+                'recipe list filtered',
+                'recipe:recipe-list',
+                lambda state: '{}?page_size=20&tags={}'.format(
+                    recipes_url,
+                    rng.choice(self.tag_ids),
+                ),
+            ),
+            Endpoint(
+                'recipe list fields',
+                'recipe:recipe-list',
+                f'{recipes_url}?fields=id,title',
+            ),
+            Endpoint(
+                'recipe list stream',
+                'recipe:recipe-list',
+                f'{recipes_url}?stream=1',
+            ),
+            Endpoint(
+                'recipe search',
+                'recipe:recipe-list',
+                lambda state: f'{recipes_url}?search={rng.choice(WORDS)}',
+            ),
+            Endpoint(
+                'recipe create',
+                'recipe:recipe-list',
+                recipes_url,
+                method='post',
+                data=self._recipe_data,
+            ),
+            Endpoint('recipe detail', 'recipe:recipe-detail', recipe_url),
+            Endpoint(
+                'recipe update',
+                'recipe:recipe-detail',
+                recipe_url,
+                method='put',
+                data=self._recipe_data,
+            ),
+            Endpoint(
+                'recipe partial update',
+                'recipe:recipe-detail',
+                recipe_url,
+                method='patch',
+                data={'title': 'Renamed', 'tags': [{'name': 'Tag 3'}]},
+            ),
+            Endpoint(
+                'recipe delete',
+                'recipe:recipe-detail',
+                recipe_url,
+                method='delete',
+                setup=self._new_recipe,
+            ),
+            Endpoint(
+                'recipe upload image',
+                'recipe:recipe-upload-image',
+                lambda state: reverse(
+                    'recipe:recipe-upload-image',
+                    args=[state['id']],
+                ),
+                method='post',
+                data=self._image,
+                setup=self._new_recipe,
+            ),
+            Endpoint(
+                'recipe bulk',
+                'recipe:recipe-bulk',
+                reverse('recipe:recipe-bulk'),
+                method='post',
+                data=lambda state: [self._recipe_data() for _ in range(20)],
+            ),
+            Endpoint(
+                'recipe export ndjson',
+                'recipe:recipe-export',
+                reverse('recipe:recipe-export'),
+            ),
+            Endpoint(
+                'recipe export csv',
+                'recipe:recipe-export',
+                f'{reverse("recipe:recipe-export")}?file_format=csv',
+            ),
+            Endpoint(
+                'recipe shopping list',
+                'recipe:recipe-shopping-list',
+                lambda state: '{}?ids={}'.format(
+                    reverse('recipe:recipe-shopping-list'),
+                    ','.join(map(str, rng.sample(
+                        self.recipe_ids,
+                        min(20, len(self.recipe_ids)),
+                    ))),
+                ),
+            ),
+            Endpoint('recipe stats', 'recipe:stats', reverse('recipe:stats')),
+            Endpoint(
+                'cache stats',
+                'recipe:cache-stats',
+                reverse('recipe:cache-stats'),
+                user='admin',
+            ),
+        ]
+
+        for name, model, ids in (
+            ('tag', Tag, self.tag_ids),
+            ('ingredient', Ingredient, self.ingredient_ids),
+        ):
+            list_url = reverse(f'recipe:{name}-list')
+            endpoints += [
+                Endpoint(f'{name} list', f'recipe:{name}-list', list_url),
+                Endpoint(
+                    f'{name} list assigned',
+                    f'recipe:{name}-list',
+                    f'{list_url}?assigned_only=1',
+                ),
+                Endpoint(
+                    f'{name} update',
+                    f'recipe:{name}-detail',
+                    attr_url(name, ids),
+                    method='patch',
+                    data=lambda state: {'name': f'Renamed {rng.random()}'},
+                ),
+                Endpoint(
+                    f'{name} delete',
+                    f'recipe:{name}-detail',
+                    attr_url(name, ids),
+                    method='delete',
+                    setup=self._new_object(model),
+                ),
+                Endpoint(
+                    f'{name} autocomplete',
+                    f'recipe:{name}-autocomplete',
+                    lambda state, name=name: '{}?q={}'.format(
+                        reverse(f'recipe:{name}-autocomplete'),
+                        rng.choice(['t', 'ta', 'tag 1', 'i', 'ingredient']),
+                    ),
+                ),
+            ]
+
+        endpoints += [
+            Endpoint(
+                'user create',
+                'user:create',
+                reverse('user:create'),
+                method='post',
+                data=lambda state: {
+                    'email': f'new-{rng.getrandbits(64)}@example.com',
+                    'password': PASSWORD,
+                    'name': 'New user',
+                },
+                user=None,
+            ),
+            Endpoint(
+                'user token',
+                'user:token',
+                reverse('user:token'),
+                method='post',
+                data={'email': self.member.email, 'password': PASSWORD},
+                user=None,
+            ),
+            Endpoint(
+                'user token refresh',
+                'user:token-refresh',
+                reverse('user:token-refresh'),
+                method='post',
+                data=lambda state: {'refresh': state['refresh']},
+                setup=self._new_tokens,
+            ),
+            Endpoint(
+                'user token revoke',
+                'user:token-revoke',
+                reverse('user:token-revoke'),
+                method='post',
+                data=lambda state: {'refresh': state['refresh']},
+                setup=self._new_tokens,
+            ),
+            Endpoint('user me', 'user:me', reverse('user:me')),
+            Endpoint(
+                'user me update',
+                'user:me',
+                reverse('user:me'),
+                method='patch',
+                data={'name': 'Bench member'},
+            ),
+        ]
+        return endpoints
+
+    def _client(self, user):
+        """Return a client authenticated as the user of a request."""
+        client = APIClient()
+        if user is None:
+            return client
+        credentials = self.credentials.get(user, f'Bearer {user}')
+        client.credentials(HTTP_AUTHORIZATION=credentials)
+        return client
+
+    def _send(self, endpoint):
+        """Make one request, return its response & how long it took."""
+        url, data, user = endpoint.request(self)
+        client = self._client(user)
+        fmt = 'multipart' if endpoint.name == 'recipe upload image' else 'json'
+
+        start = time.perf_counter()
+        response = getattr(client, endpoint.method)(url, data, format=fmt)
+        if response.streaming:
+            # A streamed response is only done once it's all read.
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{endpoint.name}: {endpoint.method.upper()} {url} returned '
+                f'{response.status_code}.'
+            )
+        return response, elapsed
+
+    def _measure(self, endpoint):
+        """Run an endpoint, return its latencies, queries & memory."""
+        # Every endpoint starts with an empty cache, as after a deploy.
+        cache.clear()
+        for _ in range(self.options['warmup']):
+            self._send(endpoint)
+
+        queries = []
+        latencies = []
+        cache_hits = 0
+        for _ in range(self.options['requests']):
+            count = [0]
+
+            def counter(execute, sql, params, many, context):
+                count[0] += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(counter):
+                response, elapsed = self._send(endpoint)
+            latencies.append(elapsed)
+            queries.append(count[0])
+            cache_hits += response.get('X-Cache') == 'HIT'
+
+        # Memory is measured apart, tracing slows every allocation down.
+        tracemalloc.start()
+        self._send(endpoint)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        ordered = sorted(latencies)
+        return {
+            'method': endpoint.method.upper(),
+            'route': endpoint.route,
+            'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+            'requests_per_second': round(len(ordered) / sum(ordered), 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'cache_hits': cache_hits,
+            'peak_memory_kib': peak // 1024,
+        }
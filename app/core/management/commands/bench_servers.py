@@ -0,0 +1,448 @@
+"""
+Django command to compare the WSGI & ASGI servers under load.
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+import django
+from core.management.commands.bench_api import WORDS, percentile
+from core.models import Ingredient, Recipe, Tag
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from user import tokens
+
+EMAIL = 'bench-servers@example.com'
+
+
+def _process_tree_rss(pid):
+    """
+    Return the resident memory of a process & its children, in bytes, or
+    None where there's no '/proc' (e.g. macOS).
+    """
+    if not os.path.isdir('/proc'):
+        return None
+
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as file:
+                # The name of the command, in parentheses, can hold spaces.
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+
+    rss = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        pids.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/statm') as file:
+                rss += int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            continue
+    return rss
+
+
+def _free_port():
+    """Return a TCP port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _read_response(reader):
+    """
+    Read an HTTP/1.1 response, return (status, whether the connection can
+    be used again).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('The server closed the connection.')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Client:
+    """A client sending requests one after the other, on one connection."""
+
+    def __init__(self, port, requests):
+        self.port = port
+        # The raw requests to send, in turn.
+        self.requests = requests
+        self.reader = None
+        self.writer = None
+
+    async def request(self, index):
+        """Send a request, return its status code."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                '127.0.0.1',
+                self.port,
+            )
+        try:
+            self.writer.write(self.requests[index % len(self.requests)])
+            await self.writer.drain()
+            status, keep_alive = await _read_response(self.reader)
+        except BaseException:
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the servers of 'scripts/run.sh': uwsgi with
+    4 workers (WSGI, the sync views) against uvicorn with 4 workers (ASGI,
+    the async views of 'core.asynchronous').
+
+    Each server is started on the configured database, where a user with
+    recipes, tags & ingredients is created for the run (& deleted at the
+    end), so the database must be migrated. Then, for every concurrency
+    level, that many clients, each with a connection of its own, request
+    the recipe, tag & ingredient reads in turn for '--duration' seconds.
+
+    The report is JSON, with the p50, p95, p99 & max latency, the
+    throughput & the errors of each level, and the memory of the server's
+    processes: idle, at the peak of each level, & what each connection
+    adds to it, busy or idle ('--idle' connections kept open after a
+    request).
+    """
+    help = 'Compare uwsgi & uvicorn under load, report the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='uwsgi,asgi',
+                            help='Comma separated servers to run.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--concurrency', default='1,16,64,256',
+                            help='Comma separated numbers of clients.')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds per concurrency level.')
+        parser.add_argument('--warmup', type=float, default=2,
+                            help='Untimed seconds before the levels.')
+        parser.add_argument('--idle', type=int, default=200,
+                            help='Idle keep-alive connections to open, '
+                                 'for the memory per connection.')
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON to this file.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.options = options
+        servers = options['servers'].split(',')
+        unknown = set(servers) - {'uwsgi', 'asgi'}
+        if unknown:
+            raise CommandError(f'Unknown servers: {", ".join(unknown)}')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        get_user_model().objects.filter(email=EMAIL).delete()
+        user = self._create_dataset()
+        try:
+            requests = self._requests(user)
+            report = {
+                'environment': {
+                    'database': connection.vendor,
+                    'django': django.get_version(),
+                    'python': platform.python_version(),
+                    'cpus': os.cpu_count(),
+                },
+                'recipes': options['recipes'],
+                'duration': options['duration'],
+                'workers': options['workers'],
+                'servers': {
+                    server: self._bench(server, requests, levels)
+                    for server in servers
+                },
+            }
+        finally:
+            user.delete()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _create_dataset(self):
+        """Create the user of the run, with recipes, tags & ingredients."""
+        rng = random.Random(self.options['seed'])
+        user = get_user_model().objects.create_user(EMAIL, None)
+        tags = Tag.objects.bulk_create([
+            Tag(user=user, name=f'Tag {i}') for i in range(20)
+        ])
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(user=user, name=f'Ingredient {i}') for i in range(30)
+        ])
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                description=' '.join(rng.choices(WORDS, k=20)),
+                time_minutes=rng.randint(5, 180),
+                price=Decimal(rng.randint(100, 9999)) / 100,
+            )
+            for _ in range(self.options['recipes'])
+        ], batch_size=1000)
+        # 'bulk_create' doesn't set the ids on every database.
+        tags = list(Tag.objects.filter(user=user))
+        ingredients = list(Ingredient.objects.filter(user=user))
+        for recipe in Recipe.objects.filter(user=user):
+            recipe.tags.set(rng.sample(tags, 3))
+            recipe.ingredients.set(rng.sample(ingredients, 5))
+        return user
+
+    def _requests(self, user):
+        """Return the raw requests of the clients, sent in turn."""
+        # A token that outlives the run.
+        with override_settings(ACCESS_TOKEN_LIFETIME=24 * 60 * 60):
+            access = tokens.issue_tokens(user)['access']
+        recipe_ids = list(Recipe.objects.filter(
+            user=user,
+        ).values_list('id', flat=True))
+        paths = [
+            '/api/recipe/recipes/',
+            '/api/recipe/tags/',
+            '/api/recipe/ingredients/',
+        ] + [
+            f'/api/recipe/recipes/{recipe_id}/'
+            for recipe_id in recipe_ids[:20]
+        ]
+        return [
+            (
+                f'GET {path} HTTP/1.1\r\n'
+                f'Host: 127.0.0.1\r\n'
+                f'Authorization: Bearer {access}\r\n'
+                f'Accept: application/json\r\n'
+                f'\r\n'
+            ).encode()
+            for path in paths
+        ]
+
+    def _command(self, server, port):
+        """Return the command line starting a server, like 'run.sh'."""
+        workers = str(self.options['workers'])
+        if server == 'uwsgi':
+            executable = shutil.which('uwsgi')
+            if executable is None:
+                raise CommandError('uwsgi is not installed.')
+            # '--http' instead of '--socket', as nginx isn't in front.
+            return [
+                executable, '--http', f'127.0.0.1:{port}',
+                '--http-keepalive', '--workers', workers, '--master',
+                '--enable-threads', '--module', 'app.wsgi', '--die-on-term',
+                '--disable-logging',
+            ]
+        return [
+            sys.executable, '-m', 'uvicorn', 'app.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', workers, '--no-access-log',
+        ]
+
+    def _bench(self, server, requests, levels):
+        """Start a server, run the levels against it, return its report."""
+        port = _free_port()
+        command = self._command(server, port)
+        env = {**os.environ, 'ASYNC_VIEWS': str(int(server == 'asgi'))}
+        if '127.0.0.1' not in settings.ALLOWED_HOSTS:
+            env['ALLOWED_HOSTS'] = ','.join(
+                settings.ALLOWED_HOSTS + ['127.0.0.1'],
+            )
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        try:
+            return asyncio.run(
+                self._run(process, port, requests, levels),
+            )
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+    async def _run(self, process, port, requests, levels):
+        """Wait for the server, warm it up & run the levels."""
+        client = Client(port, requests)
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'{process.args[0]} exited with {process.returncode}.'
+                )
+            try:
+                status = await client.request(0)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError('The server did not start.')
+                await asyncio.sleep(0.2)
+        client.close()
+        if status != 200:
+            raise CommandError(f'The server responded {status}.')
+
+        # The workers load the code & open their connections.
+        await self._level(port, requests, self.options['workers'] * 2,
+                          self.options['warmup'], process.pid)
+        report = {
+            'command': ' '.join(process.args),
+            'idle_rss_bytes': _process_tree_rss(process.pid),
+            'levels': {},
+        }
+        for concurrency in levels:
+            report['levels'][str(concurrency)] = await self._level(
+                port,
+                requests,
+                concurrency,
+                self.options['duration'],
+                process.pid,
+            )
+            rss = report['levels'][str(concurrency)]['peak_rss_bytes']
+            if rss is not None and report['idle_rss_bytes'] is not None:
+                report['levels'][str(concurrency)]['rss_per_connection'] = (
+                    round((rss - report['idle_rss_bytes']) / concurrency)
+                )
+        report['idle_connections'] = await self._idle(
+            port,
+            requests,
+            process.pid,
+        )
+        return report
+
+    async def _idle(self, port, requests, pid):
+        """
+        Open connections that each send a request then stay idle, return
+        the memory they take, per connection.
+        """
+        count = self.options['idle']
+        before = _process_tree_rss(pid)
+        clients = [Client(port, requests) for _ in range(count)]
+        statuses = await asyncio.gather(
+            *(client.request(0) for client in clients),
+            return_exceptions=True,
+        )
+        # Give the server the time to settle, e.g. to free the buffers.
+        await asyncio.sleep(1)
+        after = _process_tree_rss(pid)
+        for client in clients:
+            client.close()
+
+        stats = {
+            'connections': count,
+            'errors': sum(
+                isinstance(status, Exception) for status in statuses
+            ),
+        }
+        if before is not None and count:
+            stats['rss_per_connection'] = round((after - before) / count)
+        return stats
+
+    async def _level(self, port, requests, concurrency, duration, pid):
+        """Run that many clients for that long, return the stats."""
+        latencies = []
+        errors = 0
+        statuses = {}
+        peak_rss = 0
+        deadline = time.monotonic() + duration
+
+        async def run_client(offset):
+            client = Client(port, requests)
+            nonlocal errors
+            index = offset
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    status = await client.request(index)
+                except (OSError, EOFError, ValueError):
+                    errors += 1
+                    await asyncio.sleep(0.05)
+                    continue
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                index += 1
+            client.close()
+
+        async def sample_rss():
+            nonlocal peak_rss
+            while time.monotonic() < deadline:
+                peak_rss = max(peak_rss, _process_tree_rss(pid) or 0)
+                await asyncio.sleep(0.5)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            sample_rss(),
+            *(run_client(offset) for offset in range(concurrency)),
+        )
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        stats = {
+            'requests': len(latencies),
+            'errors': errors,
+            'statuses': {
+                str(status): count for status, count in statuses.items()
+            },
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'peak_rss_bytes': peak_rss or None,
+        }
+        if latencies:
+            stats.update({
+                f'p{percent}_ms': round(
+                    percentile(latencies, percent) * 1000,
+                    3,
+                )
+                for percent in (50, 95, 99)
+            })
+            stats['max_ms'] = round(latencies[-1] * 1000, 3)
+        return stats
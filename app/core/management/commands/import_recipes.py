@@ -0,0 +1,152 @@
+"""
+Django command to import recipes from NDJSON or CSV files.
+"""
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipe.imports import FORMATS, RecipeImporter, read_records
+from rest_framework.exceptions import ValidationError
+
+
+class Command(BaseCommand):
+    """
+    Django command to import recipes in the format of the exports.
+
+    The recipes are validated like in the API, and written in batches
+    (see 'recipe.imports.RecipeImporter'), each in its own transaction.
+    After every batch, the number of records done is saved to a checkpoint
+    file, so an import that was stopped continues where it left off when
+    started again. Invalid records are reported & skipped.
+    """
+    help = 'Import recipes from NDJSON or CSV files in the export format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='The files to import.')
+        parser.add_argument(
+            '--user',
+            help='The email of the owner of the recipes without a "user".',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(set(FORMATS.values())),
+            help='The format of the files, by default from the extension.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='The number of recipes written in one transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint-dir',
+            help='Where to keep the checkpoints, by default next to the '
+                 'files.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoints & import the files from the start.',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help="Use inserts instead of PostgreSQL's COPY.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        default_user = None
+        if options['user']:
+            default_user = get_user_model().objects.filter(
+                email=options['user'],
+            ).first()
+            if default_user is None:
+                raise CommandError(f'No user with email {options["user"]}.')
+
+        importer = RecipeImporter(default_user, not options['no_copy'])
+        for path in options['paths']:
+            file_format = options['format'] or self._format(path)
+            self._import(importer, path, file_format, options)
+
+    def _format(self, path):
+        """Return the format of a file from its extension."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise CommandError(
+                f'Unknown format of {path}, use --format to give it.'
+            )
+        return FORMATS[extension]
+
+    def _checkpoint_path(self, path, options):
+        """Return the path of the checkpoint of a file."""
+        directory = options['checkpoint_dir'] or os.path.dirname(path)
+        return os.path.join(
+            directory,
+            f'{os.path.basename(path)}.checkpoint',
+        )
+
+    def _read_checkpoint(self, checkpoint):
+        """Return the number of records already done, from a checkpoint."""
+        try:
+            with open(checkpoint) as file:
+                return json.load(file)['records']
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, checkpoint, records):
+        """Save the number of records done, replacing the file at once."""
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'records': records}, file)
+        os.replace(temporary, checkpoint)
+
+    def _import(self, importer, path, file_format, options):
+        """Import the recipes of a file, from its checkpoint on."""
+        checkpoint = self._checkpoint_path(path, options)
+        done = 0 if options['restart'] else self._read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'{path}: resuming after {done} records.')
+
+        start = time.monotonic()
+        last = done
+        imported = invalid = 0
+        batch = []
+        # The records before the checkpoint are read again to skip them,
+        # a line number can't be found without reading the lines before.
+        for number, record in enumerate(read_records(path, file_format), 1):
+            if number <= done:
+                continue
+            last = number
+            try:
+                batch.append(importer.validate(record))
+            except ValidationError as exc:
+                invalid += 1
+                self.stderr.write(f'{path}: record {number}: {exc.detail}')
+            if len(batch) == options['batch_size']:
+                importer.write(batch)
+                imported += len(batch)
+                batch = []
+                self._write_checkpoint(checkpoint, number)
+                self._report(path, number - done, imported, invalid, start)
+
+        if last > done:
+            importer.write(batch)
+            imported += len(batch)
+            self._write_checkpoint(checkpoint, last)
+        if batch:
+            self._report(path, last - done, imported, invalid, start)
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: imported {imported} recipes, {invalid} invalid.'
+        ))
+
+    def _report(self, path, records, imported, invalid, start):
+        """Write the progress & the throughput of the import."""
+        elapsed = time.monotonic() - start
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{path}: {records} records read, {imported} imported, '
+            f'{invalid} invalid, {rate:.0f} recipes/s'
+        )
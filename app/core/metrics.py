@@ -0,0 +1,507 @@
+"""
+Request metrics, in the text format of Prometheus.
+
+'MetricsMiddleware' records, per view & method, the number of requests by
+status code, histograms of their latency & response size, and the number
+& time of their SQL queries. The stats of the database connections (see
+'core.db.pool') are exported too.
+
+Each worker adds up its own numbers in memory, and every
+'settings.METRICS_FLUSH_INTERVAL' seconds saves them to a file of its own
+in 'settings.METRICS_DIR', named after its process id (like the
+multiprocess mode of 'prometheus_client'), so no two workers ever write
+the same file & nothing has to be counted atomically. '/api/metrics/'
+adds up the files of the host's workers. A worker that went away has its
+counters added to the 'archive' file & its file deleted, so the totals
+never go down, while its gauges are dropped.
+"""
+import asyncio
+import contextvars
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from core.db import pool
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+WORKER_PREFIX = 'worker-'
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = 'archive.lock'
+
+# The upper bounds of the buckets of the histograms, Prometheus' defaults
+# for the latency.
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf,
+)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, math.inf,
+)
+
+# The type & the help of the metrics, by name.
+METRICS = {
+    'http_requests_total': (
+        'counter',
+        'Requests, by view, method & status code.',
+    ),
+    'http_request_duration_seconds': (
+        'histogram',
+        'Time to respond to the requests, by view & method.',
+    ),
+    'http_response_size_bytes': (
+        'histogram',
+        'Size of the response bodies, by view & method.',
+    ),
+    'db_queries_total': (
+        'counter',
+        'SQL queries made by the requests, by view & method.',
+    ),
+    'db_query_duration_seconds_total': (
+        'counter',
+        'Time spent in the SQL queries of the requests, by view & method.',
+    ),
+    'db_reconnects_total': (
+        'counter',
+        'Connections found broken by a health check & opened again.',
+    ),
+    'db_pool_connects_total': (
+        'counter',
+        'Connections opened by the pools.',
+    ),
+    'db_pool_checkouts_total': (
+        'counter',
+        'Connections taken from the pools.',
+    ),
+    'db_pool_waits_total': (
+        'counter',
+        'Checkouts that waited for a connection to be given back.',
+    ),
+    'db_pool_wait_seconds_total': (
+        'counter',
+        'Time spent waiting for a connection to be given back.',
+    ),
+    'db_pool_timeouts_total': (
+        'counter',
+        'Checkouts that gave up waiting for a connection.',
+    ),
+    'db_pool_idle_closed_total': (
+        'counter',
+        'Connections closed after being idle in a pool for too long.',
+    ),
+    'db_pool_size': (
+        'gauge',
+        'Most connections the pools of the live workers can hold.',
+    ),
+    'db_pool_connections': (
+        'gauge',
+        'Connections of the pools of the live workers, by state.',
+    ),
+}
+
+# The metrics of the connection stats of 'core.db.pool', by stat.
+POOL_COUNTERS = {
+    'reconnects': 'db_reconnects_total',
+    'connects': 'db_pool_connects_total',
+    'checkouts': 'db_pool_checkouts_total',
+    'waits': 'db_pool_waits_total',
+    'wait_seconds': 'db_pool_wait_seconds_total',
+    'timeouts': 'db_pool_timeouts_total',
+    'idle_closed': 'db_pool_idle_closed_total',
+}
+
+_lock = threading.Lock()
+# The numbers of this worker, by (metric name, labels).
+_values = defaultdict(float)
+_slot = None
+_pid = None
+_flushed_at = 0
+
+
+def _observe(name, labels, buckets, value):
+    """Count a value in a histogram."""
+    for bound in buckets:
+        if value <= bound:
+            _values[(f'{name}_bucket', labels + (('le', bound),))] += 1
+    _values[(f'{name}_sum', labels)] += value
+    _values[(f'{name}_count', labels)] += 1
+
+
+def _get_slot():
+    """Return the name of this worker's file, '<pid>-<random>'."""
+    global _slot, _pid
+    if _pid != os.getpid():
+        # A forked worker starts with the numbers of its parent.
+        _values.clear()
+        _slot = None
+        _pid = os.getpid()
+    if _slot is None:
+        # The random part keeps a new process that got the id of a dead
+        # one from taking over its file before it's archived.
+        _slot = f'{_pid}-{uuid.uuid4().hex[:8]}'
+    return _slot
+
+
+def _path(name):
+    """Return the path of a file of the metrics directory."""
+    return os.path.join(settings.METRICS_DIR, name)
+
+
+def _write(name, data):
+    """Replace a file with the data, so it's never read half written."""
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    temporary = _path(f'.{name}.{os.getpid()}.tmp')
+    with open(temporary, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary, _path(name))
+
+
+def _read(name, default=None):
+    """Return the data of a file, or the default if there's none."""
+    try:
+        with open(_path(name)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return default
+
+
+def _dump(values):
+    """Return the numbers as a list, for JSON."""
+    return [[name, labels, value] for (name, labels), value in values.items()]
+
+
+def _load(rows):
+    """Return the numbers of a list made by '_dump()'."""
+    return {
+        (name, tuple(tuple(label) for label in labels)): value
+        for name, labels, value in rows
+    }
+
+
+def _is_alive(pid):
+    """Return True if the process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user.
+        return True
+    return True
+
+
+def _workers():
+    """Return the names of the worker files, without the prefix."""
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except FileNotFoundError:
+        return []
+    return [
+        name[len(WORKER_PREFIX):-len('.json')]
+        for name in names
+        if name.startswith(WORKER_PREFIX) and name.endswith('.json')
+    ]
+
+
+def _archive_dead_workers():
+    """
+    Add the counters of the workers that went away to the archive &
+    delete their files.
+
+    The names of the files archived are saved with the counters & only
+    forgotten once the files are gone, so a crash in between can't count
+    a worker twice.
+    """
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with open(_path(LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = _read(ARCHIVE_FILE, {'counters': [], 'archived': []})
+        counters = defaultdict(float, _load(archive['counters']))
+        archived = set(archive['archived'])
+        workers = set(_workers())
+        dead = {
+            slot for slot in workers - archived
+            if not _is_alive(int(slot.split('-')[0]))
+        }
+        if not dead and not archived:
+            return
+
+        for slot in dead:
+            data = _read(f'{WORKER_PREFIX}{slot}.json')
+            for key, value in _load(data['counters']).items():
+                counters[key] += value
+        archived = (archived & workers) | dead
+        _write(ARCHIVE_FILE, {
+            'counters': _dump(counters),
+            'archived': sorted(archived),
+        })
+        for slot in archived:
+            os.remove(_path(f'{WORKER_PREFIX}{slot}.json'))
+        _write(ARCHIVE_FILE, {'counters': _dump(counters), 'archived': []})
+
+
+def _pool_values():
+    """
+    Return the (counters, gauges) of the database connections of this
+    worker, from 'core.db.pool'.
+    """
+    counters = {}
+    gauges = {}
+    for alias, stats in pool.get_stats().items():
+        labels = (('database', alias),)
+        for stat, metric in POOL_COUNTERS.items():
+            if stat in stats:
+                counters[(metric, labels)] = stats[stat]
+        if 'size' in stats:
+            gauges[('db_pool_size', labels)] = stats['size']
+            for state in ('idle', 'in_use'):
+                gauges[(
+                    'db_pool_connections',
+                    labels + (('state', state),),
+                )] = stats[state]
+
+    return counters, gauges
+
+
+def flush():
+    """Save the numbers of this worker to its file."""
+    global _flushed_at
+    counters, gauges = _pool_values()
+    with _lock:
+        slot = _get_slot()
+        values = {**_values, **counters}
+        _flushed_at = time.monotonic()
+    _write(f'{WORKER_PREFIX}{slot}.json', {
+        'counters': _dump(values),
+        'gauges': _dump(gauges),
+    })
+
+
+def record(view, method, status, duration, size, queries, query_duration):
+    """Record a request, & flush the numbers if it's time to."""
+    labels = (('view', view), ('method', method))
+    with _lock:
+        _get_slot()
+        _values[(
+            'http_requests_total',
+            labels + (('status', str(status)),),
+        )] += 1
+        _observe('http_request_duration_seconds', labels, DURATION_BUCKETS,
+                 duration)
+        _observe('http_response_size_bytes', labels, SIZE_BUCKETS, size)
+        _values[('db_queries_total', labels)] += queries
+        _values[('db_query_duration_seconds_total', labels)] += (
+            query_duration
+        )
+        due = time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    if due:
+        flush()
+
+
+def collect():
+    """Return the numbers of all the workers of the host, added up."""
+    flush()
+    _archive_dead_workers()
+    archive = _read(ARCHIVE_FILE, {'counters': []})
+    totals = defaultdict(float, _load(archive['counters']))
+    for slot in _workers():
+        data = _read(f'{WORKER_PREFIX}{slot}.json')
+        if data is None:
+            # Archived meanwhile.
+            continue
+        for key, value in _load(data['counters'] + data['gauges']).items():
+            totals[key] += value
+
+    return totals
+
+
+def _format_value(value):
+    """Return a number as Prometheus writes it."""
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    """Return the labels as '{name="value",...}'."""
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(
+            name,
+            (value if isinstance(value, str) else _format_value(value))
+            .replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for name, value in labels
+    ))
+
+
+def render(values):
+    """Return the numbers in the text format of Prometheus."""
+    lines = []
+    for metric, (metric_type, description) in METRICS.items():
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        names = {metric}
+        if metric_type == 'histogram':
+            names = {f'{metric}_bucket', f'{metric}_sum', f'{metric}_count'}
+        series = sorted(key for key in values if key[0] in names)
+        for name, labels in series:
+            lines.append(
+                f'{name}{_format_labels(labels)} '
+                f'{_format_value(values[(name, labels)])}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryCounter:
+    """
+    Count the SQL queries of a request & the time they take.
+
+    The counter of the current request is in a context variable, read by
+    a wrapper of every connection, so the queries made in other threads
+    for the request (see 'core.asynchronous') are counted too.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+        self._previous = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - start
+
+    def start(self):
+        """Count the queries of all the databases from now on."""
+        for connection in connections.all():
+            _install_query_counter(connection)
+        self._previous = _query_counter.get()
+        _query_counter.set(self)
+
+    def stop(self):
+        """Stop counting the queries."""
+        _query_counter.set(self._previous)
+
+
+_query_counter = contextvars.ContextVar('query_counter', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    """Count a query in the counter of the current request, if any."""
+    counter = _query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_counter(connection, **kwargs):
+    """Wrap the queries of a connection (of any thread) with the counter."""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class MetricsMiddleware:
+    """
+    Record the metrics of every request (see the module's docstring).
+
+    A streamed response is recorded once it has been sent, with its
+    queries & its time until then, since it's only done at that point.
+
+    It works under WSGI & ASGI: with async views, the requests don't
+    switch to a thread just for this middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the middleware as a coroutine function, so Django awaits
+            # it, like its 'MiddlewareMixin' does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        counter.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            counter.stop()
+        return self._process_response(request, response, counter, start)
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        counter.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            counter.stop()
+        return self._process_response(request, response, counter, start)
+
+    def _process_response(self, request, response, counter, start):
+        """Record the request, once it's been streamed if it is."""
+        if response.streaming:
+            response.streaming_content = self._stream(
+                request,
+                response,
+                response.streaming_content,
+                counter,
+                start,
+            )
+        else:
+            self._record(
+                request,
+                response,
+                counter,
+                start,
+                len(response.content),
+            )
+        return response
+
+    def _stream(self, request, response, content, counter, start):
+        """Yield the streamed content, & record the request at the end."""
+        size = 0
+        counter.start()
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            counter.stop()
+            self._record(request, response, counter, start, size)
+
+    def _record(self, request, response, counter, start, size):
+        """Record the metrics of a request."""
+        match = request.resolver_match
+        record(
+            # The name of the view, not the path, so all the recipes
+            # share the same 'recipe:recipe-detail' series.
+            match.view_name if match else '<unresolved>',
+            request.method,
+            response.status_code,
+            time.perf_counter() - start,
+            size,
+            counter.queries,
+            counter.duration,
+        )
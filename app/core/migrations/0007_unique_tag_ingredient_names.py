@@ -0,0 +1,66 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """
+    Merge tags & ingredients that share a name for the same user.
+
+    The recipes pointing at a duplicate are moved over to the oldest
+    row of the group before the duplicates are deleted, so the unique
+    constraint below can be added without losing any recipe links.
+    """
+    Recipe = apps.get_model('core', 'Recipe')
+    relations = [
+        (apps.get_model('core', 'Tag'), Recipe.tags.through, 'tag_id'),
+        (
+            apps.get_model('core', 'Ingredient'),
+            Recipe.ingredients.through,
+            'ingredient_id',
+        ),
+    ]
+    for model, through, column in relations:
+        groups = model.objects.values('user_id', 'name').annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+        ).filter(total__gt=1)
+        for group in groups:
+            duplicate_ids = list(
+                model.objects.filter(
+                    user_id=group['user_id'],
+                    name=group['name'],
+                ).exclude(id=group['keep_id']).values_list('id', flat=True)
+            )
+            links = through.objects.filter(**{f'{column}__in': duplicate_ids})
+            recipe_ids = set(links.values_list('recipe_id', flat=True))
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{column: group['keep_id']})
+                    for recipe_id in recipe_ids
+                ],
+                ignore_conflicts=True,
+            )
+            links.delete()
+            model.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_names,
+            migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+    ]
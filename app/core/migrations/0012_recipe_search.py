@@ -0,0 +1,135 @@
+# Generated by Django 4.0.10 on 2026-10-17 04:22
+
+import django.contrib.postgres.search
+from django.db import migrations, models, transaction
+
+# The number of recipes indexed in each transaction.
+BATCH_SIZE = 1000
+
+POSTGRES_BACKFILL = """
+    UPDATE core_recipe SET search_vector =
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(tag.name, ' ')
+            FROM core_recipe_tags link
+            JOIN core_tag tag ON tag.id = link.tag_id
+            WHERE link.recipe_id = core_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM core_recipe_ingredients link
+            JOIN core_ingredient ingredient
+                ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = core_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('english', description), 'C')
+    WHERE id > %s AND id <= %s
+"""
+
+# The index is built after the backfill, without locking the table
+# against writes. An index left invalid by an interrupted run is built
+# again.
+POSTGRES_INDEX = [
+    'DROP INDEX CONCURRENTLY IF EXISTS recipe_search_vector_idx',
+    'CREATE INDEX CONCURRENTLY recipe_search_vector_idx ON core_recipe '
+    'USING gin (search_vector)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX CONCURRENTLY IF EXISTS recipe_search_vector_idx',
+]
+
+SQLITE_CREATE = """
+    CREATE VIRTUAL TABLE core_recipe_search USING fts5(
+        title, description, tags, ingredients,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+"""
+
+SQLITE_BACKFILL = """
+    INSERT INTO core_recipe_search (
+        rowid, title, description, tags, ingredients
+    )
+    SELECT
+        recipe.id,
+        recipe.title,
+        recipe.description,
+        coalesce((
+            SELECT group_concat(tag.name, ' ')
+            FROM core_recipe_tags link
+            JOIN core_tag tag ON tag.id = link.tag_id
+            WHERE link.recipe_id = recipe.id
+        ), ''),
+        coalesce((
+            SELECT group_concat(ingredient.name, ' ')
+            FROM core_recipe_ingredients link
+            JOIN core_ingredient ingredient
+                ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = recipe.id
+        ), '')
+    FROM core_recipe recipe
+    WHERE recipe.id > %s AND recipe.id <= %s
+"""
+
+SQLITE_BACKWARD = ['DROP TABLE core_recipe_search']
+
+
+def _backfill(apps, schema_editor, statement):
+    """
+    Run the backfill statement over the recipes, a range of ids at a
+    time, each in its own transaction, so the table isn't locked for the
+    whole migration.
+    """
+    last_id = apps.get_model('core', 'Recipe').objects.aggregate(
+        last_id=models.Max('id'),
+    )['last_id'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        with transaction.atomic():
+            schema_editor.execute(statement, (start, start + BATCH_SIZE))
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Create & fill the full-text search index of the recipes.
+
+    PostgreSQL gets a GIN index over the 'search_vector' column, SQLite
+    (used for local development) gets an FTS5 table instead. See
+    'recipe.search' for how they're kept up to date.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _backfill(apps, schema_editor, POSTGRES_BACKFILL)
+        for statement in POSTGRES_INDEX:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        _backfill(apps, schema_editor, SQLITE_BACKFILL)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the full-text search index of the recipes."""
+    statements = {
+        'postgresql': POSTGRES_BACKWARD,
+        'sqlite': SQLITE_BACKWARD,
+    }
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own, & PostgreSQL can't build an index
+    # concurrently in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
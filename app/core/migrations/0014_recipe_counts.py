@@ -0,0 +1,60 @@
+# Generated by Django 4.0.10 on 2026-10-17 05:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    """Count the recipes of the existing tags & ingredients."""
+    Recipe = apps.get_model('core', 'Recipe')
+    relations = [
+        (apps.get_model('core', 'Tag'), Recipe.tags.through, 'tag'),
+        (
+            apps.get_model('core', 'Ingredient'),
+            Recipe.ingredients.through,
+            'ingredient',
+        ),
+    ]
+    for model, through, field in relations:
+        links = through.objects.filter(**{field: OuterRef('pk')}).values(
+            field,
+        ).annotate(count=Count('id')).values('count')
+        model.objects.update(recipe_count=Coalesce(Subquery(links), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(condition=models.Q(('recipe_count__gt', 0)), fields=['user', '-name'], name='ingredient_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='ingredient_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(condition=models.Q(('recipe_count__gt', 0)), fields=['user', '-name'], name='tag_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='tag_popularity_idx'),
+        ),
+    ]
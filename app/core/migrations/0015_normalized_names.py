@@ -0,0 +1,55 @@
+# Generated by Django 4.0.10 on 2026-10-17 05:43
+
+import core.models
+from django.db import migrations, transaction
+
+# The number of rows normalized in each transaction.
+BATCH_SIZE = 1000
+
+
+def normalize_names(apps, schema_editor):
+    """
+    Set the normalized names of the existing tags & ingredients, a batch
+    at a time, so the tables aren't locked for the whole migration.
+    """
+    for name in ('Tag', 'Ingredient'):
+        model = apps.get_model('core', name)
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = list(model.objects.filter(id__gt=last_id).order_by(
+                    'id',
+                ).only('id', 'name')[:BATCH_SIZE])
+                if not rows:
+                    break
+                for row in rows:
+                    row.normalized_name = core.models.normalize_name(
+                        row.name,
+                    )
+                model.objects.bulk_update(rows, ['normalized_name'])
+            last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_name',
+            field=core.models.NormalizedNameField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=core.models.NormalizedNameField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(normalize_names, migrations.RunPython.noop),
+    ]
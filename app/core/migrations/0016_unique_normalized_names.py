@@ -0,0 +1,176 @@
+# Generated by Django 4.0.10 on 2026-10-17 05:43
+
+import functools
+import operator
+
+from django.db import migrations, models, transaction
+from django.db.models.functions import Coalesce
+
+# The number of groups merged in each transaction.
+BATCH_SIZE = 500
+
+# The constraints added, by model name.
+CONSTRAINTS = {
+    'ingredient': models.UniqueConstraint(fields=('user', 'normalized_name'), name='unique_ingredient_normalized_name_per_user'),
+    'tag': models.UniqueConstraint(fields=('user', 'normalized_name'), name='unique_tag_normalized_name_per_user'),
+}
+
+
+def merge_groups(apps, model, groups):
+    """
+    Merge the groups of duplicates, (user id, normalized name) pairs, into
+    the oldest row of each, in one transaction.
+
+    Like 'recipe.duplicates', which keeps changing with the app while a
+    migration can't, so it's copied here. The model signals aren't sent
+    to the historical models: the counts of the kept rows, & the counts
+    of the tags in the stats, are updated here.
+    """
+    field = model._meta.model_name
+    column = f'{field}_id'
+    through = apps.get_model('core', 'Recipe')._meta.get_field(
+        f'{field}s',
+    ).remote_field.through
+    with transaction.atomic():
+        rows = model.objects.select_for_update().filter(
+            functools.reduce(operator.or_, (
+                models.Q(user_id=user_id, normalized_name=name)
+                for user_id, name in groups
+            )),
+        ).order_by('id').values_list('id', 'user_id', 'normalized_name')
+        members = {}
+        for pk, user_id, name in rows:
+            members.setdefault((user_id, name), []).append(pk)
+        members = [pks for pks in members.values() if len(pks) > 1]
+        if not members:
+            return
+
+        duplicate_ids = [pk for pks in members for pk in pks[1:]]
+        kept_id = models.Case(
+            *[models.When(**{f'{column}__in': pks}, then=models.Value(pks[0]))
+              for pks in members],
+            output_field=models.IntegerField(),
+        )
+        links = through.objects.filter(**{f'{column}__in': duplicate_ids})
+        # A recipe linked to several rows of a group keeps the link to the
+        # oldest one only.
+        links.alias(kept_id=kept_id).filter(models.Exists(
+            through.objects.alias(kept_id=kept_id).filter(
+                recipe_id=models.OuterRef('recipe_id'),
+                kept_id=models.OuterRef('kept_id'),
+                **{f'{column}__lt': models.OuterRef(column)},
+            )
+        )).delete()
+        links.update(**{column: kept_id})
+        model.objects.filter(pk__in=duplicate_ids).delete()
+
+        kept = model.objects.filter(pk__in=[pks[0] for pks in members])
+        kept.update(recipe_count=Coalesce(
+            models.Subquery(
+                through.objects.filter(**{column: models.OuterRef('pk')})
+                .values(column).annotate(count=models.Count('id'))
+                .values('count'),
+            ),
+            0,
+        ))
+        if field != 'tag':
+            return
+
+        counts = {}
+        for pk, user_id, recipe_count in kept.values_list(
+            'id',
+            'user_id',
+            'recipe_count',
+        ):
+            counts.setdefault(user_id, {})[str(pk)] = recipe_count
+        for stats in apps.get_model('core', 'RecipeStats').objects.filter(
+            user_id__in=counts,
+        ).select_for_update():
+            for pk in duplicate_ids:
+                stats.tag_counts.pop(str(pk), None)
+            stats.tag_counts.update({
+                pk: number for pk, number in counts[stats.user_id].items()
+                if number
+            })
+            stats.save(update_fields=['tag_counts'])
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merge the tags & ingredients left with the same normalized name, in
+    batches like 'manage.py merge_duplicates' (which can be run before
+    this migration, while the app is up).
+    """
+    for name in ('Tag', 'Ingredient'):
+        model = apps.get_model('core', name)
+        groups = list(model.objects.values(
+            'user_id',
+            'normalized_name',
+        ).annotate(total=models.Count('id')).filter(total__gt=1).order_by(
+            'user_id',
+            'normalized_name',
+        ).values_list('user_id', 'normalized_name'))
+        for start in range(0, len(groups), BATCH_SIZE):
+            merge_groups(apps, model, groups[start:start + BATCH_SIZE])
+
+
+def add_constraints(apps, schema_editor):
+    """
+    Add the unique constraints. On PostgreSQL, their index is built first
+    without locking the table against writes, & then used by the
+    constraint, so the table is only locked for a moment.
+    """
+    quote = schema_editor.quote_name
+    for model_name, constraint in CONSTRAINTS.items():
+        model = apps.get_model('core', model_name)
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.execute(constraint.create_sql(model, schema_editor))
+            continue
+
+        table = quote(model._meta.db_table)
+        name = quote(constraint.name)
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column)
+            for field in constraint.fields
+        )
+        # An index left invalid by an interrupted run is built again.
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({columns})'
+        )
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}'
+        )
+
+
+def remove_constraints(apps, schema_editor):
+    """Remove the unique constraints."""
+    for model_name, constraint in CONSTRAINTS.items():
+        model = apps.get_model('core', model_name)
+        schema_editor.execute(constraint.remove_sql(model, schema_editor))
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own, & PostgreSQL can't build an index
+    # concurrently in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_normalized_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_constraints, remove_constraints),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name=model_name,
+                    constraint=constraint,
+                )
+                for model_name, constraint in CONSTRAINTS.items()
+            ],
+        ),
+    ]
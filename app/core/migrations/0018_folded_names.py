@@ -0,0 +1,68 @@
+# Generated by Django 4.0.10 on 2026-10-17 07:05
+
+import unicodedata
+
+import core.models
+from django.db import migrations, models, transaction
+
+# The number of rows folded in each transaction.
+BATCH_SIZE = 1000
+
+
+def fold_name(name):
+    """Like 'core.models.fold_name()', as it was for this migration."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(
+        char for char in decomposed if not unicodedata.combining(char)
+    ).casefold()
+
+
+def fold_names(apps, schema_editor):
+    """
+    Set the folded names of the existing tags & ingredients, a batch at a
+    time, so the tables aren't locked for the whole migration.
+    """
+    for name in ('Tag', 'Ingredient'):
+        model = apps.get_model('core', name)
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = list(model.objects.filter(id__gt=last_id).order_by(
+                    'id',
+                ).only('id', 'name')[:BATCH_SIZE])
+                if not rows:
+                    break
+                for row in rows:
+                    row.folded_name = fold_name(row.name)
+                model.objects.bulk_update(rows, ['folded_name'])
+            last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_user_tokens_revoked_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='names_modified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='folded_name',
+            field=core.models.FoldedNameField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='folded_name',
+            field=core.models.FoldedNameField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fold_names, migrations.RunPython.noop),
+    ]
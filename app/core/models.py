@@ -2,11 +2,13 @@
 Database models.
 """
 import os
+import unicodedata
 import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 
@@ -67,6 +69,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # When any recipe, tag or ingredient of the user last changed, or was
+    # deleted. Kept up to date by 'core.signals'.
+    recipes_modified_at = models.DateTimeField(null=True, blank=True)
+    # When a tag or ingredient of the user was last created, renamed or
+    # deleted, the version of the autocomplete indexes (see
+    # 'recipe.autocomplete').
+    names_modified_at = models.DateTimeField(null=True, blank=True)
+    # The access tokens issued before this are revoked, e.g. after a
+    # password change, see 'user.tokens'.
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
@@ -86,18 +98,133 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Filled in the background after an upload, see 'recipe.images'.
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_size = models.PositiveIntegerField(null=True, blank=True)
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # The full-text search index of the recipe on PostgreSQL, kept up to
+    # date by 'recipe.search'. Its GIN index is created in the migration,
+    # because a GIN index can't be created on the SQLite used locally.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Also updated when the tags or ingredients of the recipe change,
+    # see 'core.signals'.
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The recipe list filters by the user & sorts by the id, so
+            # this index serves both, and the newest page of a user is
+            # read straight off the index without sorting.
+            models.Index(fields=['user', 'id'], name='recipe_user_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        # The time & price as loaded, so a change of them can be counted
+        # in the stats of the user without reading them again, see
+        # 'recipe.stats'.
+        recipe._stats_loaded = (
+            recipe.__dict__.get('time_minutes'),
+            recipe.__dict__.get('price'),
+        )
+        return recipe
 
     def __str__(self):
         return self.title
 
 
+def normalize_name(name):
+    """
+    Return the canonical form of a tag or ingredient name, e.g.
+    ' Sea  SALT' -> 'sea salt'. Two names of a user with the same
+    canonical form are the same tag or ingredient.
+    """
+    return ' '.join(name.split()).casefold()
+
+
+def fold_name(name):
+    """
+    Return a name in lower case & without accents, e.g. 'Crème' ->
+    'creme', for comparing names case & accent insensitively.
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(
+        char for char in decomposed if not unicodedata.combining(char)
+    ).casefold()
+
+
+class NormalizedNameField(models.CharField):
+    """
+    The canonical form of the 'name' of the model, see 'normalize_name()'.
+
+    It's set from the name whenever the row is saved, including by
+    'bulk_create', which calls 'pre_save' like 'save' does.
+    """
+    normalize = staticmethod(normalize_name)
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 255)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = self.normalize(model_instance.name)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class FoldedNameField(NormalizedNameField):
+    """
+    The 'name' of the model without case & accents, see 'fold_name()',
+    which the autocomplete matches & sorts the names by.
+    """
+    normalize = staticmethod(fold_name)
+
+
 class Tag(models.Model):
     """Tag for filtering recipes."""
     name = models.CharField(max_length=255)
+    normalized_name = NormalizedNameField()
+    folded_name = FoldedNameField()
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
         )
+    # The number of recipes with this tag, kept up to date as the links
+    # change (see 'recipe.counts'), so it's read without a join.
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # A user can only have one tag with a given name, this also lets
+        # the database (not just our code) stop concurrent requests from
+        # creating the same tag twice.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+            # Nor two tags that only differ by case or spaces, e.g. 'Salt'
+            # & 'salt ' (see 'merge_duplicates' for the older ones).
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='unique_tag_normalized_name_per_user',
+            ),
+        ]
+        indexes = [
+            # The tags used by recipes ('?assigned_only=1'), in the order
+            # of the list, & the most used tags first ('?sort=popularity').
+            models.Index(
+                fields=['user', '-name'],
+                condition=models.Q(recipe_count__gt=0),
+                name='tag_assigned_idx',
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', 'id'],
+                name='tag_popularity_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -106,10 +233,78 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     """Ingredient for recipes."""
     name = models.CharField(max_length=255)
+    normalized_name = NormalizedNameField()
+    folded_name = FoldedNameField()
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='unique_ingredient_normalized_name_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-name'],
+                condition=models.Q(recipe_count__gt=0),
+                name='ingredient_assigned_idx',
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', 'id'],
+                name='ingredient_popularity_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class RecipeStats(models.Model):
+    """
+    The statistics of the recipes of a user, kept up to date as they
+    change (see 'recipe.stats'), so they're read from a single row.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.IntegerField(default=0)
+    total_time_minutes = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    # The number of recipes by price bucket (its index in
+    # 'recipe.stats.PRICE_BUCKETS'), & by tag id.
+    price_buckets = models.JSONField(default=dict)
+    tag_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Recipe stats of {self.user_id}'
+
+
+class RevokedToken(models.Model):
+    """
+    A signed access or refresh token that can't be used anymore.
+
+    Rows are only needed until the token would have expired on its own,
+    after that they're deleted.
+    """
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
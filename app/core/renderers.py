@@ -0,0 +1,84 @@
+"""
+Renderers of the APIs.
+"""
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# 'orjson' writes the characters as they are, like DRF with 'UNICODE_JSON',
+# only these two are escaped, so the output is valid JavaScript too.
+ESCAPES = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer using 'orjson', which is several times faster than the
+    'json' module of the standard library.
+
+    The output is the same as the one of DRF's 'JSONRenderer': the types
+    'orjson' doesn't know (e.g. 'Decimal', lazy translations) & the dates
+    go through DRF's encoder. Pretty printed JSON (e.g. for the browsable
+    API), or a non compact one, is left to 'JSONRenderer'. One difference:
+    a NaN or infinite float becomes 'null' instead of an error.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render 'data' into JSON, returning a bytestring."""
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if (
+            self.get_indent(accepted_media_type, renderer_context) is not None
+            or not self.compact
+            or self.ensure_ascii
+        ):
+            return super().render(
+                data,
+                accepted_media_type,
+                renderer_context,
+            )
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=self.options,
+        )
+        for char, escape in ESCAPES:
+            ret = ret.replace(char, escape)
+        return ret
+
+    def render_stream(self, chunks):
+        """
+        Render a list given as an iterable of chunks (lists) of its items
+        into JSON, one chunk at a time, for a 'StreamingHttpResponse'.
+
+        Only one chunk has to be in memory at once, and the bytes are the
+        same as the ones of 'render()' for the whole list.
+        """
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if chunk:
+                # The items of the chunk, without the brackets around them.
+                yield separator + self.render(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    Renderer of the text format of Prometheus, for text the view already
+    formatted (see 'core.metrics.render'). Errors become their message.
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = f'{data.get("detail", data)}\n'
+        return data.encode(self.charset)
@@ -0,0 +1,176 @@
+"""
+Signals of the core app.
+
+The receivers mark the recipes, & the recipes, tags & ingredients of
+their owner, as modified (see 'Recipe.modified_at' &
+'User.recipes_modified_at'). A single change, e.g. a new recipe with its
+tags & ingredients, sends several signals, but each timestamp is written
+once per transaction: the marks are remembered until the transaction
+ends, like the updates of 'recipe.stats', & only the ones not written yet
+are. Everything the transaction writes after a mark is committed with it,
+so the mark is still newer than what readers saw before the commit. The
+readers of the timestamps in a transaction which also writes, e.g. the
+requests of a test, call 'forget_marks()', so a later change marks them
+again.
+"""
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag
+
+# Sent after recipes were written in bulk, e.g. with 'bulk_create', which
+# skips the model signals. The arguments are 'user' and 'recipe_ids', &
+# 'before', a snapshot of the changed recipes taken before the write (see
+# 'recipe.snapshots'), when some of them existed.
+recipes_bulk_written = Signal()
+
+# The marks written in the transaction of the thread, see '_unmarked()'.
+_marks = threading.local()
+
+
+def _unmarked(keys):
+    """
+    Return the marks of 'keys' not written yet in the transaction, & mark
+    them as written. Outside of a transaction, all of them.
+
+    Django starts a new list of the 'on_commit' callbacks when a
+    transaction ends or a savepoint is rolled back, so the marks are
+    forgotten then. A mark written in a savepoint is written again
+    outside of it ('None' is an atomic block without a savepoint), e.g.
+    by the next request of a test, which all run in the transaction of
+    the test.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return set(keys)
+
+    marks = getattr(_marks, 'marks', None)
+    if marks is None or marks[0] is not connection.run_on_commit:
+        marks = _marks.marks = (connection.run_on_commit, {})
+    savepoint_ids = frozenset(filter(None, connection.savepoint_ids))
+    unmarked = {
+        key for key in keys
+        if key not in marks[1] or not marks[1][key] <= savepoint_ids
+    }
+    marks[1].update(dict.fromkeys(unmarked, savepoint_ids))
+    return unmarked
+
+
+def forget_marks():
+    """
+    Forget the marks written in the transaction, after reading them, so
+    the next change writes them again.
+    """
+    _marks.marks = None
+
+
+def touch_recipes(recipe_ids):
+    """
+    Mark the recipes as modified now.
+
+    'recipe_ids' can be a queryset, which makes this a single UPDATE with
+    a subquery, instead of first reading the ids & then updating them.
+    The recipes of a queryset are always updated, there are no ids to
+    tell which of them were marked already.
+    """
+    if not isinstance(recipe_ids, QuerySet):
+        recipe_ids = [
+            pk for _, pk in _unmarked(('recipe', pk) for pk in recipe_ids)
+        ]
+        if not recipe_ids:
+            return
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        modified_at=timezone.now(),
+    )
+
+
+def touch_user(user_id, names=False):
+    """
+    Mark the recipes, tags & ingredients of the user as modified, & with
+    'names' the names of the tags & ingredients too.
+    """
+    fields = ['recipes_modified_at']
+    if names:
+        fields.append('names_modified_at')
+    fields = _unmarked((user_id, field) for field in fields)
+    if not fields:
+        return
+    now = timezone.now()
+    get_user_model().objects.filter(pk=user_id).update(
+        **{field: now for _, field in fields},
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_on_write(sender, instance, **kwargs):
+    """Mark the objects of the owner as modified."""
+    touch_user(instance.user_id, names=sender is not Recipe)
+
+
+@receiver(post_save, sender=Recipe)
+def mark_saved_recipe(sender, instance, update_fields, **kwargs):
+    """
+    Remember the saved recipe as marked: saving it wrote its 'auto_now'
+    field already.
+    """
+    if update_fields is None or 'modified_at' in update_fields:
+        _unmarked([('recipe', instance.pk)])
+
+
+@receiver(recipes_bulk_written)
+def touch_on_bulk_write(sender, user, **kwargs):
+    """Mark the objects of the owner as modified after a bulk write."""
+    touch_user(user.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Mark recipes as modified when their tags or ingredients change.
+
+    Adding a tag to a recipe doesn't save the recipe itself, so its
+    'auto_now' field wouldn't change without this.
+    """
+    if not reverse:
+        # 'instance' is the recipe, e.g. 'recipe.tags.add(tag)'.
+        if action.startswith('post_'):
+            touch_recipes([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # 'instance' is a tag or ingredient, e.g. 'tag.recipe_set.add()',
+        # and 'pk_set' has the ids of the recipes.
+        touch_recipes(pk_set)
+    elif action == 'pre_clear':
+        # Clearing doesn't tell which recipes it unlinks, so we have to
+        # look them up before they're gone.
+        touch_recipes(instance.recipe_set.values('id'))
+
+    if action.startswith('post_'):
+        touch_user(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_on_rename(sender, instance, created, **kwargs):
+    """Mark the recipes as modified when one of their tags is renamed."""
+    if not created:
+        touch_recipes(instance.recipe_set.values('id'))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_on_delete(sender, instance, **kwargs):
+    """Mark the recipes as modified when one of their tags is deleted."""
+    touch_recipes(instance.recipe_set.values('id'))
@@ -0,0 +1,63 @@
+"""
+Running slow work in the background, outside the request cycle.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    """Return the thread pool of this process, creating it when needed."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASK_WORKERS,
+            thread_name_prefix='background-task',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    """Run a task in a pool thread, logging instead of raising errors."""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed.', func.__name__)
+    finally:
+        # Each thread gets its own database connections, close them so
+        # they aren't left open until the database times them out.
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Call 'func(*args, **kwargs)' in a background thread, right away.
+
+    Only for code running after the commit, e.g. in an 'on_commit'
+    callback: anything else should use 'run_after_commit()'.
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        func(*args, **kwargs)
+    else:
+        _get_executor().submit(_run, func, args, kwargs)
+
+
+def run_after_commit(func, *args, **kwargs):
+    """
+    Call 'func(*args, **kwargs)' in a background thread.
+
+    The call waits for the current transaction to commit, so the task
+    sees the rows saved by the request (and never runs if it rolls back).
+    The tasks live in the memory of the process, so they're lost if it
+    stops first; anything using this needs a way to catch up, like the
+    'process_recipe_images' command.
+    """
+    transaction.on_commit(
+        lambda: run_in_background(func, *args, **kwargs),
+    )
@@ -0,0 +1,199 @@
+"""
+Tests for the async views.
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from core import asynchronous, metrics
+from core.asynchronous import (StreamingASGIHandler, async_view,
+                               database_sync_to_async)
+from core.models import Tag
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from recipe.views import RecipeViewSet, TagViewSet
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+
+class AsyncViewTests(TransactionTestCase):
+    """
+    Test the async views. They query the database from other threads,
+    which don't see the transactions of a 'TestCase'.
+    """
+
+    def setUp(self):
+        # The connections of the other threads are closed after each call,
+        # or they'd keep the test database from being dropped.
+        patcher = patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_viewsets_async(self):
+        """Test the viewsets are served by async views when asked to."""
+        view = TagViewSet.as_view({'get': 'list'})
+
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertIs(view.cls, TagViewSet)
+        self.assertEqual(view.actions, {'get': 'list'})
+        self.assertTrue(view.csrf_exempt)
+
+    def test_viewsets_sync_by_default(self):
+        """Test the viewsets are served by sync views by default."""
+        view = RecipeViewSet.as_view({'get': 'list'})
+
+        self.assertFalse(asyncio.iscoroutinefunction(view))
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_list_tags(self):
+        """Test listing the tags with the async view."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        view = TagViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/api/recipe/tags/')
+        force_authenticate(request, self.user)
+
+        res = async_to_sync(view)(request)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Vegan'],
+        )
+
+    def test_view_runs_in_other_thread(self):
+        """Test the view & its queries don't run in the calling thread."""
+        threads = []
+
+        def view(request):
+            threads.append(threading.get_ident())
+            return HttpResponse(str(Tag.objects.count()))
+
+        res = async_to_sync(async_view(view))(RequestFactory().get('/'))
+
+        self.assertEqual(res.content, b'0')
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+    def _send_response(self, response):
+        """Send the response with the ASGI handler, return the messages."""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        handler = StreamingASGIHandler()
+        async_to_sync(handler.send_response)(response, send)
+        return messages
+
+    def test_streamed_response_read_in_pool_thread(self):
+        """
+        Test a streamed response is read in a thread of the pool, as the
+        event loop can't query the database.
+        """
+        Tag.objects.create(user=self.user, name='Vegan')
+        threads = set()
+
+        def content():
+            threads.add(threading.get_ident())
+            yield b'tags: '
+            for tag in Tag.objects.all():
+                threads.add(threading.get_ident())
+                yield tag.name.encode()
+
+        res = StreamingHttpResponse(content(), status=201)
+        res['X-Test'] = 'yes'
+        messages = self._send_response(res)
+
+        self.assertEqual(messages[0]['status'], 201)
+        self.assertIn((b'X-Test', b'yes'), messages[0]['headers'])
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages),
+            b'tags: Vegan',
+        )
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_streamed_response_not_buffered(self):
+        """Test the parts of a streamed response are sent as made."""
+        sent = threading.Event()
+        waited = []
+
+        def content():
+            yield b'first'
+            # Only sent if the first part was sent before the end.
+            waited.append(sent.wait(timeout=5))
+            yield b'last'
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+            if message.get('body') == b'first':
+                sent.set()
+
+        handler = StreamingASGIHandler()
+        async_to_sync(handler.send_response)(
+            StreamingHttpResponse(content()),
+            send,
+        )
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+
+    @override_settings(ASYNC_VIEW_THREADS=2)
+    def test_pool_threads_bounded(self):
+        """Test the views run in at most 'ASYNC_VIEW_THREADS' threads."""
+        patcher = patch.object(asynchronous, '_executor', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        threads = set()
+        barrier = threading.Barrier(2, timeout=5)
+
+        def view(request):
+            threads.add(threading.get_ident())
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+            return HttpResponse()
+
+        async def requests():
+            await asyncio.gather(*(
+                async_view(view)(RequestFactory().get('/'))
+                for _ in range(6)
+            ))
+
+        async_to_sync(requests)()
+
+        self.assertEqual(len(threads), 2)
+        asynchronous._executor.shutdown()
+
+    def test_metrics_count_queries_of_other_threads(self):
+        """Test the queries of the async views are counted."""
+        count_tags = database_sync_to_async(
+            lambda: HttpResponse(str(Tag.objects.count())),
+        )
+
+        async def get_response(request):
+            return await count_tags()
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        with patch.object(metrics, 'record') as record:
+            res = async_to_sync(middleware)(request)
+
+        self.assertEqual(res.content, b'0')
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        view, method, code, duration, size, queries, query_duration = (
+            record.call_args.args
+        )
+        self.assertEqual((view, method, code), ('<unresolved>', 'GET', 200))
+        self.assertEqual(queries, 1)
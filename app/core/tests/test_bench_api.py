@@ -0,0 +1,80 @@
+"""
+Tests for the bench_api command.
+"""
+import io
+import json
+
+from core.management.commands.bench_api import percentile, route_names
+from core.models import Recipe
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from recipe import urls as recipe_urls
+from user import urls as user_urls
+
+OPTIONS = {
+    'no_test_db': True,
+    'users': 2,
+    'recipes': 4,
+    'tags': 2,
+    'ingredients': 2,
+    'requests': 2,
+    'warmup': 0,
+}
+
+
+def run(**options):
+    """Run the benchmark, return its report & what went to stderr."""
+    out = io.StringIO()
+    err = io.StringIO()
+    call_command('bench_api', stdout=out, stderr=err, **OPTIONS, **options)
+    return json.loads(out.getvalue()), err.getvalue()
+
+
+class BenchApiTests(TestCase):
+    """Test benchmarking the API."""
+
+    def test_every_route_benchmarked(self):
+        """Test the report has every route of the API, measured."""
+        report, err = run()
+
+        self.assertEqual(err, '')
+        routes = {e['route'] for e in report['endpoints'].values()}
+        self.assertEqual(routes, (
+            route_names(recipe_urls, 'recipe')
+            | route_names(user_urls, 'user')
+        ))
+        result = report['endpoints']['recipe list']
+        self.assertEqual(result['method'], 'GET')
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(result['requests_per_second'], 0)
+        self.assertGreater(result['queries_per_request'], 0)
+        self.assertGreater(result['peak_memory_kib'], 0)
+        self.assertEqual(report['dataset']['recipes_per_user'], 4)
+
+    def test_dataset_rolled_back(self):
+        """Test the dataset is gone after a run in the configured database."""
+        run(endpoints='recipe list')
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_endpoints_filter(self):
+        """Test only running some endpoints."""
+        report, _ = run(endpoints='recipe list,user me')
+
+        self.assertEqual(
+            sorted(report['endpoints']),
+            ['recipe list', 'user me'],
+        )
+
+    def test_unknown_endpoint_error(self):
+        """Test an unknown endpoint name is an error."""
+        with self.assertRaises(CommandError):
+            run(endpoints='nothing')
+
+    def test_percentile(self):
+        """Test the nearest-rank percentiles."""
+        ordered = list(range(1, 101))
+
+        self.assertEqual(percentile(ordered, 50), 50)
+        self.assertEqual(percentile(ordered, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
@@ -0,0 +1,194 @@
+"""
+Tests for the database connection pool & the PostgreSQL backend.
+"""
+import threading
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+from core.db import pool
+from core.db.backends.postgresql import base
+from django.db import connection
+from django.db.utils import OperationalError
+from django.db.backends.postgresql import base as django_base
+from django.test import SimpleTestCase
+from psycopg2 import extensions
+
+
+def fake_connection(status=extensions.TRANSACTION_STATUS_IDLE):
+    """Return a fake psycopg2 connection."""
+    conn = MagicMock(closed=0, autocommit=True)
+    conn.get_transaction_status.return_value = status
+    conn.get_parameter_status.return_value = 'UTC'
+    return conn
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the connection pool."""
+
+    def test_connections_reused(self):
+        """Test a connection given back is taken again."""
+        connection_pool = pool.ConnectionPool(size=2)
+        conn = connection_pool.get(fake_connection)
+        connection_pool.put(conn)
+
+        self.assertIs(connection_pool.get(fake_connection), conn)
+        stats = connection_pool.stats()
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['idle'], 0)
+
+    def test_unusable_connection_closed(self):
+        """Test a connection given back broken is closed, not kept."""
+        connection_pool = pool.ConnectionPool(size=1)
+        conn = connection_pool.get(fake_connection)
+        connection_pool.put(conn, usable=False)
+
+        conn.close.assert_called_once()
+        self.assertIsNot(connection_pool.get(fake_connection), conn)
+
+    def test_wait_then_timeout(self):
+        """Test a full pool makes the next checkout wait, then fail."""
+        connection_pool = pool.ConnectionPool(size=1, timeout=0.01)
+        connection_pool.get(fake_connection)
+
+        with self.assertRaises(pool.PoolTimeout):
+            connection_pool.get(fake_connection)
+
+        stats = connection_pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['wait_seconds'], 0)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_wait_for_connection_given_back(self):
+        """Test a waiting checkout gets the connection given back."""
+        connection_pool = pool.ConnectionPool(size=1, timeout=5)
+        conn = connection_pool.get(fake_connection)
+        timer = threading.Timer(0.05, connection_pool.put, [conn])
+        timer.start()
+
+        self.assertIs(connection_pool.get(fake_connection), conn)
+        timer.join()
+        self.assertEqual(connection_pool.stats()['waits'], 1)
+
+    def test_idle_connections_closed(self):
+        """Test the connections idle for too long are closed."""
+        connection_pool = pool.ConnectionPool(size=1, idle_timeout=0)
+        conn = connection_pool.get(fake_connection)
+        connection_pool.put(conn)
+
+        self.assertIsNot(connection_pool.get(fake_connection), conn)
+        conn.close.assert_called_once()
+        self.assertEqual(connection_pool.stats()['idle_closed'], 1)
+
+    def test_broken_connection_replaced(self):
+        """Test a connection failing its check is replaced."""
+        connection_pool = pool.ConnectionPool(
+            size=1,
+            check=lambda conn: False,
+        )
+        conn = connection_pool.get(fake_connection)
+        connection_pool.put(conn)
+
+        self.assertIsNot(connection_pool.get(fake_connection), conn)
+        self.assertEqual(connection_pool.stats()['reconnects'], 1)
+
+    def test_failed_connect_frees_place(self):
+        """Test a connection that couldn't be opened frees its place."""
+        connection_pool = pool.ConnectionPool(size=1, timeout=0.01)
+
+        def connect():
+            raise psycopg2.OperationalError('down')
+
+        with self.assertRaises(psycopg2.OperationalError):
+            connection_pool.get(connect)
+        self.assertIsNotNone(connection_pool.get(fake_connection))
+
+
+@patch.object(django_base.DatabaseWrapper, 'get_new_connection')
+class DatabaseWrapperTests(SimpleTestCase):
+    """Test the PostgreSQL backend, with fake connections."""
+
+    def setUp(self):
+        pool._pools.clear()
+        pool._reconnects.clear()
+
+    def _wrapper(self, **settings):
+        """Return a wrapper of a PostgreSQL database."""
+        return base.DatabaseWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'core.db.backends.postgresql',
+            'NAME': 'pooldb',
+            'CONN_MAX_AGE': 0,
+            **settings,
+        }, alias='pooltest')
+
+    def test_closed_connection_back_to_pool(self, get_new_connection):
+        """Test closing a connection gives it back to the pool."""
+        get_new_connection.side_effect = fake_connection
+        wrapper = self._wrapper(POOL={'SIZE': 2})
+        wrapper.connect()
+        conn = wrapper.connection
+        wrapper.close()
+
+        conn.close.assert_not_called()
+        wrapper.connect()
+        self.assertIs(wrapper.connection, conn)
+        stats = pool.get_stats()['pooltest']
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+
+    def test_open_transaction_rolled_back(self, get_new_connection):
+        """Test a connection is rolled back before going to the pool."""
+        get_new_connection.side_effect = fake_connection
+        wrapper = self._wrapper(POOL={'SIZE': 2})
+        wrapper.connect()
+        conn = wrapper.connection
+        conn.get_transaction_status.return_value = (
+            extensions.TRANSACTION_STATUS_INTRANS
+        )
+        wrapper.close()
+
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.get_stats()['pooltest']['idle'], 1)
+
+    def test_pool_timeout_is_operational_error(self, get_new_connection):
+        """Test a full pool raises Django's OperationalError."""
+        get_new_connection.side_effect = fake_connection
+        wrapper = self._wrapper(POOL={'SIZE': 1, 'TIMEOUT': 0.01})
+        wrapper.connect()
+        other = self._wrapper(POOL={'SIZE': 1, 'TIMEOUT': 0.01})
+
+        with self.assertRaises(OperationalError):
+            other.ensure_connection()
+
+    def test_health_check_reconnects(self, get_new_connection):
+        """Test a broken persistent connection is replaced."""
+        get_new_connection.side_effect = fake_connection
+        wrapper = self._wrapper(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        wrapper.ensure_connection()
+        broken = wrapper.connection
+        # The next request.
+        wrapper.close_if_unusable_or_obsolete()
+        broken.cursor.side_effect = psycopg2.OperationalError('gone')
+
+        wrapper.ensure_connection()
+
+        self.assertIsNot(wrapper.connection, broken)
+        self.assertEqual(pool.get_stats()['pooltest']['reconnects'], 1)
+
+    def test_health_check_once_per_request(self, get_new_connection):
+        """Test a persistent connection is only checked once a request."""
+        get_new_connection.side_effect = fake_connection
+        wrapper = self._wrapper(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        wrapper.ensure_connection()
+        conn = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', return_value=True) as check:
+            wrapper.ensure_connection()
+            wrapper.ensure_connection()
+
+        check.assert_called_once()
+        self.assertIs(wrapper.connection, conn)
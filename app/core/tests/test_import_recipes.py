@@ -0,0 +1,228 @@
+"""
+Tests for the import_recipes command.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+from recipe.imports import RecipeImporter
+from rest_framework.test import APIClient
+
+
+def record(title, tags=(), ingredients=(), **params):
+    """Return a recipe in the format of the NDJSON exports."""
+    data = {
+        'id': 1,
+        'title': title,
+        'time_minutes': 10,
+        'price': '5.50',
+        'link': '',
+        'description': '',
+        'tags': [{'id': 1, 'name': name} for name in tags],
+        'ingredients': [{'id': 1, 'name': name} for name in ingredients],
+    }
+    data.update(params)
+    return data
+
+
+class ImportRecipesTests(TestCase):
+    """Test importing recipes from files."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    def _write(self, name, content):
+        """Write a file to import, return its path."""
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def _write_ndjson(self, name, records):
+        """Write the records to an NDJSON file, return its path."""
+        return self._write(name, ''.join(
+            json.dumps(data) + '\n' for data in records
+        ))
+
+    def _import(self, *args, **options):
+        """Run the command, return what it wrote to stdout & stderr."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        options.setdefault('user', self.user.email)
+        call_command(
+            'import_recipes',
+            *args,
+            stdout=stdout,
+            stderr=stderr,
+            **options,
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_export_round_trip(self):
+        """Test importing the export of another user's recipes."""
+        other = get_user_model().objects.create_user('other@example.com')
+        client = APIClient()
+        client.force_authenticate(other)
+        for i in range(3):
+            client.post(reverse('recipe:recipe-list'), {
+                'title': f'Recipe {i}',
+                'time_minutes': i,
+                'price': '1.25',
+                'description': 'Line one\nline\ttwo \\ three',
+                'tags': [{'name': 'Vegan'}, {'name': f'Tag {i}'}],
+                'ingredients': [{'name': 'Rice'}],
+            }, format='json')
+        # Escaped in the CSV export, so spreadsheets don't run them.
+        client.post(reverse('recipe:recipe-list'), {
+            'title': '=1+1',
+            'time_minutes': 5,
+            'price': '1.25',
+            'description': "'-quoted",
+        }, format='json')
+        for file_format in ('ndjson', 'csv'):
+            res = client.get(
+                reverse('recipe:recipe-export'),
+                {'file_format': file_format},
+            )
+            path = self._write(
+                f'recipes.{file_format}',
+                b''.join(res.streaming_content).decode(),
+            )
+
+            self._import(path, batch_size=2)
+
+        def summary(user):
+            return sorted(
+                (
+                    recipe.title,
+                    recipe.time_minutes,
+                    recipe.price,
+                    recipe.description,
+                    sorted(tag.name for tag in recipe.tags.all()),
+                    sorted(i.name for i in recipe.ingredients.all()),
+                )
+                for recipe in Recipe.objects.filter(user=user)
+            )
+        self.assertEqual(summary(self.user), sorted(summary(other) * 2))
+        # The tags are shared by the recipes, not created again.
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+
+    def test_import_reuses_tags(self):
+        """Test the existing tags of the users are used."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        path = self._write_ndjson('recipes.ndjson', [
+            record('Curry', tags=['Vegan', 'Spicy', 'Vegan']),
+        ])
+
+        self._import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertIn(tag, recipe.tags.all())
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.price, Decimal('5.50'))
+
+    def test_import_user_column(self):
+        """Test the records with a 'user' are imported for that user."""
+        other = get_user_model().objects.create_user('other@example.com')
+        path = self._write(
+            'recipes.csv',
+            'title,time_minutes,price,tags,user\n'
+            'Mine,5,1.00,"[""Vegan""]",\n'
+            'Theirs,5,1.00,"[""Vegan""]",other@example.com\n',
+        )
+
+        self._import(path)
+
+        self.assertEqual(Recipe.objects.get(user=self.user).title, 'Mine')
+        theirs = Recipe.objects.get(user=other)
+        self.assertEqual(theirs.title, 'Theirs')
+        self.assertEqual(theirs.tags.get().user, other)
+
+    def test_invalid_records_skipped(self):
+        """Test invalid records are reported & the others imported."""
+        path = self._write('recipes.ndjson', '\n'.join([
+            json.dumps(record('Good')),
+            json.dumps(record('', price='a lot')),
+            '{"title": ',
+            json.dumps(record('Stranger', user='nobody@example.com')),
+            '"abc"',
+            '[1]',
+            json.dumps(record('Also good')),
+        ]))
+
+        stdout, stderr = self._import(path)
+
+        self.assertEqual(
+            set(Recipe.objects.values_list('title', flat=True)),
+            {'Good', 'Also good'},
+        )
+        for number in (2, 3, 4, 5, 6):
+            self.assertIn(f'record {number}', stderr)
+        self.assertIn('Expected a JSON object.', stderr)
+        self.assertIn('imported 2 recipes, 5 invalid', stdout)
+
+    def test_resume_from_checkpoint(self):
+        """Test a stopped import continues after the last batch."""
+        path = self._write_ndjson('recipes.ndjson', [
+            record(f'Recipe {i}', tags=['Vegan']) for i in range(5)
+        ])
+        real_write = RecipeImporter.write
+        calls = []
+
+        def write_then_fail(importer, batch):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise RuntimeError('Connection lost')
+            real_write(importer, batch)
+
+        with patch.object(RecipeImporter, 'write', write_then_fail):
+            with self.assertRaises(RuntimeError):
+                self._import(path, batch_size=2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        stdout, stderr = self._import(path, batch_size=2)
+
+        self.assertIn('resuming after 2 records', stdout)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            [f'Recipe {i}' for i in range(5)],
+        )
+        # Importing the same file again does nothing, unless restarted.
+        self._import(path)
+        self.assertEqual(Recipe.objects.count(), 5)
+        self._import(path, restart=True)
+        self.assertEqual(Recipe.objects.count(), 10)
+
+    def test_import_updates_search_index(self):
+        """Test the imported recipes can be searched."""
+        path = self._write_ndjson('recipes.ndjson', [
+            record('Lentil soup', ingredients=['Lentils']),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._import(path)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(reverse('recipe:recipe-list'), {'search': 'lentil'})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_unknown_user(self):
+        """Test an unknown --user is an error."""
+        path = self._write_ndjson('recipes.ndjson', [record('Curry')])
+
+        with self.assertRaises(CommandError):
+            self._import(path, user='nobody@example.com')
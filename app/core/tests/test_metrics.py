@@ -0,0 +1,256 @@
+"""
+Tests for the request metrics.
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from core import metrics
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+METRICS_URL = reverse('metrics')
+HEALTH_CHECK_URL = reverse('health-check')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def series(text, name, **labels):
+    """Return the value of a series in the output, or None."""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f'{name}{{{wanted}}} '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+@override_settings(METRICS_FLUSH_INTERVAL=0, METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+    """Test the metrics API."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(METRICS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics._values.clear()
+        metrics._slot = None
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@example.com',
+            'testpass123',
+        )
+
+    def _metrics(self):
+        """Return the metrics, read with the token."""
+        res = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION='Bearer secret',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['Content-Type'],
+            'text/plain; version=0.0.4; charset=utf-8',
+        )
+        return res.content.decode()
+
+    def test_metrics_requires_token_or_admin(self):
+        """Test the metrics are only shown to Prometheus & the admins."""
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(user)
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        token = Token.objects.create(user=self.admin)
+        self.client.force_authenticate(None)
+        res = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured(self):
+        """Test an empty METRICS_TOKEN doesn't open the metrics."""
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer ')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_requests_recorded(self):
+        """Test the requests are counted by view, method & status."""
+        self.client.get(HEALTH_CHECK_URL)
+        self.client.get(HEALTH_CHECK_URL)
+        self.client.get(RECIPES_URL)
+
+        text = self._metrics()
+
+        labels = {'view': 'health-check', 'method': 'GET'}
+        self.assertEqual(
+            series(text, 'http_requests_total', **labels, status=200),
+            2,
+        )
+        self.assertEqual(series(
+            text,
+            'http_requests_total',
+            view='recipe:recipe-list',
+            method='GET',
+            status=401,
+        ), 1)
+        self.assertEqual(
+            series(text, 'http_request_duration_seconds_count', **labels),
+            2,
+        )
+        self.assertEqual(series(
+            text,
+            'http_request_duration_seconds_bucket',
+            **labels,
+            le='+Inf',
+        ), 2)
+        self.assertEqual(series(
+            text,
+            'http_response_size_bytes_sum',
+            **labels,
+        ), 2 * len(b'{"healthy":true}'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+
+    def test_queries_counted(self):
+        """Test the SQL queries of the requests are counted."""
+        self.client.force_authenticate(self.admin)
+        self.client.get(RECIPES_URL)
+        self.client.force_authenticate(None)
+
+        text = self._metrics()
+
+        labels = {'view': 'recipe:recipe-list', 'method': 'GET'}
+        self.assertGreater(series(text, 'db_queries_total', **labels), 0)
+        self.assertGreater(
+            series(text, 'db_query_duration_seconds_total', **labels),
+            0,
+        )
+
+    def test_streamed_response_size(self):
+        """Test a streamed response is recorded once sent."""
+        self.client.force_authenticate(self.admin)
+        res = self.client.get(reverse('recipe:recipe-export'))
+        content = b''.join(res.streaming_content)
+        self.client.force_authenticate(None)
+
+        text = self._metrics()
+
+        self.assertEqual(series(
+            text,
+            'http_response_size_bytes_sum',
+            view='recipe:recipe-export',
+            method='GET',
+        ), len(content))
+
+    def test_workers_added_up(self):
+        """Test the numbers of all the workers' slots are added up."""
+        self.client.get(HEALTH_CHECK_URL)
+        # Another worker, with a slot of its own.
+        metrics.flush()
+        other = {
+            ('http_requests_total', (
+                ('view', 'health-check'),
+                ('method', 'GET'),
+                ('status', '200'),
+            )): 5,
+        }
+        with patch.object(metrics, '_values', other):
+            with patch.object(metrics, '_slot', None):
+                metrics.flush()
+
+        text = self._metrics()
+
+        self.assertEqual(series(
+            text,
+            'http_requests_total',
+            view='health-check',
+            method='GET',
+            status=200,
+        ), 6)
+
+    def test_dead_workers_archived(self):
+        """Test a worker that went away keeps its counters, not gauges."""
+        self.client.get(HEALTH_CHECK_URL)
+        metrics.flush()
+        dead = {
+            ('http_requests_total', (
+                ('view', 'health-check'),
+                ('method', 'GET'),
+                ('status', '200'),
+            )): 5,
+        }
+        stats = {'default': {'size': 10, 'in_use': 4, 'idle': 0}}
+        with patch.object(metrics, '_values', dead), \
+                patch.object(metrics, '_slot', '999999-dead'), \
+                patch.object(metrics.pool, 'get_stats', return_value=stats):
+            metrics.flush()
+
+        def is_alive(pid):
+            return pid != 999999
+
+        with patch.object(metrics, '_is_alive', is_alive):
+            # Archived by the first, only counted once by the second.
+            for _ in range(2):
+                text = self._metrics()
+                self.assertEqual(series(
+                    text,
+                    'http_requests_total',
+                    view='health-check',
+                    method='GET',
+                    status=200,
+                ), 6)
+
+        self.assertIsNone(series(text, 'db_pool_size', database='default'))
+        self.assertNotIn(
+            'worker-999999-dead.json',
+            os.listdir(metrics.settings.METRICS_DIR),
+        )
+
+    def test_connection_stats(self):
+        """Test the stats of the database connections are exported."""
+        stats = {'default': {
+            'reconnects': 1, 'connects': 3, 'checkouts': 40, 'waits': 2,
+            'wait_seconds': 0.5, 'timeouts': 0, 'idle_closed': 1,
+            'size': 10, 'in_use': 2, 'idle': 1,
+        }}
+        with patch.object(metrics.pool, 'get_stats', return_value=stats):
+            text = self._metrics()
+
+        self.assertEqual(
+            series(text, 'db_pool_checkouts_total', database='default'),
+            40,
+        )
+        self.assertEqual(
+            series(text, 'db_reconnects_total', database='default'),
+            1,
+        )
+        self.assertEqual(series(
+            text,
+            'db_pool_connections',
+            database='default',
+            state='in_use',
+        ), 2)
+        self.assertIn('# TYPE db_pool_size gauge', text)
+
+    def test_label_values_escaped(self):
+        """Test the quotes & backslashes of the labels are escaped."""
+        values = {('http_requests_total', (('view', 'a"b\\c'),)): 1}
+
+        text = metrics.render(values)
+
+        self.assertIn('http_requests_total{view="a\\"b\\\\c"} 1', text)
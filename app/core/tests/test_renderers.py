@@ -0,0 +1,110 @@
+"""
+Tests for the 'orjson' renderer & parser.
+"""
+import datetime
+import io
+from decimal import Decimal
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+
+def sample_data():
+    """Return data with the types the serializers return."""
+    return {
+        'id': 1,
+        'title': 'Crème brûlée ☃ "quoted" \u2028\u2029',
+        'price': Decimal('5.50'),
+        'amount': 0.1,
+        'created': datetime.datetime(
+            2022, 5, 1, 12, 30, 15, 123456,
+            tzinfo=datetime.timezone.utc,
+        ),
+        'day': datetime.date(2022, 5, 1),
+        'message': gettext_lazy('Invalid input.'),
+        'tags': [{'id': 2, 'name': 'Vegan'}],
+        3: None,
+        'link': '',
+        'done': True,
+    }
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """Test the output is the same as DRF's 'JSONRenderer'."""
+
+    def test_render_same_as_drf(self):
+        """Test rendering the serializer types."""
+        data = sample_data()
+
+        self.assertEqual(
+            ORJSONRenderer().render(data),
+            JSONRenderer().render(data),
+        )
+
+    def test_render_indented_same_as_drf(self):
+        """Test pretty printed JSON, e.g. for the browsable API."""
+        data = sample_data()
+        context = {'indent': 4}
+
+        self.assertEqual(
+            ORJSONRenderer().render(data, renderer_context=context),
+            JSONRenderer().render(data, renderer_context=context),
+        )
+
+    def test_render_none(self):
+        """Test None renders an empty body."""
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_render_stream_same_as_render(self):
+        """Test a list rendered in chunks is the same as all at once."""
+        items = [sample_data() for _ in range(5)]
+        renderer = ORJSONRenderer()
+
+        for chunks in ([items[:2], [], items[2:]], [items], [], [[]]):
+            with self.subTest(chunks=len(chunks)):
+                streamed = b''.join(renderer.render_stream(chunks))
+                expected = [item for chunk in chunks for item in chunk]
+                self.assertEqual(streamed, JSONRenderer().render(expected))
+
+
+class ORJSONParserTests(SimpleTestCase):
+    """Test the parser reads the same data as DRF's 'JSONParser'."""
+
+    def _parse(self, parser, body, encoding='utf-8'):
+        """Parse the body with the parser."""
+        return parser.parse(
+            io.BytesIO(body),
+            parser_context={'encoding': encoding},
+        )
+
+    def test_parse_same_as_drf(self):
+        """Test parsing a request body."""
+        body = JSONRenderer().render([
+            {'title': 'Crème brûlée ☃', 'price': '5.50', 'tags': []},
+            {'time_minutes': 10, 'ratio': 0.5, 'link': None},
+        ])
+
+        self.assertEqual(
+            self._parse(ORJSONParser(), body),
+            self._parse(JSONParser(), body),
+        )
+
+    def test_parse_other_encoding(self):
+        """Test a body in another encoding than UTF-8."""
+        body = '{"title": "Crème"}'.encode('latin-1')
+
+        data = self._parse(ORJSONParser(), body, encoding='latin-1')
+
+        self.assertEqual(data, {'title': 'Crème'})
+
+    def test_parse_invalid(self):
+        """Test invalid JSON, NaN included, is rejected."""
+        for body in (b'{"title": ', b'[NaN]', b'\xff'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError):
+                    self._parse(ORJSONParser(), body)
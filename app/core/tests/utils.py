@@ -0,0 +1,51 @@
+"""
+Helpers shared by the test suites.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Assert that a block of code stays within a SQL query budget.
+
+    Unlike Django's 'assertNumQueries', which wants an exact number, this
+    only enforces a ceiling, so we can pin the query cost of an endpoint
+    without the test breaking every time a query is saved.
+
+    The test case's transaction never commits, so the 'on_commit'
+    callbacks of the block (the counts, the stats, the search index...)
+    are run at its end & counted too: a real request runs them as well.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=connection):
+        """Fail if more than 'budget' queries run inside the block."""
+        with CaptureQueriesContext(using) as context:
+            with self.captureOnCommitCallbacks(using=using.alias,
+                                               execute=True):
+                yield context
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}'
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                f'{executed} queries executed, budget is {budget}.\n'
+                f'Captured queries were:\n{queries}'
+            )
+
+    def countQueries(self, func, *args, **kwargs):
+        """
+        Call 'func' and return the number of queries it ran, its
+        'on_commit' callbacks included.
+        """
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                func(*args, **kwargs)
+
+        return len(context.captured_queries)
@@ -1,7 +1,13 @@
 """
 Core views for app.
 """
+from core import metrics
+from core.renderers import PrometheusRenderer
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from rest_framework import authentication, permissions, views
 from rest_framework.decorators import api_view
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 
@@ -9,3 +15,40 @@ from rest_framework.response import Response
 def health_check(request):
     """Returns successful response."""
     return Response({'healthy': True})
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """
+    Allow the requests with the 'settings.METRICS_TOKEN' as a bearer
+    token, i.e. the 'Authorization: Bearer <token>' header Prometheus
+    sends with its 'authorization' scrape option. No token, no access.
+    """
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        header = authentication.get_authorization_header(request).split()
+        return bool(
+            token
+            and len(header) == 2
+            and header[0].lower() == b'bearer'
+            and constant_time_compare(header[1], token.encode())
+        )
+
+
+class MetricsView(views.APIView):
+    """
+    Show the request metrics of all the workers in the text format of
+    Prometheus (see 'core.metrics'), to Prometheus or to the admins.
+    """
+    authentication_classes = [
+        authentication.TokenAuthentication,
+        authentication.SessionAuthentication,
+    ]
+    permission_classes = [HasMetricsToken | permissions.IsAdminUser]
+    renderer_classes = [PrometheusRenderer, JSONRenderer]
+
+    def get(self, request):
+        return Response(
+            metrics.render(metrics.collect()),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
@@ -0,0 +1,159 @@
+"""
+Prefix autocomplete of the tag & ingredient names.
+
+Each worker keeps the names of the users it served recently in memory,
+as a list sorted by the "folded" name (lower case, without accents, see
+'core.models.fold_name()'), so the names starting with a prefix are
+found with a binary search, without a query. The least recently used
+indexes are dropped once there are more than
+'settings.AUTOCOMPLETE_MAX_INDEXES' of them.
+
+Every index has a version, the 'names_modified_at' of the user, which is
+set in the same transaction as any tag or ingredient of the user being
+created, renamed or deleted (see 'core.signals'), so unlike a counter in
+the cache it can't be evicted or lose a concurrent change, & the changes
+of the recipes alone keep the index. Each request reads it, a primary
+key lookup, and an index with another version is dropped. A request
+finding no index (or a stale one) is answered from the database, with
+the folded names stored in the rows, so in the same order & with the
+same matches as the index. The index is then rebuilt in the background
+for the next keystroke; the worker making a change rebuilds its own
+index right after the commit.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+
+from core.models import fold_name
+from core.signals import forget_marks
+from core.tasks import run_after_commit, run_in_background
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+
+Index = namedtuple('Index', ['version', 'entries'])
+
+# How long a build is waited for before another one is scheduled: a build
+# scheduled in a transaction that rolls back never runs.
+BUILD_TIMEOUT = 30
+
+_indexes = OrderedDict()
+# When the builds in progress were scheduled, by index key.
+_building = {}
+_lock = threading.Lock()
+
+
+def _index_key(model, user_id):
+    """Return the key of the index of a user's tags or ingredients."""
+    return (model._meta.label_lower, user_id)
+
+
+def _get_version(model, user_id):
+    """Return the current version of the user's index."""
+    # Read from the primary, even in the requests reading the replicas,
+    # so the version isn't older than the names the index was built from.
+    version = get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=user_id,
+    ).values_list('names_modified_at', flat=True).first()
+    forget_marks()
+    return version
+
+
+def _store(key, index):
+    """Store an index, evicting the least recently used ones."""
+    with _lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > settings.AUTOCOMPLETE_MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+
+def build(model, user_id):
+    """Load the names of the user's tags or ingredients into an index."""
+    key = _index_key(model, user_id)
+    try:
+        # The version is read first, so a change made while the names
+        # are loaded leaves the index stale instead of missing it.
+        version = _get_version(model, user_id)
+        entries = sorted(model.objects.filter(
+            user_id=user_id,
+        ).values_list('folded_name', 'name', 'id'))
+        _store(key, Index(version, entries))
+    finally:
+        with _lock:
+            _building.pop(key, None)
+
+
+def _schedule_build(model, user_id, schedule=run_after_commit):
+    """Build the index in the background, unless it's being built."""
+    key = _index_key(model, user_id)
+    now = time.monotonic()
+    with _lock:
+        if now - _building.get(key, -BUILD_TIMEOUT) < BUILD_TIMEOUT:
+            return
+        _building[key] = now
+    schedule(build, model, user_id)
+
+
+def _get_index(model, user_id):
+    """Return the index of the user if it's up to date, else None."""
+    key = _index_key(model, user_id)
+    version = _get_version(model, user_id)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            return None
+        if index.version != version:
+            del _indexes[key]
+            return None
+        _indexes.move_to_end(key)
+
+    return index
+
+
+def _complete_from_db(model, user_id, prefix, limit):
+    """
+    Return the names starting with the prefix from the database, until
+    the index is built.
+    """
+    return list(model.objects.filter(
+        user_id=user_id,
+        folded_name__startswith=fold_name(prefix),
+    ).order_by('folded_name', 'name', 'id').values('id', 'name')[:limit])
+
+
+def complete(model, user_id, prefix, limit):
+    """Return the first 'limit' names starting with the prefix."""
+    index = _get_index(model, user_id)
+    if index is None:
+        _schedule_build(model, user_id)
+        return _complete_from_db(model, user_id, prefix, limit)
+
+    folded = fold_name(prefix)
+    entries = index.entries
+    matches = []
+    position = bisect_left(entries, (folded,))
+    while (
+        position < len(entries)
+        and len(matches) < limit
+        and entries[position][0].startswith(folded)
+    ):
+        folded_name, name, pk = entries[position]
+        matches.append({'id': pk, 'name': name})
+        position += 1
+
+    return matches
+
+
+def rebuild(model, user_id):
+    """
+    Drop the worker's index of the user & build it again, after its tags
+    or ingredients changed.
+
+    Call this after the transaction commits, so the index is built from
+    the names with the change.
+    """
+    with _lock:
+        _indexes.pop(_index_key(model, user_id), None)
+    _schedule_build(model, user_id, run_in_background)
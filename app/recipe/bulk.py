@@ -0,0 +1,190 @@
+"""
+Bulk creating and updating of recipes.
+"""
+from core.models import Ingredient, Recipe, Tag
+from core.signals import recipes_bulk_written
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from recipe.serializers import RecipeSerializer, get_or_create_by_name
+from recipe.snapshots import Snapshot
+
+# The largest number of recipes accepted in one request.
+MAX_BULK_ITEMS = 1000
+
+
+class RecipeBulkWriter:
+    """
+    Create or update many recipes of a user at once.
+
+    Every item is validated on its own with the 'RecipeSerializer', and
+    items that fail validation are reported back instead of failing the
+    whole batch. The valid items are then written with a handful of
+    queries, however many recipes, tags and ingredients the batch has:
+        - the tags & ingredients of the whole batch are looked up and
+          created together,
+        - the new recipes are inserted with one 'bulk_create' and the
+          existing ones are saved with one 'bulk_update',
+        - the links between them are written straight into the
+          through tables, in bulk.
+
+    Items with an 'id' update that recipe of the user, the others create
+    a new recipe.
+    """
+    relations = [
+        ('tags', Tag, 'tag_id'),
+        ('ingredients', Ingredient, 'ingredient_id'),
+    ]
+
+    def __init__(self, user, context):
+        self.user = user
+        self.context = context
+
+    def write(self, items):
+        """Validate and save 'items', return a result for each one."""
+        results = [{'index': index} for index in range(len(items))]
+        valid = self._validate(items, results)
+
+        with transaction.atomic():
+            self._save(valid, results)
+
+        return results
+
+    def _validate(self, items, results):
+        """Return a list of (index, instance, validated data) tuples."""
+        ids = [
+            item['id'] for item in items
+            if isinstance(item, dict) and item.get('id') is not None
+        ]
+        # Only the user's own recipes can be updated, an id of someone
+        # else's recipe is reported the same way as one that doesn't exist.
+        instances = Recipe.objects.filter(
+            user=self.user,
+            id__in=[i for i in ids if isinstance(i, int)],
+        ).in_bulk()
+
+        valid = []
+        for index, item in enumerate(items):
+            instance = None
+            if isinstance(item, dict) and item.get('id') is not None:
+                instance = instances.get(item['id'])
+                if instance is None:
+                    msg = _('Recipe not found.')
+                    results[index]['errors'] = {'id': [msg]}
+                    continue
+
+            serializer = RecipeSerializer(
+                instance,
+                data=item,
+                context=self.context,
+            )
+            if serializer.is_valid():
+                valid.append((index, instance, serializer.validated_data))
+            else:
+                results[index]['errors'] = serializer.errors
+
+        return valid
+
+    def _save(self, valid, results):
+        """Write the validated items to the database."""
+        # What the updated recipes were, to count what the write changes.
+        before = Snapshot(
+            [instance.id for index, instance, data in valid if instance],
+            self.user.pk,
+        )
+        related = {}
+        for field, model, column in self.relations:
+            names = {
+                obj['name']
+                for index, instance, data in valid
+                for obj in data.get(field, [])
+            }
+            related[field] = get_or_create_by_name(model, self.user, names)
+
+        # 'bulk_update' skips the 'auto_now' of 'modified_at', so it's set
+        # by hand for the updated recipes.
+        now = timezone.now()
+        new_recipes, updated_recipes = [], []
+        update_fields = {'modified_at'}
+        for index, instance, data in valid:
+            fields = {
+                key: value for key, value in data.items()
+                if key not in related
+            }
+            if instance is None:
+                new_recipes.append(Recipe(user=self.user, **fields))
+                results[index]['status'] = 'created'
+            else:
+                for attr, value in fields.items():
+                    setattr(instance, attr, value)
+                instance.modified_at = now
+                update_fields.update(fields)
+                updated_recipes.append(instance)
+                results[index]['status'] = 'updated'
+
+        Recipe.objects.bulk_create(new_recipes)
+        if updated_recipes:
+            Recipe.objects.bulk_update(updated_recipes, update_fields)
+
+        # 'bulk_create' sets the primary keys on the new recipes, in the
+        # same order as the valid items that created them.
+        new = iter(new_recipes)
+        saved = []
+        for index, instance, data in valid:
+            recipe = instance or next(new)
+            results[index]['id'] = recipe.id
+            saved.append((recipe, data))
+
+        for field, model, column in self.relations:
+            wanted = {
+                recipe.id: {
+                    related[field][obj['name']].id for obj in data[field]
+                }
+                for recipe, data in saved
+                if field in data
+            }
+            self._write_links(getattr(Recipe, field).through, column, wanted)
+
+        # 'bulk_create', 'bulk_update' & the through table writes don't
+        # send the model signals, so we let the receivers know ourselves.
+        if saved:
+            recipes_bulk_written.send(
+                sender=Recipe,
+                user=self.user,
+                recipe_ids=[recipe.id for recipe, data in saved],
+                before=before,
+            )
+
+    def _write_links(self, through, column, wanted):
+        """
+        Make the through table link each recipe to the wanted ids.
+
+        'wanted' maps a recipe id to the set of tag or ingredient ids it
+        should end up with. The current links of all the recipes are
+        read with one query, and only the difference is written.
+        """
+        if not wanted:
+            return
+
+        current = {}
+        stale = []
+        links = through.objects.filter(
+            recipe_id__in=wanted,
+        ).values_list('id', 'recipe_id', column)
+        for link_id, recipe_id, target_id in links:
+            if target_id in wanted[recipe_id]:
+                current.setdefault(recipe_id, set()).add(target_id)
+            else:
+                stale.append(link_id)
+
+        if stale:
+            through.objects.filter(id__in=stale).delete()
+        through.objects.bulk_create(
+            [
+                through(recipe_id=recipe_id, **{column: target_id})
+                for recipe_id, target_ids in wanted.items()
+                for target_id in target_ids - current.get(recipe_id, set())
+            ],
+            ignore_conflicts=True,
+        )
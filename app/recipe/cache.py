@@ -0,0 +1,135 @@
+"""
+Per-user response cache for the recipe APIs.
+
+Every user has a version in the cache, and the version is part of the key
+of every cached response of that user. Any write to a recipe, tag or
+ingredient of the user replaces the version with a new one, so all of the
+user's cached responses become unreachable at once, in O(1), without us
+having to know which keys they were stored under. The stale entries are
+never read again & simply expire.
+"""
+import hashlib
+import uuid
+
+from core.db import routers
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+HITS_KEY = 'recipe-cache:hits'
+MISSES_KEY = 'recipe-cache:misses'
+
+
+def _version_key(user_id):
+    """Return the cache key of the version of a user."""
+    return f'recipe-cache:version:{user_id}'
+
+
+def get_version(user_id):
+    """Return the current cache version of the user."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # The version is random (instead of a counter starting from 1),
+        # so a version that was evicted from the cache is never reused.
+        version = uuid.uuid4().hex
+        # 'add' only sets the key if no other worker has set it already.
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+
+    return version
+
+
+def _bump_version(user_id):
+    """Replace the cache version of the user with a new one."""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def _written(user_id):
+    """Invalidate the user's responses & read their data from the primary."""
+    routers.mark_written(user_id)
+    _bump_version(user_id)
+
+
+def invalidate_user(user_id):
+    """
+    Invalidate all the cached responses of the user.
+
+    The version is changed right away, so the rest of the request sees
+    the change, and once more when the transaction commits, because a
+    response read from the database by another request before the commit
+    could have been cached under the version we set first.
+
+    The user's reads also stick to the primary from then on, so no
+    response read from a replica without the change gets cached under
+    the new version, whichever code made the change.
+    """
+    _written(user_id)
+    transaction.on_commit(lambda: _written(user_id))
+
+
+def response_key(request):
+    """Return the key to cache the response to the request with."""
+    user_id = request.user.pk
+    # The query parameters are sorted so '?a=1&b=2' & '?b=2&a=1' share
+    # the same cached response.
+    query = sorted(request.query_params.lists())
+    digest = hashlib.md5(
+        f'{request.path}?{query}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+
+    return f'recipe-cache:response:{user_id}:{get_version(user_id)}:{digest}'
+
+
+def _increment(key):
+    """Increment a counter in the cache, creating it if needed."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_response(key):
+    """Return the cached response data, or None, and count the hit."""
+    data = cache.get(key)
+    _increment(MISSES_KEY if data is None else HITS_KEY)
+
+    return data
+
+
+def set_response(key, data):
+    """Cache the response data under the key."""
+    cache.set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def get_validators(request, compute):
+    """
+    Return the (ETag, Last-Modified) validators of the response.
+
+    They're cached next to the response itself, so a repeated request
+    can be answered with a '304 Not Modified' without any query. On a
+    miss they're computed by calling 'compute()'.
+    """
+    key = f'{response_key(request)}:validators'
+    validators = cache.get(key)
+    if validators is None:
+        validators = compute()
+        cache.set(key, validators, settings.RECIPE_CACHE_TIMEOUT)
+
+    return validators
+
+
+def get_stats():
+    """Return the hit & miss counters of the response cache."""
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
@@ -0,0 +1,105 @@
+"""
+The number of recipes of each tag & ingredient ('recipe_count').
+
+It's kept up to date by the receivers of 'recipe.signals' as the links of
+the recipes change, so listing the used tags ('?assigned_only=1') or the
+most used first ('?sort=popularity') reads the tags alone, instead of
+joining the links & counting them.
+
+Like the stats, each change is applied once its transaction commits, with
+an 'UPDATE ... SET recipe_count = recipe_count + n', so a rolled back
+change isn't counted, concurrent changes add up, and a popular tag isn't
+locked for the whole transaction of every recipe saved with it. The
+cached responses of the user are invalidated again afterwards, as they
+could have been cached with the old counts in the meantime. The writes
+that skip the model signals, e.g. with SQL, can make the counts drift:
+'repair_recipe_counts' counts them all again.
+"""
+import functools
+from collections import defaultdict
+
+from core.models import Ingredient, Tag
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipe import cache
+
+
+def _links(model):
+    """Return the through model of the recipes of a model, & its field."""
+    return model.recipe_set.through, model._meta.model_name
+
+
+def add(model, user_id, counts):
+    """
+    Add to the number of recipes of tags or ingredients of the user,
+    'counts' by id, when the transaction commits.
+    """
+    counts = {pk: number for pk, number in counts.items() if number}
+    if counts:
+        transaction.on_commit(functools.partial(
+            _apply,
+            model,
+            user_id,
+            counts,
+        ))
+
+
+def _apply(model, user_id, counts):
+    """Add to the number of recipes of tags or ingredients, by id."""
+    by_number = defaultdict(list)
+    for pk, number in counts.items():
+        by_number[number].append(pk)
+    # One UPDATE for all the ids changed by the same number, i.e. usually
+    # one for the whole change. A count that drifted stays at 0 at least.
+    for number, pks in by_number.items():
+        model.objects.filter(pk__in=pks).update(
+            recipe_count=Greatest(F('recipe_count') + number, 0),
+        )
+    cache.invalidate_user(user_id)
+
+
+def remove_recipe(user_id, tag_ids, ingredient_ids):
+    """
+    Stop counting a deleted recipe in its tags & ingredients, when the
+    transaction commits.
+    """
+    add(Tag, user_id, {pk: -1 for pk in tag_ids})
+    add(Ingredient, user_id, {pk: -1 for pk in ingredient_ids})
+
+
+def totals(model, recipes):
+    """
+    Return the number of the recipes of a queryset linked to each tag or
+    ingredient, by user id & then by id.
+    """
+    through, field = _links(model)
+    links = through.objects.filter(recipe__in=recipes).values(
+        'recipe__user_id',
+        f'{field}_id',
+    ).annotate(count=Count('id'))
+    by_user = defaultdict(dict)
+    for row in links:
+        by_user[row['recipe__user_id']][row[f'{field}_id']] = row['count']
+    return dict(by_user)
+
+
+def actual_count(model):
+    """Return an expression counting the recipes of each row, for 'model'."""
+    through, field = _links(model)
+    links = through.objects.filter(**{field: OuterRef('pk')}).values(
+        field,
+    ).annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(links), 0)
+
+
+def recount(queryset):
+    """
+    Count the recipes of the tags or ingredients of the queryset again,
+    & return the number of them whose count had drifted.
+    """
+    actual = actual_count(queryset.model)
+    return queryset.alias(actual=actual).exclude(
+        recipe_count=F('actual'),
+    ).update(recipe_count=actual)
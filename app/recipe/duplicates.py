@@ -0,0 +1,144 @@
+"""
+Merging the tags & ingredients of a user whose names only differ by case
+or spaces, e.g. 'Salt', 'salt' & 'salt '.
+
+They have the same 'normalized_name'. The oldest of each group is kept:
+the links of the recipes to the others are moved over to it with a few
+set-based statements per batch of groups, rather than a query per link,
+and the others are deleted. Each batch is a transaction of its own, so
+only the rows of the batch are locked, and only while it's merged: the
+tables stay usable while a large merge runs.
+
+Once the unique constraints of the normalized names are in place (the
+migration '0016_unique_normalized_names'), there can't be any duplicates
+left: 'manage.py merge_duplicates' is for merging them before that
+migration, while the app is up, so the migration has little left to do.
+The migration has a copy of the merge of its own, as a migration can't
+follow the changes of the app's code.
+"""
+import functools
+import operator
+
+from django.db import connection, transaction
+from django.db.models import (Case, Count, Exists, IntegerField, OuterRef,
+                              Q, Value, When)
+
+# The number of groups merged in each transaction.
+BATCH_SIZE = 500
+
+
+def has_unique_names(model):
+    """
+    Return True if the database has the unique constraint of the
+    normalized names of the model, so it can't have any duplicates.
+    """
+    names = {
+        constraint.name for constraint in model._meta.constraints
+        if 'normalized_name' in constraint.fields
+    }
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor,
+            model._meta.db_table,
+        )
+    return bool(names) and names <= constraints.keys()
+
+
+def duplicate_groups(model):
+    """
+    Return the (user id, normalized name, number of rows) of each group of
+    duplicates of the model.
+    """
+    return model.objects.values('user_id', 'normalized_name').annotate(
+        total=Count('id'),
+    ).filter(total__gt=1).order_by('user_id', 'normalized_name').values_list(
+        'user_id',
+        'normalized_name',
+        'total',
+    )
+
+
+def _group_rows(model, groups):
+    """Return the rows of the groups, (user id, normalized name) pairs."""
+    return model.objects.filter(functools.reduce(operator.or_, (
+        Q(user_id=user_id, normalized_name=name)
+        for user_id, name in groups
+    )))
+
+
+def linked_recipe_ids(model, groups):
+    """
+    Lock the rows of the groups, & return the ids of the recipes linked to
+    any of them.
+    """
+    pks = list(_group_rows(model, groups).select_for_update().values_list(
+        'id',
+        flat=True,
+    ))
+    column = f'{model._meta.model_name}_id'
+    return set(model.recipe_set.through.objects.filter(
+        **{f'{column}__in': pks},
+    ).values_list('recipe_id', flat=True))
+
+
+def merge_groups(model, groups):
+    """
+    Merge the groups of duplicates, (user id, normalized name) pairs, into
+    the oldest row of each, in one transaction.
+
+    Return the ids of the recipes whose links changed, by user id. The
+    counts of the kept rows aren't changed, the sender of the bulk write
+    has them counted (see 'recipe.snapshots').
+    """
+    through = model.recipe_set.through
+    column = f'{model._meta.model_name}_id'
+    with transaction.atomic():
+        # Locked, so the rows aren't renamed or linked to meanwhile. The
+        # groups are read again, they could have changed since they were
+        # found.
+        rows = _group_rows(model, groups).select_for_update().order_by(
+            'id',
+        ).values_list('id', 'user_id', 'normalized_name')
+        members = {}
+        for pk, user_id, name in rows:
+            members.setdefault((user_id, name), []).append(pk)
+        members = [pks for pks in members.values() if len(pks) > 1]
+        if not members:
+            return {}
+
+        duplicate_ids = [pk for pks in members for pk in pks[1:]]
+        # The id of the kept row of the group, for the links of any row of
+        # the group.
+        kept_id = Case(
+            *[When(**{f'{column}__in': pks}, then=Value(pks[0]))
+              for pks in members],
+            output_field=IntegerField(),
+        )
+        links = through.objects.filter(**{f'{column}__in': duplicate_ids})
+        changed = {}
+        for recipe_id, user_id in links.values_list(
+            'recipe_id',
+            'recipe__user_id',
+        ):
+            changed.setdefault(user_id, set()).add(recipe_id)
+
+        # A recipe linked to several rows of a group keeps the link to the
+        # oldest one only, so moving the links creates no duplicate links.
+        links.alias(kept_id=kept_id).filter(Exists(
+            through.objects.alias(kept_id=kept_id).filter(
+                recipe_id=OuterRef('recipe_id'),
+                kept_id=OuterRef('kept_id'),
+                **{f'{column}__lt': OuterRef(column)},
+            )
+        )).delete()
+        links.update(**{column: kept_id})
+        model.objects.filter(pk__in=duplicate_ids).delete()
+
+    return changed
+
+
+def batches(groups, size=BATCH_SIZE):
+    """Split the groups into lists of at most 'size' groups."""
+    groups = list(groups)
+    for start in range(0, len(groups), size):
+        yield groups[start:start + size]
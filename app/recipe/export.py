@@ -0,0 +1,86 @@
+"""
+Exports of the recipes of a user, as NDJSON or CSV.
+
+The exports are streamed: the recipes are read a chunk at a time (see
+'FastRecipeListSerializer.chunks'), and each chunk is written out before
+the next one is read, so the memory used stays the same whatever the
+number of recipes, and the download starts right away.
+"""
+import csv
+import io
+
+import orjson
+from core.renderers import ORJSONRenderer
+
+# The formats of the exports & their content types.
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def ndjson_stream(chunks):
+    """Yield the recipes of the chunks as JSON objects, one per line."""
+    renderer = ORJSONRenderer()
+    for chunk in chunks:
+        yield b''.join(renderer.render(recipe) + b'\n' for recipe in chunk)
+
+
+# The first characters making a spreadsheet read a cell as a formula,
+# & the quote escaping them (see '_csv_cell()').
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+FORMULA_ESCAPE = "'"
+
+
+def _csv_cell(value):
+    """
+    Return a value of a recipe as a CSV cell.
+
+    The tags & ingredients become a JSON list of their names, e.g.
+    '["Vegan","Dinner"]', which can't be confused with a name containing
+    a comma. A text that a spreadsheet would run as a formula, e.g. a
+    title like '=HYPERLINK(...)', is escaped with a quote in front, which
+    the spreadsheets show as text. So are the texts starting with a quote
+    already, so the imports (see 'recipe.imports') can always drop it.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return orjson.dumps([item['name'] for item in value]).decode()
+    if isinstance(value, str) and value.startswith(
+        FORMULA_PREFIXES + (FORMULA_ESCAPE,),
+    ):
+        return FORMULA_ESCAPE + value
+    return value
+
+
+def unescape_csv_cell(value):
+    """Return the text of a CSV cell of an export, without its escape."""
+    if value.startswith(FORMULA_ESCAPE) and value[1:].startswith(
+        FORMULA_PREFIXES + (FORMULA_ESCAPE,),
+    ):
+        return value[1:]
+    return value
+
+
+def _drain(buffer):
+    """Return what was written to the buffer, & empty it."""
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value.encode()
+
+
+def csv_stream(chunks, fields):
+    """Yield the recipes of the chunks as CSV, with a header row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield _drain(buffer)
+
+    for chunk in chunks:
+        writer.writerows(
+            [_csv_cell(recipe[name]) for name in fields]
+            for recipe in chunk
+        )
+        yield _drain(buffer)
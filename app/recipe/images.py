@@ -0,0 +1,156 @@
+"""
+Resized renditions of the recipe images.
+
+The uploaded image is kept as it is, and a fixed set of smaller copies
+is made from it in the background (see 'core.tasks'), so the clients can
+download an image of the size they show instead of the original, which
+is often a phone photo of several megabytes.
+"""
+import io
+import os
+
+from core.models import Recipe
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+# The longest side of each rendition, in pixels. Smaller images aren't
+# scaled up, so a rendition can be smaller than this.
+RENDITION_SIZES = {
+    'thumbnail': 160,
+    'small': 480,
+    'large': 1280,
+}
+
+# The file extension & the Pillow options of each rendition format.
+# Leaving out 'exif' & 'icc_profile' strips the metadata of the upload,
+# e.g. the GPS location of the phone that took the photo.
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {
+        'format': 'JPEG',
+        'quality': 82,
+        'optimize': True,
+        'progressive': True,
+    },
+}
+
+# The EXIF tag telling how the camera was held, orientations 5 to 8 are
+# rotated by 90 degrees, i.e. the width & the height are swapped.
+ORIENTATION_TAG = 0x0112
+
+
+def rendition_name(image_name, rendition, ext):
+    """
+    Return the file name of a rendition of an image.
+
+    The renditions are stored next to the original, so an image uploaded
+    to 'uploads/recipe/<uuid>.jpg' gets e.g.
+    'uploads/recipe/<uuid>-thumbnail.webp'.
+    """
+    root = os.path.splitext(image_name)[0]
+    return f'{root}-{rendition}.{ext}'
+
+
+def _formats():
+    """Return the formats supported by the installed Pillow."""
+    return {
+        ext: options for ext, options in FORMATS.items()
+        if ext != 'webp' or features.check('webp')
+    }
+
+
+def _open(image_file):
+    """Open the image, return it with its width & height as displayed."""
+    image = Image.open(image_file)
+    width, height = image.size
+    if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+        width, height = height, width
+
+    # For JPEGs, this lets the decoder skip most of the pixels we'd throw
+    # away when resizing anyway, which is a lot faster on big photos.
+    largest = max(RENDITION_SIZES.values())
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    return image, width, height
+
+
+def _encode(image, options):
+    """Return the image encoded with the options of a format."""
+    options = dict(options)
+    if options['format'] == 'JPEG' and image.mode == 'RGBA':
+        # JPEG has no transparency, so put the image on a white background.
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def delete_renditions(storage, renditions):
+    """Delete the files of the renditions of an image."""
+    for rendition in renditions.values():
+        for ext in FORMATS:
+            if ext in rendition:
+                storage.delete(rendition[ext])
+
+
+def process_recipe_image(recipe_id):
+    """
+    Make the renditions of the image of a recipe & store its dimensions.
+
+    Nothing is saved if the recipe or its image changed while we were
+    working on it, the newer image has its own task coming.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+
+    image_name = recipe.image.name
+    storage = recipe.image.storage
+    with recipe.image.open('rb') as image_file:
+        original, width, height = _open(image_file)
+    size = recipe.image.size
+
+    renditions = {}
+    for rendition, longest in RENDITION_SIZES.items():
+        image = original.copy()
+        image.thumbnail((longest, longest), Image.LANCZOS)
+        renditions[rendition] = {'width': image.width, 'height': image.height}
+        for ext, options in _formats().items():
+            name = rendition_name(image_name, rendition, ext)
+            # Processing the same image again replaces its renditions.
+            storage.delete(name)
+            renditions[rendition][ext] = storage.save(
+                name,
+                ContentFile(_encode(image, options)),
+            )
+
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            id=recipe_id,
+            image=image_name,
+        ).first()
+        if recipe is None:
+            delete_renditions(storage, renditions)
+            return
+
+        recipe.image_width = width
+        recipe.image_height = height
+        recipe.image_size = size
+        recipe.image_renditions = renditions
+        # A regular save, so the receivers in 'core.signals' &
+        # 'recipe.signals' update the ETags & the cached responses.
+        recipe.save(update_fields=[
+            'image_width',
+            'image_height',
+            'image_size',
+            'image_renditions',
+            'modified_at',
+        ])
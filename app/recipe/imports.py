@@ -0,0 +1,289 @@
+"""
+Importing recipes in large batches, see the 'import_recipes' command.
+"""
+import csv
+import io
+
+import orjson
+from core.models import Recipe
+from core.signals import recipes_bulk_written
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils.translation import gettext as _
+from rest_framework import serializers
+
+from recipe import export
+from recipe.bulk import RecipeBulkWriter
+from recipe.serializers import RecipeDetailSerializer, get_or_create_by_name
+
+# The formats of the files, by their extension.
+FORMATS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+}
+
+
+def _names(value):
+    """
+    Return the tags or ingredients of a record as a list of names.
+
+    They're lists of {'id': 1, 'name': 'Vegan'} in NDJSON exports & JSON
+    lists of names in the cells of CSV exports (see 'recipe.export').
+    """
+    if isinstance(value, str):
+        value = orjson.loads(value) if value else []
+    if not isinstance(value, list):
+        return value
+    return [
+        item if isinstance(item, dict) else {'name': item}
+        for item in value
+    ]
+
+
+def read_records(path, file_format):
+    """
+    Yield the recipes of a file in the format of the exports, one dict
+    per recipe, or the error for a line that can't be read.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for record in csv.DictReader(file):
+                record = {
+                    name: export.unescape_csv_cell(value)
+                    if isinstance(value, str) else value
+                    for name, value in record.items()
+                }
+                try:
+                    for field in ('tags', 'ingredients'):
+                        if field in record:
+                            record[field] = _names(record[field])
+                except ValueError as exc:
+                    record = exc
+                yield record
+            return
+
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(_('Expected a JSON object.'))
+                for field in ('tags', 'ingredients'):
+                    if field in record:
+                        record[field] = _names(record[field])
+            except (ValueError, TypeError) as exc:
+                record = exc
+            yield record
+
+
+def _copy_value(value):
+    """Return a value in the text format of PostgreSQL's COPY."""
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class RecipeImporter:
+    """
+    Create the recipes of many users, a batch at a time.
+
+    Each record is validated with the 'RecipeDetailSerializer', like the
+    API does, and then a whole batch is written with a few queries:
+        - the tag & ingredient names are resolved to ids with a map per
+          user, loaded once with one query, so only new names hit the
+          database (with 'get_or_create_by_name'),
+        - the recipes & their links to the tags & ingredients are written
+          with PostgreSQL's COPY, or 'bulk_create' on other databases.
+    The ids of the imported records are ignored, the recipes are always
+    new ones.
+    """
+    relations = RecipeBulkWriter.relations
+
+    def __init__(self, default_user=None, use_copy=True):
+        self.default_user = default_user
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.users = {}
+        # One serializer validates all the records, its fields are built
+        # once instead of once per record, which took most of the time.
+        self.serializer = RecipeDetailSerializer()
+        # The ids of the tags & ingredients of the users, by name.
+        self.ids = {field: {} for field, model, column in self.relations}
+
+    def _get_user(self, email):
+        """Return the user with the email, from the map of users."""
+        if email not in self.users:
+            self.users[email] = get_user_model().objects.filter(
+                email=email,
+            ).first()
+        return self.users[email]
+
+    def validate(self, record):
+        """
+        Return the (user, validated data) of a record, or raise a
+        'ValidationError'.
+        """
+        if isinstance(record, Exception):
+            raise serializers.ValidationError({'non_field_errors': [
+                _('Not a valid record: %(error)s.') % {'error': record},
+            ]})
+
+        email = record.pop('user', None)
+        user = self._get_user(email) if email else self.default_user
+        if user is None:
+            raise serializers.ValidationError({'user': [
+                _('No user with this email.') if email
+                else _('No user given.'),
+            ]})
+
+        # The images aren't part of the exports, nor of an import.
+        record.pop('id', None)
+        record.pop('image', None)
+        return user, self.serializer.run_validation(record)
+
+    def _resolve(self, field, model, user, names):
+        """Return the ids of the tags or ingredients of a user, by name."""
+        ids = self.ids[field].get(user.pk)
+        if ids is None:
+            ids = dict(model.objects.filter(
+                user=user,
+            ).values_list('name', 'id'))
+            self.ids[field][user.pk] = ids
+
+        missing = set(names) - ids.keys()
+        if missing:
+            ids.update(
+                (name, obj.id) for name, obj in
+                get_or_create_by_name(model, user, missing).items()
+            )
+        return ids
+
+    def write(self, batch):
+        """Write a batch of (user, validated data) in one transaction."""
+        if not batch:
+            return
+
+        try:
+            self._write(batch)
+        except Exception:
+            # The names created in the failed transaction are gone too.
+            self.ids = {field: {} for field in self.ids}
+            raise
+
+    def _write(self, batch):
+        """Write the batch, see 'write()'."""
+        related = [field for field, model, column in self.relations]
+        with transaction.atomic():
+            recipes = [
+                Recipe(user=user, **{
+                    key: value for key, value in data.items()
+                    if key not in related
+                })
+                for user, data in batch
+            ]
+            self._insert_recipes(recipes)
+
+            for field, model, column in self.relations:
+                names = {}
+                for user, data in batch:
+                    names.setdefault(user, set()).update(
+                        obj['name'] for obj in data.get(field, [])
+                    )
+                ids = {
+                    user: self._resolve(field, model, user, user_names)
+                    for user, user_names in names.items()
+                    if user_names
+                }
+                links = {
+                    (recipe.id, ids[user][obj['name']])
+                    for (user, data), recipe in zip(batch, recipes)
+                    for obj in data.get(field, [])
+                }
+                self._insert_links(
+                    getattr(Recipe, field).through,
+                    column,
+                    sorted(links),
+                )
+
+            # Neither COPY nor 'bulk_create' send the model signals, so
+            # we let the receivers know ourselves.
+            recipe_ids = {}
+            for (user, data), recipe in zip(batch, recipes):
+                recipe_ids.setdefault(user, []).append(recipe.id)
+            for user, ids in recipe_ids.items():
+                recipes_bulk_written.send(
+                    sender=Recipe,
+                    user=user,
+                    recipe_ids=ids,
+                )
+
+    def _insert_recipes(self, recipes):
+        """Insert the recipes, setting their ids."""
+        if not self.use_copy:
+            Recipe.objects.bulk_create(recipes)
+            return
+
+        # COPY doesn't return the ids of the rows, so they're taken from
+        # the sequence of the table first.
+        table = Recipe._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [table, Recipe._meta.pk.column, len(recipes)],
+            )
+            for recipe, (recipe_id,) in zip(recipes, cursor.fetchall()):
+                recipe.id = recipe_id
+
+        fields = Recipe._meta.concrete_fields
+        self._copy(
+            table,
+            [field.column for field in fields],
+            (
+                # Like Django's inserts, e.g. 'pre_save' sets the
+                # 'auto_now' of 'modified_at'.
+                [
+                    field.get_db_prep_save(
+                        field.pre_save(recipe, True),
+                        connection,
+                    )
+                    for field in fields
+                ]
+                for recipe in recipes
+            ),
+        )
+
+    def _insert_links(self, through, column, links):
+        """Insert the (recipe id, tag or ingredient id) links."""
+        if not links:
+            return
+        if self.use_copy:
+            self._copy(through._meta.db_table, ['recipe_id', column], links)
+            return
+
+        through.objects.bulk_create([
+            through(recipe_id=recipe_id, **{column: target_id})
+            for recipe_id, target_id in links
+        ])
+
+    def _copy(self, table, columns, rows):
+        """Write the rows to the table with PostgreSQL's COPY."""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            quote(table),
+            ', '.join(quote(column) for column in columns),
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
@@ -0,0 +1,120 @@
+"""
+Django command to compare the serializers of the recipe list.
+"""
+import time
+from decimal import Decimal
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from recipe.serializers import FastRecipeListSerializer, RecipeSerializer
+
+
+class Command(BaseCommand):
+    """
+    Django command to time 'RecipeSerializer' against the fast serializer.
+
+    The recipes are created for a throwaway user inside a transaction that
+    is rolled back at the end, so nothing is left in the database. The
+    times include the queries, like in the view.
+    """
+    help = 'Compare the speed of the serializers of the recipe list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma separated numbers of recipes to list.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per size, the fastest one counts.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(
+            f'{"recipes":>8} {"serializer":>12} {"fast":>10} {"speedup":>8}'
+        )
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark@example.com',
+            )
+            created = 0
+            for size in sizes:
+                self._create_recipes(user, created, size - created)
+                created = max(created, size)
+                slow, fast = self._time(user, size, options['repeat'])
+                self.stdout.write(
+                    f'{size:>8} {slow * 1000:>10.1f}ms {fast * 1000:>8.1f}ms '
+                    f'{slow / fast:>7.1f}x'
+                )
+            transaction.set_rollback(True)
+
+    def _create_recipes(self, user, start, count):
+        """Create recipes with 3 tags & 3 ingredients each."""
+        if count <= 0:
+            return
+        tags = list(Tag.objects.filter(user=user)) or Tag.objects.bulk_create(
+            [Tag(user=user, name=f'Tag {i}') for i in range(20)]
+        )
+        ingredients = list(
+            Ingredient.objects.filter(user=user)
+        ) or Ingredient.objects.bulk_create(
+            [Ingredient(user=user, name=f'Ingredient {i}') for i in range(30)]
+        )
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=f'Recipe {start + i}',
+                time_minutes=i % 120,
+                price=Decimal(i % 500) / 10,
+                link=f'https://example.com/{start + i}',
+            )
+            for i in range(count)
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for i, recipe in enumerate(recipes)
+            for tag in tags[i % 17:i % 17 + 3]
+        ])
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient.id,
+            )
+            for i, recipe in enumerate(recipes)
+            for ingredient in ingredients[i % 27:i % 27 + 3]
+        ])
+
+    def _time(self, user, size, repeat):
+        """Return the best times of both serializers for 'size' recipes."""
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        prefetched = queryset.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.order_by('id'),
+            ),
+        )
+        fast_serializer = FastRecipeListSerializer()
+
+        slow = fast = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            RecipeSerializer(prefetched[:size], many=True).data
+            slow = min(slow, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            fast_serializer.to_representation(
+                fast_serializer.values(queryset)[:size],
+            )
+            fast = min(fast, time.perf_counter() - start)
+
+        return slow, fast
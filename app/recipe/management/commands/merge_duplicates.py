@@ -0,0 +1,105 @@
+"""
+Django command to merge the tags & ingredients that only differ by case
+or spaces, before the migration '0016_unique_normalized_names'.
+"""
+from core.models import Ingredient, Tag
+from core.signals import recipes_bulk_written
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipe.duplicates import (BATCH_SIZE, batches, duplicate_groups,
+                               has_unique_names, linked_recipe_ids,
+                               merge_groups)
+from recipe.snapshots import Snapshot
+
+
+class Command(BaseCommand):
+    """
+    Django command to merge the duplicate tags & ingredients of the users.
+
+    Each group of tags (or ingredients) of a user with the same normalized
+    name, e.g. 'Salt', 'salt' & 'salt ', is merged into its oldest one, a
+    batch of groups per transaction (see 'recipe.duplicates'), so it can
+    run while the app is up. The recipes, the stats & the caches of the
+    users are updated like after a bulk write.
+
+    It's meant to be run before the migration adding the unique
+    constraints of the normalized names, so the migration itself has
+    little to merge. Once a model has its constraint, it can't have any
+    duplicates: the model is skipped, and the command refuses to run
+    when both have it.
+    """
+    help = 'Merge the tags & ingredients that only differ by case or spaces.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='The number of groups merged per transaction.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the duplicates, without merging them.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        models = [
+            model for model in (Tag, Ingredient)
+            if not has_unique_names(model)
+        ]
+        if not models:
+            raise CommandError(
+                'The tags & ingredients have unique normalized names '
+                'already, there are no duplicates to merge.'
+            )
+
+        for model in (Tag, Ingredient):
+            name = model._meta.verbose_name_plural
+            if model not in models:
+                self.stdout.write(f'Skipped the {name}, their normalized '
+                                  f'names are unique already.')
+                continue
+            groups = list(duplicate_groups(model))
+            duplicates = sum(total - 1 for user_id, key, total in groups)
+            if options['dry_run']:
+                for user_id, key, total in groups:
+                    self.stdout.write(f'User {user_id}: {total} {name} '
+                                      f'named "{key}".')
+                self.stdout.write(self.style.SUCCESS(
+                    f'Found {duplicates} duplicate {name} in '
+                    f'{len(groups)} groups.'
+                ))
+                continue
+
+            for batch in batches(
+                [(user_id, key) for user_id, key, total in groups],
+                options['batch_size'],
+            ):
+                self._merge(model, batch)
+            self.stdout.write(self.style.SUCCESS(
+                f'Merged {duplicates} duplicate {name} in '
+                f'{len(groups)} groups.'
+            ))
+
+    def _merge(self, model, batch):
+        """Merge a batch of groups & let the receivers know."""
+        with transaction.atomic():
+            before = Snapshot(linked_recipe_ids(model, batch))
+            changed = merge_groups(model, batch)
+            users = get_user_model().objects.in_bulk(
+                {user_id for user_id, key in batch},
+            )
+            # The links are written without the model signals, like a bulk
+            # write: the receivers update the stats, the search index, the
+            # caches & the autocomplete once the batch is committed.
+            for user in users.values():
+                recipes_bulk_written.send(
+                    sender=model,
+                    user=user,
+                    recipe_ids=sorted(changed.get(user.pk, ())),
+                    before=before,
+                )
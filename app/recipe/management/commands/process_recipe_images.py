@@ -0,0 +1,45 @@
+"""
+Django command to make the missing renditions of the recipe images.
+"""
+from core.models import Recipe
+from django.core.management.base import BaseCommand
+
+from recipe.images import process_recipe_image
+
+
+class Command(BaseCommand):
+    """
+    Django command to process the recipe images without renditions.
+
+    The renditions are normally made in the background right after an
+    upload, this catches up on the images uploaded before that existed,
+    or whose task was lost, e.g. when the server restarted.
+    """
+    help = 'Make the missing renditions of the recipe images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Process every image again, not only the missing ones.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        recipes = Recipe.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+
+        processed = failed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            try:
+                process_recipe_image(recipe_id)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Recipe {recipe_id}: {error}')
+            else:
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images, {failed} failed.'
+        ))
@@ -0,0 +1,69 @@
+"""
+Django command to rebuild the statistics of the recipes of the users.
+"""
+from core.models import RecipeStats
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipe.stats import build, rebuild
+
+FIELDS = [
+    'recipe_count', 'total_time_minutes', 'total_price', 'price_buckets',
+    'tag_counts',
+]
+
+
+def _drift(current, built):
+    """Return the fields where the current stats differ from the built."""
+    if current is None:
+        return FIELDS
+    return [
+        field for field in FIELDS
+        if getattr(current, field) != getattr(built, field)
+    ]
+
+
+class Command(BaseCommand):
+    """
+    Django command to rebuild the recipe statistics of every user.
+
+    The statistics are kept up to date as the recipes change, this is
+    only needed after writing to the tables directly, e.g. with SQL. The
+    users whose statistics drifted from their recipes are reported.
+    """
+    help = 'Rebuild the statistics of the recipes of the users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report the drift, without fixing it.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        user_ids = get_user_model().objects.order_by('id').values_list(
+            'id',
+            flat=True,
+        )
+
+        total = 0
+        drifted = 0
+        for user_id in user_ids.iterator():
+            total += 1
+            current = RecipeStats.objects.filter(user_id=user_id).first()
+            if options['check']:
+                built = build(user_id)
+            else:
+                built = rebuild(user_id)
+            fields = _drift(current, built)
+            if fields:
+                drifted += 1
+                self.stdout.write(
+                    f'User {user_id}: {", ".join(fields)} drifted.'
+                )
+
+        verb = 'Checked' if options['check'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} the stats of {total} users, {drifted} drifted.'
+        ))
@@ -0,0 +1,44 @@
+"""
+Django command to rebuild the full-text search index of the recipes.
+"""
+from core.models import Recipe
+from django.core.management.base import BaseCommand
+
+from recipe.search import update_index
+
+
+class Command(BaseCommand):
+    """
+    Django command to rebuild the search index of every recipe.
+
+    The index is kept up to date as the recipes change, this is only
+    needed after writing to the tables directly, e.g. with SQL.
+    """
+    help = 'Rebuild the full-text search index of the recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='The number of recipes indexed with one query.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        batch_size = options['batch_size']
+        recipe_ids = Recipe.objects.order_by('id').values_list('id', flat=True)
+
+        batch = []
+        total = 0
+        for recipe_id in recipe_ids.iterator():
+            batch.append(recipe_id)
+            if len(batch) == batch_size:
+                update_index(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            update_index(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} recipes.'))
@@ -0,0 +1,42 @@
+"""
+Django command to count the recipes of the tags & ingredients again.
+"""
+from core.models import Ingredient, Tag
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipe.counts import actual_count, recount
+
+
+class Command(BaseCommand):
+    """
+    Django command to repair the 'recipe_count' of every tag & ingredient.
+
+    The counts are kept up to date as the recipes change, this is only
+    needed after writing to the tables directly, e.g. with SQL. The number
+    of tags & ingredients whose count drifted is reported.
+    """
+    help = 'Count the recipes of the tags & ingredients again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report the drift, without fixing it.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        for model in (Tag, Ingredient):
+            name = model._meta.verbose_name_plural
+            if options['check']:
+                drifted = model.objects.alias(
+                    actual=actual_count(model),
+                ).exclude(recipe_count=F('actual')).count()
+                verb = 'Checked'
+            else:
+                drifted = recount(model.objects.all())
+                verb = 'Repaired'
+            self.stdout.write(self.style.SUCCESS(
+                f'{verb} the {name}: {drifted} drifted.'
+            ))
@@ -0,0 +1,248 @@
+"""
+Pagination for the recipe APIs.
+"""
+import functools
+import json
+import operator
+from collections import OrderedDict
+
+from django.core import exceptions
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination that the client has to ask for.
+
+    Cursor pagination filters on the ordering column (e.g. 'id < 1234')
+    instead of using an OFFSET, so fetching page 500 costs the same as
+    fetching page 1, and it never runs a COUNT(*) over the whole table.
+
+    To keep the API backwards compatible, the response is only paginated
+    when the request has a 'page_size' or a 'cursor' query parameter.
+    Otherwise the full, unpaginated list is returned like before.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def is_requested(self, request):
+        """Return True if the client asked for a paginated response."""
+        return (
+            self.page_size_query_param in request.query_params
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate the queryset only if the client opted in."""
+        if not self.is_requested(request):
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(OptInCursorPagination):
+    """Cursor pagination for recipes, newest first."""
+    ordering = '-id'
+
+
+class RecipeAttrCursorPagination(OptInCursorPagination):
+    """
+    Cursor pagination for tags and ingredients, in the view's order.
+
+    The cursor of DRF only keeps the value of the first column of the
+    order, and skips the rows with the same value with an OFFSET, which it
+    caps at 'offset_cutoff': e.g. with the most used first, the unused
+    tags past the cap were never reached. This cursor keeps the values of
+    every column of the order, which ends with a unique one (the 'id'),
+    and the next page starts right after them, however many rows tie.
+    """
+    ordering = ('-name', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        # By name, or the most used first: the order the view asked for.
+        return getattr(view, 'ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if self.cursor is not None and self.cursor.position is not None:
+            position = self._decode_position(queryset, self.cursor.position)
+            queryset = queryset.filter(self._after(position, reverse))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            # Read backwards from the cursor, shown in the view's order.
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def _decode_position(self, queryset, position):
+        """
+        Return the values of the position of a cursor, each checked with
+        the field of the order it's a value of. Like DRF's
+        'decode_cursor()', a cursor that wasn't made by us is a 404.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        position = []
+        for field, value in zip(self.ordering, values):
+            # The columns of the order are never NULL, & their integers fit
+            # in 64 bits (Django knows no range on SQLite).
+            if (not isinstance(value, (str, int)) or isinstance(value, bool)
+                    or isinstance(value, int) and abs(value) >= 2 ** 63):
+                raise NotFound(self.invalid_cursor_message)
+            model_field = queryset.model._meta.get_field(field.lstrip('-'))
+            try:
+                # The type, & the range the database can store.
+                position.append(model_field.clean(value, None))
+            except exceptions.ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _after(self, position, reverse):
+        """
+        Return the filter of the rows after the position in the order, or
+        before it when 'reverse'.
+        """
+        after, same = [], Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            after.append(same & Q(**{f'{name}__{lookup}': value}))
+            same &= Q(**{name: value})
+        return functools.reduce(operator.or_, after)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([
+            getattr(instance, field.lstrip('-')) for field in ordering
+        ])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(
+            self.page[-1],
+            self.ordering,
+        )
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=position,
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(
+            self.page[0],
+            self.ordering,
+        )
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=True,
+            position=position,
+        ))
+
+
+class RecipeSearchPagination(BasePagination):
+    """
+    Offset pagination for the search results, best matches first.
+
+    The cursor pagination needs an exact value to continue from, which
+    the computed rank isn't, so the search results use an OFFSET instead.
+    Search results are rarely paged far, so the OFFSET stays cheap. Like
+    the cursor pagination, this never runs a COUNT(*): one extra row is
+    fetched to tell if there's a next page.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    offset_query_param = 'offset'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.offset = _positive_int(
+                request.query_params[self.offset_query_param],
+            )
+        except (KeyError, ValueError):
+            self.offset = 0
+        try:
+            self.page_size = _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            pass
+
+        results = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+
+        return results[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url,
+            self.offset_query_param,
+            self.offset + self.page_size,
+        )
+
+    def get_previous_link(self):
+        if not self.offset:
+            return None
+        url = self.request.build_absolute_uri()
+        offset = self.offset - self.page_size
+        if offset <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, offset)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
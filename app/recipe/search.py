@@ -0,0 +1,195 @@
+"""
+Full-text search over the recipes.
+
+The title, the description and the names of the tags & ingredients of
+each recipe are indexed:
+    - on PostgreSQL, in the 'search_vector' column of the recipe (a
+      'tsvector' with a GIN index), ranked with 'ts_rank',
+    - on SQLite (local development), in the 'core_recipe_search' FTS5
+      table, ranked with 'bm25'.
+Both are created by the migration '0012_recipe_search'.
+
+The index is updated when a recipe, or one of its tags or ingredients,
+changes (see 'recipe.signals'). The updates are collected until the
+transaction commits, so saving a recipe & setting its tags & ingredients
+updates its index once, not once per change. On PostgreSQL, saving an
+existing recipe computes its vector in the UPDATE of the save, so the
+row isn't written a second time for it.
+"""
+import re
+import threading
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+
+# The words of the title weigh the most, then the tags & ingredients.
+# '{title}', '{description}' & '{id}' are the columns, or parameters, of
+# the recipe.
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('english', {title}), 'A')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(tag.name, ' ')
+        FROM core_recipe_tags link
+        JOIN core_tag tag ON tag.id = link.tag_id
+        WHERE link.recipe_id = {id}
+    ), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM core_recipe_ingredients link
+        JOIN core_ingredient ingredient
+            ON ingredient.id = link.ingredient_id
+        WHERE link.recipe_id = {id}
+    ), '')), 'B')
+    || setweight(to_tsvector('english', {description}), 'C')
+"""
+
+POSTGRES_UPDATE = """
+    UPDATE core_recipe SET search_vector = {vector}
+    WHERE id = ANY(%s)
+""".format(vector=POSTGRES_VECTOR.format(
+    title='title',
+    description='description',
+    id='core_recipe.id',
+))
+
+SQLITE_DELETE = 'DELETE FROM core_recipe_search WHERE rowid IN ({ids})'
+
+SQLITE_INSERT = """
+    INSERT INTO core_recipe_search (
+        rowid, title, description, tags, ingredients
+    )
+    SELECT
+        recipe.id,
+        recipe.title,
+        recipe.description,
+        coalesce((
+            SELECT group_concat(tag.name, ' ')
+            FROM core_recipe_tags link
+            JOIN core_tag tag ON tag.id = link.tag_id
+            WHERE link.recipe_id = recipe.id
+        ), ''),
+        coalesce((
+            SELECT group_concat(ingredient.name, ' ')
+            FROM core_recipe_ingredients link
+            JOIN core_ingredient ingredient
+                ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = recipe.id
+        ), '')
+    FROM core_recipe recipe
+    WHERE recipe.id IN ({ids})
+"""
+
+# The weights of the columns of the FTS5 table, in the same order.
+SQLITE_RANK = """
+    SELECT -bm25(core_recipe_search, 10.0, 2.0, 5.0, 5.0)
+    FROM core_recipe_search
+    WHERE core_recipe_search MATCH %s AND rowid = core_recipe.id
+"""
+
+SQLITE_MATCHES = """
+    SELECT rowid FROM core_recipe_search WHERE core_recipe_search MATCH %s
+"""
+
+# SQLite limits the number of parameters of one query.
+CHUNK_SIZE = 500
+
+_pending = threading.local()
+
+
+def update_index(recipe_ids):
+    """Update the index of the recipes, removing the deleted ones."""
+    recipe_ids = list(recipe_ids)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_UPDATE, [recipe_ids])
+        elif connection.vendor == 'sqlite':
+            for start in range(0, len(recipe_ids), CHUNK_SIZE):
+                chunk = recipe_ids[start:start + CHUNK_SIZE]
+                ids = ', '.join(['%s'] * len(chunk))
+                cursor.execute(SQLITE_DELETE.format(ids=ids), chunk)
+                cursor.execute(SQLITE_INSERT.format(ids=ids), chunk)
+
+
+def set_vector(recipe, update_fields=None):
+    """
+    Make saving an existing recipe compute its 'search_vector' in the
+    same UPDATE, on PostgreSQL, rather than writing the row again once
+    the transaction commits. Returns True if it does.
+
+    The values of the SET clause are the ones of the row before the
+    UPDATE, so the new title & description are parameters.
+    """
+    if (connection.vendor != 'postgresql' or recipe._state.adding
+            or update_fields is not None
+            and 'search_vector' not in update_fields):
+        return False
+
+    recipe.search_vector = RawSQL(POSTGRES_VECTOR.format(
+        title='%s',
+        description='%s',
+        id='%s',
+    ), [recipe.title, recipe.pk, recipe.pk, recipe.description])
+    return True
+
+
+def _flush():
+    """Update the index of the recipes changed in the transaction."""
+    recipe_ids = _pending.recipe_ids
+    _pending.recipe_ids = set()
+    if recipe_ids:
+        update_index(recipe_ids)
+
+
+def schedule_update(recipe_ids):
+    """Update the index of the recipes when the transaction commits."""
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    # Only the first of the callbacks has anything left to do.
+    transaction.on_commit(_flush)
+
+
+def _words(text):
+    """
+    Return the words of the text, without any punctuation.
+
+    Only the words are kept, so the search operators typed by a user
+    (e.g. 'NOT', '&' or a lone quote) can't make the query invalid.
+    """
+    return re.findall(r'\w+', text)
+
+
+def search(queryset, text):
+    """
+    Filter the recipes matching all the words of 'text', annotated with
+    their 'rank'. Every word matches as a prefix, so results show up while
+    the last word is still being typed.
+    """
+    words = _words(text)
+    if not words:
+        return queryset.none().annotate(rank=Value(0.0))
+
+    # The database the recipes are read from, e.g. a replica.
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            config='english',
+            search_type='raw',
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+        )
+
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(
+            id__in=RawSQL(SQLITE_MATCHES, [match]),
+        ).annotate(rank=RawSQL(SQLITE_RANK, [match]))
+
+    # Other databases get an unranked, unindexed search.
+    return queryset.filter(
+        Q(title__icontains=text) | Q(description__icontains=text),
+    ).annotate(rank=Value(0.0))
@@ -2,11 +2,92 @@
 Serializers for recipe APIs
 """
 
-from core.models import Ingredient, Recipe, Tag
+from core.models import Ingredient, Recipe, Tag, normalize_name
+from core.signals import touch_user
+from core.tasks import run_after_commit
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.utils.translation import gettext as _
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
+from recipe import images
 
-class IngredientSerializer(serializers.ModelSerializer):
+
+def get_or_create_by_name(model, user, names):
+    """
+    Get or create the tags or ingredients of 'user' called 'names'.
+
+    Instead of a 'get_or_create' per name, all the existing objects are
+    fetched with one query and the missing ones are created with one
+    bulk insert. The names are matched by their normalized form, so
+    'salt ' gets the user's 'Salt' rather than a new ingredient. Returns
+    a dictionary of name -> object.
+    """
+    keys = {name: normalize_name(name) for name in names}
+    if not keys:
+        return {}
+
+    objs = {
+        obj.normalized_name: obj
+        for obj in model.objects.filter(
+            user=user,
+            normalized_name__in=set(keys.values()),
+        )
+    }
+    # The first spelling of a new name is the one created.
+    missing = {}
+    for name, key in keys.items():
+        if key not in objs:
+            missing.setdefault(key, name)
+    if missing:
+        # If another request created the same name at the same time,
+        # the unique constraint makes the database skip our row
+        # instead of storing a duplicate...
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing.values()],
+            ignore_conflicts=True,
+        )
+        # 'bulk_create' doesn't send 'post_save', so the new names are
+        # marked as modified here, for the autocomplete indexes...
+        touch_user(user.pk, names=True)
+        # ...which also means the primary keys aren't set on the
+        # objects we created, so we read the missing ones back.
+        objs.update(
+            (obj.normalized_name, obj)
+            for obj in model.objects.filter(
+                user=user,
+                normalized_name__in=missing,
+            )
+        )
+
+    return {name: objs[key] for name, key in keys.items()}
+
+
+class UniqueNameMixin:
+    """Reject renaming a tag or ingredient to a name the user has."""
+
+    def validate_name(self, value):
+        """Check no other object of the user already has this name."""
+        # Only renames through the tag & ingredient endpoints have an
+        # instance, the nested serializers of a recipe look names up
+        # instead, so for them an existing name is perfectly fine.
+        if self.instance is None:
+            return value
+
+        duplicate = type(self.instance).objects.filter(
+            user=self.instance.user_id,
+            normalized_name=normalize_name(value),
+        ).exclude(pk=self.instance.pk)
+        if duplicate.exists():
+            msg = _('You already have one with this name!')
+            raise serializers.ValidationError(msg, code='unique')
+
+        return value
+
+
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -15,7 +96,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for tags."""
 
     class Meta:
@@ -24,7 +105,47 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+# The counts are only shown by the tag & ingredient endpoints: the tags of
+# a recipe are cached with the recipe, which doesn't change when another
+# recipe gets the same tag.
+class IngredientUsageSerializer(IngredientSerializer):
+    """Serializer for ingredients, with the number of their recipes."""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = IngredientSerializer.Meta.read_only_fields + [
+            'recipe_count',
+        ]
+
+
+class TagUsageSerializer(TagSerializer):
+    """Serializer for tags, with the number of their recipes."""
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = TagSerializer.Meta.read_only_fields + [
+            'recipe_count',
+        ]
+
+
+class SparseFieldsMixin:
+    """
+    Render only the fields named in the 'fields' of the context.
+
+    The view fills it in from the '?fields=' & '?expand=' of the request,
+    the fields left out aren't serialized at all. This only affects the
+    response, all the fields can still be written.
+    """
+
+    @property
+    def _readable_fields(self):
+        fields = self.context.get('fields')
+        for field in super()._readable_fields:
+            if fields is None or field.field_name in fields:
+                yield field
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
     # Now, we'll get to work with our TagSerializer in this serializer
     # it's kind of similar to a ForeignKey relationship in models.
@@ -43,45 +164,59 @@ class RecipeSerializer(serializers.ModelSerializer):
     # NAMED THIS METHOD WITH UNDERSCORE, CAUSE WE
     # INTENT TO USE IT INTERNALLY ONLY!
     # I.E. IT'S USED BY ONLY THIS SPECIFIC "RecipeSerializer" SERIALIZER.
-    def _get_or_create_tags(self, tags, recipe):
+    def _get_or_create_by_name(self, model, items):
         """
-        Handle getting or creating tags as needed.
-        i.e -> Get a tag or create one
+        Get or create the tags or ingredients named in 'items'.
+        The objects are returned in the order given.
         """
-        # Next, let's get our (authenticated) user requesting the serializer
-        auth_user = self.context['request'].user
-
-        # Next, we'll create a for loop
-        for tag in tags:
-            # Let's call 'get_or_create', which get's or creates a value
-            # depending whether it's already in our database
-            # THE FUNCTIONALITY TO NOT CREATE DUPLICATE TAGS IN OUR SYSTEM!
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                # Instead of writing name=tag['name'], we write it
-                # this way, because, if in the future we want the tags
-                # to have some other fields than just name, this
-                # functionality supports that.
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
+        # 'dict.fromkeys' drops duplicate names but keeps their order.
+        names = list(dict.fromkeys(item['name'] for item in items))
+        objs = get_or_create_by_name(
+            model,
+            self.context['request'].user,
+            names,
+        )
 
-    # NAMED THIS METHOD WITH UNDERSCORE, CAUSE WE
-    # INTENT TO USE IT INTERNALLY ONLY!
-    # I.E. IT'S USED BY ONLY THIS SPECIFIC "RecipeSerializer" SERIALIZER.
-    def _get_or_create_ingredients(self, ingredients, recipe):
+        return [objs[name] for name in names]
+
+    def _set_related(self, manager, objs, new=False):
         """
-        Handle getting or creating ingredients as needed.
-        i.e -> Get an ingredient or create one
+        Make 'objs' the only objects linked through 'manager'.
+
+        Only the difference is written: links that already exist are
+        left alone, so updating a recipe doesn't delete and re-insert
+        every row of the through table. A 'new' recipe has no links yet,
+        so they aren't read.
         """
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, create = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        # 'all()' reuses the prefetched objects, when the view has
+        # prefetched them, so this doesn't need a query of its own.
+        current = set() if new else {obj.pk for obj in manager.all()}
+        wanted = {obj.pk for obj in objs}
+
+        if current - wanted:
+            manager.remove(*(current - wanted))
+        if wanted - current:
+            manager.add(*(wanted - current))
+
+    def _set_tags(self, tags, recipe, new=False):
+        """Handle getting or creating tags and assign them to recipe."""
+        self._set_related(
+            recipe.tags,
+            self._get_or_create_by_name(Tag, tags),
+            new=new,
+        )
 
+    def _set_ingredients(self, ingredients, recipe, new=False):
+        """Handle getting or creating ingredients and assign them."""
+        self._set_related(
+            recipe.ingredients,
+            self._get_or_create_by_name(Ingredient, ingredients),
+            new=new,
+        )
+
+    # The recipe and its tags & ingredients are saved in one transaction,
+    # so a failure half way through doesn't leave a partial recipe.
+    @transaction.atomic
     def create(self, validated_data):
         """Create a recipe."""
         # First, let's assign all tags from data, and assign it to a
@@ -91,32 +226,34 @@ class RecipeSerializer(serializers.ModelSerializer):
         # Then, with rest of the data (excluding tags), we'll create a new
         # recipe with those values
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        self._set_tags(tags, recipe, new=True)
+        self._set_ingredients(ingredients, recipe, new=True)
 
         return recipe
 
     # Because we're updating an instance, we need to
     # have 'instance' as a parameter.
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update recipe."""
         # Let's store the tags in 'tags' variable &
         # if there are no tags set it to 'None'
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
-        # If the 'tags' variable contains tags, we'll clear them and call our
-        # '_get_or_create_tags' function
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
+        # The recipe is saved first, which marks it as modified, so
+        # changing its tags & ingredients doesn't mark it again (see
+        # 'core.signals').
         instance.save()
+        # If the 'tags' variable contains tags (or an empty list), we'll
+        # replace the tags of the recipe with them.
+        if tags is not None:
+            self._set_tags(tags, instance)
+        if ingredients is not None:
+            self._set_ingredients(ingredients, instance)
+
         return instance
 
 
@@ -131,8 +268,43 @@ class RecipeDetailSerializer(RecipeSerializer):
     NOW, WE CAN AVOID DUPLICATE CODE!
     """
 
+    image_renditions = serializers.SerializerMethodField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description',
+            'image',
+            'image_width',
+            'image_height',
+            'image_size',
+            'image_renditions',
+        ]
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'image_width',
+            'image_height',
+            'image_size',
+        ]
+
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_image_renditions(self, recipe):
+        """
+        Return the renditions of the image with the URLs of their files,
+        e.g. {'thumbnail': {'width': 160, 'height': 120, 'webp': URL,
+        'jpeg': URL}, ...}. Empty until the image has been processed.
+        """
+        request = self.context.get('request')
+        storage = recipe.image.storage
+        renditions = {}
+        for name, rendition in recipe.image_renditions.items():
+            renditions[name] = dict(rendition)
+            for ext in images.FORMATS:
+                if ext in rendition:
+                    url = storage.url(rendition[ext])
+                    if request is not None:
+                        url = request.build_absolute_uri(url)
+                    renditions[name][ext] = url
+
+        return renditions
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
@@ -143,3 +315,218 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+    def update(self, instance, validated_data):
+        """
+        Save the new image & make its renditions in the background.
+
+        Resizing a big photo takes long enough to slow down the upload
+        noticeably, so the request only stores the original.
+        """
+        old_renditions = instance.image_renditions
+        instance.image_width = None
+        instance.image_height = None
+        instance.image_size = None
+        instance.image_renditions = {}
+        instance = super().update(instance, validated_data)
+
+        if old_renditions:
+            run_after_commit(
+                images.delete_renditions,
+                instance.image.storage,
+                old_renditions,
+            )
+        run_after_commit(images.process_recipe_image, instance.id)
+
+        return instance
+
+
+class FastRecipeListSerializer:
+    """
+    Read-only serializer for lists of recipes, as fast as we can make it.
+
+    'RecipeSerializer' calls the 'to_representation' of every field of
+    every recipe, and of every tag & ingredient nested in them, which is
+    where most of the time of a long list goes. This builds the exact same
+    output (see 'recipe/tests/test_fast_list.py') from 'values()' rows, and
+    reads the tags & ingredients of all the recipes with one query. Only
+    the fields whose value needs formatting, like the price, still go
+    through their serializer field.
+    """
+    # The nested fields & the column of the through table they use.
+    nested = {
+        'tags': 'tag',
+        'ingredients': 'ingredient',
+    }
+    # The serializer whose output this one reproduces.
+    serializer_class = RecipeSerializer
+    # The number of recipes 'chunks()' reads at once.
+    chunk_size = 500
+
+    def __init__(self, fields=None):
+        self.fields = [
+            name for name in self.serializer_class.Meta.fields
+            if fields is None or name in fields
+        ]
+        # The values from the database are already what these would
+        # return, so calling them would only cost time.
+        plain = (serializers.IntegerField, serializers.CharField)
+        self.formatters = {
+            name: field.to_representation
+            for name, field in self.serializer_class().fields.items()
+            if name in self.fields
+            and name not in self.nested
+            and not isinstance(field, plain)
+        }
+
+    def values(self, queryset):
+        """Return the queryset as the rows this serializer needs."""
+        columns = [name for name in self.fields if name not in self.nested]
+        if 'id' not in columns:
+            # The id groups the tags & ingredients by recipe.
+            columns.append('id')
+        # The prefetches are done by 'to_representation' instead.
+        return queryset.prefetch_related(None).values(*columns)
+
+    def _fetch_nested(self, recipe_ids):
+        """
+        Return the tags & ingredients of the recipes, grouped by recipe:
+        {'tags': {recipe_id: [{'id': 1, 'name': 'Vegan'}, ...]}, ...}
+        """
+        nested = {name: {} for name in self.nested}
+        queries = [
+            getattr(Recipe, name).through.objects.filter(
+                recipe_id__in=recipe_ids,
+            ).annotate(
+                kind=Value(name, output_field=CharField()),
+                related_id=F(f'{column}_id'),
+                related_name=F(f'{column}__name'),
+            ).values_list('kind', 'recipe_id', 'related_id', 'related_name')
+            for name, column in self.nested.items()
+            if name in self.fields
+        ]
+        if not queries or not recipe_ids:
+            return nested
+
+        # Both are read with one query. It's sorted here rather than with
+        # ORDER BY, which makes SQLite sort the whole union on disk.
+        rows = sorted(
+            queries[0].union(*queries[1:], all=True),
+            key=lambda row: row[2],
+        )
+        # In the same order as the prefetches of the view, so the output
+        # is the same too.
+        for kind, recipe_id, related_id, related_name in rows:
+            nested[kind].setdefault(recipe_id, []).append({
+                'id': related_id,
+                'name': related_name,
+            })
+
+        return nested
+
+    def chunks(self, rows):
+        """
+        Yield the list of recipes for the rows from 'values()' in chunks,
+        newest first, reading one chunk at a time from the database.
+
+        Every chunk starts after the id the previous one ended with, so
+        no chunk is slower than the first, unlike with an OFFSET.
+        """
+        rows = rows.order_by('-id')
+        chunk = list(rows[:self.chunk_size])
+        while chunk:
+            yield self.to_representation(chunk)
+            if len(chunk) < self.chunk_size:
+                # That was the last one, no need to ask for more.
+                return
+            rows_after = rows.filter(id__lt=chunk[-1]['id'])
+            chunk = list(rows_after[:self.chunk_size])
+
+    def to_representation(self, rows):
+        """Return the list of recipes for the rows from 'values()'."""
+        rows = list(rows)
+        nested = self._fetch_nested([row['id'] for row in rows])
+
+        data = []
+        for row in rows:
+            recipe = {}
+            for name in self.fields:
+                if name in nested:
+                    recipe[name] = nested[name].get(row['id'], [])
+                    continue
+                value = row[name]
+                if value is not None and name in self.formatters:
+                    value = self.formatters[name](value)
+                recipe[name] = value
+            data.append(recipe)
+
+        return data
+
+
+class RecipeExportSerializer(FastRecipeListSerializer):
+    """
+    Fast serializer for the exports of the recipes, with the fields of
+    the list & the description. The image fields are left out, an export
+    is data, not a copy of the uploaded files.
+    """
+    serializer_class = RecipeDetailSerializer
+
+    def __init__(self):
+        super().__init__(RecipeSerializer.Meta.fields + ['description'])
+
+
+class RecipeBulkResultSerializer(serializers.Serializer):
+    """Serializer for the result of one item of a bulk recipe write."""
+    index = serializers.IntegerField()
+    id = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(
+        choices=['created', 'updated'],
+        required=False,
+    )
+    errors = serializers.DictField(required=False)
+
+
+class PriceBucketSerializer(serializers.Serializer):
+    """Serializer for the recipes of a price range, 'max_price' excluded."""
+    min_price = serializers.DecimalField(max_digits=5, decimal_places=2)
+    max_price = serializers.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        allow_null=True,
+    )
+    recipe_count = serializers.IntegerField()
+
+
+class TopTagSerializer(serializers.Serializer):
+    """Serializer for a tag & its number of recipes."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Serializer for the statistics of the recipes of a user."""
+    recipe_count = serializers.IntegerField()
+    average_time_minutes = serializers.FloatField(allow_null=True)
+    average_price = serializers.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        allow_null=True,
+    )
+    price_distribution = PriceBucketSerializer(many=True)
+    top_tags = TopTagSerializer(many=True)
+    updated_at = serializers.DateTimeField()
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serializer for an ingredient of a shopping list."""
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient__name')
+    recipe_count = serializers.IntegerField()
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    """Serializer for the statistics of the response cache."""
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_ratio = serializers.FloatField()
@@ -0,0 +1,287 @@
+"""
+Signals of the recipe app.
+"""
+import functools
+
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+from core.signals import recipes_bulk_written
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipe import autocomplete, cache, counts, search, snapshots, stats
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_write(sender, instance, **kwargs):
+    """Invalidate the cached responses of the owner of the object."""
+    cache.invalidate_user(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_m2m_change(sender, instance, action, **kwargs):
+    """Invalidate the cached responses when recipe links change."""
+    # 'instance' is a recipe, or a tag or ingredient when the change is
+    # made from the other side (e.g. 'tag.recipe_set.add(recipe)').
+    if action.startswith('post_'):
+        cache.invalidate_user(instance.user_id)
+
+
+@receiver(recipes_bulk_written)
+def invalidate_on_bulk_write(sender, user, **kwargs):
+    """Invalidate the cached responses after a bulk write."""
+    cache.invalidate_user(user.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_new_user(sender, instance, created, **kwargs):
+    """
+    Start a new user with an empty cache.
+
+    A database can reuse the id of a deleted user, and the new user must
+    not see the cached responses of the old one.
+    """
+    if created:
+        cache.invalidate_user(instance.pk)
+
+
+@receiver(pre_save, sender=Recipe)
+def index_on_save(sender, instance, update_fields, **kwargs):
+    """Index an existing recipe with the save, when the database can."""
+    instance._indexed_on_save = search.set_vector(instance, update_fields)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    """Update the search index of a saved recipe."""
+    if not instance._indexed_on_save:
+        search.schedule_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def index_deleted_recipe(sender, instance, **kwargs):
+    """Remove a deleted recipe from the search index."""
+    search.schedule_update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the search index when the links of recipes change."""
+    if not reverse:
+        if action.startswith('post_'):
+            search.schedule_update([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        search.schedule_update(pk_set)
+    elif action == 'pre_clear':
+        search.schedule_update(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def index_on_rename(sender, instance, created, **kwargs):
+    """Update the search index of the recipes of a renamed tag."""
+    if not created:
+        search.schedule_update(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def index_on_delete(sender, instance, **kwargs):
+    """Update the search index of the recipes of a deleted tag."""
+    # The links are gone by the time the index is updated.
+    search.schedule_update(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(recipes_bulk_written)
+def index_on_bulk_write(sender, recipe_ids, **kwargs):
+    """Update the search index of the recipes written in bulk."""
+    search.schedule_update(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def autocomplete_on_write(sender, instance, **kwargs):
+    """Rebuild the autocomplete index after a tag is saved or deleted."""
+    transaction.on_commit(functools.partial(
+        autocomplete.rebuild,
+        sender,
+        instance.user_id,
+    ))
+
+
+@receiver(post_save, sender=get_user_model())
+def stats_for_new_user(sender, instance, created, using, **kwargs):
+    """Start a new user with empty stats, instead of building them."""
+    if created:
+        RecipeStats.objects.using(using).create(user=instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def stats_before_save(sender, instance, update_fields, **kwargs):
+    """Remember the time & price of a recipe before they change."""
+    instance._stats_old = None
+    if instance._state.adding or (
+        update_fields is not None
+        and not {'time_minutes', 'price'} & set(update_fields)
+    ):
+        return
+    loaded = getattr(instance, '_stats_loaded', (None, None))
+    if None in loaded:
+        # Not loaded, or deferred.
+        loaded = Recipe.objects.filter(pk=instance.pk).values_list(
+            'time_minutes',
+            'price',
+        ).first()
+    instance._stats_old = loaded
+
+
+@receiver(post_save, sender=Recipe)
+def stats_on_save(sender, instance, created, **kwargs):
+    """Count a new recipe, or the new time & price of a recipe."""
+    new = (instance.time_minutes, instance.price)
+    if created:
+        stats.add_recipe(instance.user_id, *new)
+    elif getattr(instance, '_stats_old', None) is not None:
+        stats.change_recipe(instance.user_id, instance._stats_old, new)
+    # The values the next save changes.
+    instance._stats_loaded = new
+
+
+@receiver(pre_delete, sender=Recipe)
+def links_before_delete(sender, instance, **kwargs):
+    """
+    Remember the tags & ingredients of a recipe, their links are deleted
+    first.
+    """
+    instance._deleted_tag_ids = list(
+        instance.tags.values_list('id', flat=True)
+    )
+    instance._deleted_ingredient_ids = list(
+        instance.ingredients.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def stats_on_delete(sender, instance, **kwargs):
+    """Stop counting a deleted recipe."""
+    stats.add_recipe(
+        instance.user_id,
+        instance.time_minutes,
+        instance.price,
+        getattr(instance, '_deleted_tag_ids', ()),
+        sign=-1,
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def stats_on_tags_change(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Count the recipes of the tags added to, or removed from, recipes."""
+    sign = -1 if action in ('post_remove', 'post_clear') else 1
+    if not reverse:
+        # 'instance' is the recipe, & 'pk_set' has the ids of the tags.
+        if action == 'pre_clear':
+            instance._stats_cleared = list(
+                instance.tags.values_list('id', flat=True)
+            )
+        elif action == 'post_clear':
+            stats.add_tags(instance.user_id, {
+                tag_id: -1 for tag_id in instance._stats_cleared
+            })
+        elif action in ('post_add', 'post_remove'):
+            stats.add_tags(instance.user_id, {
+                tag_id: sign for tag_id in pk_set
+            })
+    else:
+        # 'instance' is the tag, & 'pk_set' has the ids of the recipes.
+        if action == 'pre_clear':
+            instance._stats_cleared = instance.recipe_set.count()
+        elif action == 'post_clear':
+            stats.add_tags(instance.user_id, {
+                instance.pk: -instance._stats_cleared,
+            })
+        elif action in ('post_add', 'post_remove'):
+            stats.add_tags(instance.user_id, {
+                instance.pk: sign * len(pk_set),
+            })
+
+
+@receiver(pre_delete, sender=Tag)
+def stats_on_tag_delete(sender, instance, **kwargs):
+    """Stop counting the recipes of a deleted tag."""
+    stats.remove_tag(instance.user_id, instance.pk)
+
+
+@receiver(recipes_bulk_written)
+def stats_on_bulk_write(sender, user, recipe_ids, before=None, **kwargs):
+    """
+    Count what a bulk write changed in the stats & in the counts of the
+    tags & ingredients, from the snapshot of the recipes taken before it.
+    """
+    snapshots.add_changes(user.pk, recipe_ids, before)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_on_delete(sender, instance, **kwargs):
+    """Stop counting a deleted recipe in its tags & ingredients."""
+    counts.remove_recipe(
+        instance.user_id,
+        getattr(instance, '_deleted_tag_ids', ()),
+        getattr(instance, '_deleted_ingredient_ids', ()),
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_on_m2m_change(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    """Count the recipes of the tags & ingredients as the links change."""
+    sign = -1 if action in ('post_remove', 'post_clear') else 1
+    if not reverse:
+        # 'instance' is the recipe, 'model' the tag or ingredient model, &
+        # 'pk_set' has their ids.
+        if action == 'pre_clear':
+            instance._counts_cleared = list(
+                sender.objects.filter(recipe=instance).values_list(
+                    f'{model._meta.model_name}_id',
+                    flat=True,
+                )
+            )
+        elif action == 'post_clear':
+            counts.add(model, instance.user_id, {
+                pk: -1 for pk in instance._counts_cleared
+            })
+        elif action in ('post_add', 'post_remove'):
+            counts.add(model, instance.user_id, {
+                pk: sign for pk in pk_set
+            })
+    else:
+        # 'instance' is the tag or ingredient, & 'pk_set' has the ids of
+        # the recipes.
+        if action == 'pre_clear':
+            instance._counts_cleared = instance.recipe_set.count()
+        elif action == 'post_clear':
+            counts.add(type(instance), instance.user_id, {
+                instance.pk: -instance._counts_cleared,
+            })
+        elif action in ('post_add', 'post_remove'):
+            counts.add(type(instance), instance.user_id, {
+                instance.pk: sign * len(pk_set),
+            })
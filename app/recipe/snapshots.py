@@ -0,0 +1,64 @@
+"""
+Snapshots of recipes, to count what a bulk write changed.
+
+The bulk writes (see 'core.signals.recipes_bulk_written') skip the model
+signals which keep the stats & the counts of the tags & ingredients up to
+date. So the sender takes a snapshot of the recipes it's about to change,
+& the receiver takes another one of the same recipes once they're
+written: the difference is added to the stats & the counts, like any
+other change, when the transaction commits. Both snapshots only read the
+recipes of the write, so each batch of a large import costs the same,
+rather than counting all the recipes of the user again every time.
+"""
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+
+from recipe import counts, stats
+
+
+class Snapshot:
+    """
+    The totals of some recipes, by user id: their stats (see
+    'recipe.stats'), with the number of them linked to each tag, & the
+    number of them linked to each ingredient.
+    """
+
+    def __init__(self, recipe_ids=(), user_id=None):
+        self.recipe_ids = set(recipe_ids)
+        self.stats, self.ingredients = {}, {}
+        if not self.recipe_ids:
+            return
+
+        recipes = Recipe.objects.filter(pk__in=self.recipe_ids)
+        if user_id is not None:
+            recipes = recipes.filter(user_id=user_id)
+        self.stats = stats.totals(recipes)
+        self.ingredients = counts.totals(Ingredient, recipes)
+
+
+def _difference(new, old):
+    """Return 'new - old' of two dicts of numbers, without the zeros."""
+    keys = new.keys() | old.keys()
+    return {
+        key: new.get(key, 0) - old.get(key, 0) for key in keys
+        if new.get(key, 0) != old.get(key, 0)
+    }
+
+
+def add_changes(user_id, recipe_ids, before=None):
+    """
+    Count what changed in the recipes of the user since the snapshot
+    'before' (of the recipes that existed before the write), & in the new
+    ones with 'recipe_ids', once the transaction commits.
+    """
+    before = before or Snapshot()
+    after = Snapshot(before.recipe_ids | set(recipe_ids), user_id)
+
+    old = before.stats.get(user_id) or RecipeStats(user_id=user_id)
+    new = after.stats.get(user_id) or RecipeStats(user_id=user_id)
+    stats.add_difference(user_id, old, new)
+    tags = _difference(new.tag_counts, old.tag_counts)
+    counts.add(Tag, user_id, {int(pk): number for pk, number in tags.items()})
+    counts.add(Ingredient, user_id, _difference(
+        after.ingredients.get(user_id, {}),
+        before.ingredients.get(user_id, {}),
+    ))
@@ -0,0 +1,324 @@
+"""
+The statistics of the recipes of each user.
+
+They're kept in a 'RecipeStats' row per user, changed by the receivers of
+'recipe.signals' as the recipes change, so reading them doesn't go
+through the recipes:
+    - the number of recipes, & the sums of their times & prices, for the
+      averages,
+    - the number of recipes in each price bucket ('PRICE_BUCKETS'),
+    - the number of recipes of each tag.
+
+Each change is applied once its transaction commits, like the updates of
+the search index, so a rolled back change isn't counted, and the row isn't
+locked for the whole transaction of the change: only while it's changed,
+so concurrent changes add up. The changes of a transaction are applied
+together, so e.g. a new recipe & its tags lock & save the row once. The
+bulk writes, which skip the model signals, count the difference between
+snapshots of their recipes (see 'recipe.snapshots'). A user without a row
+yet (e.g. from before the table existed) gets one built from the recipes
+on the first read; until then, the changes are skipped. The writes that
+skip the model signals, e.g. with SQL, can make them drift (so can a
+change committed while the first read builds them): 'rebuild_recipe_stats'
+builds them all again.
+"""
+import bisect
+import threading
+from decimal import ROUND_HALF_UP, Decimal
+
+from core.models import Recipe, RecipeStats, Tag
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+
+# The upper bounds of the price buckets, the last bucket has none.
+PRICE_BUCKETS = (
+    Decimal(5), Decimal(10), Decimal(20), Decimal(50), Decimal(100),
+)
+
+# The number of tags in the 'top_tags' of the stats.
+TOP_TAGS = 10
+
+# The updates waiting for the transaction of the thread, see '_update()'.
+_pending = threading.local()
+
+
+def price_bucket(price):
+    """Return the index of the bucket of a price."""
+    return bisect.bisect_right(PRICE_BUCKETS, Decimal(str(price)))
+
+
+def _add(counts, key, number):
+    """Add to a count of a JSON field, dropping it when it's down to 0."""
+    key = str(key)
+    counts[key] = counts.get(key, 0) + number
+    if counts[key] <= 0:
+        del counts[key]
+
+
+class _Updates:
+    """
+    The updates of the stats of a user made in the same transaction (&
+    savepoint), applied together when it commits.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.updates = []
+        self.applied = False
+
+    def __call__(self):
+        self.applied = True
+        _apply(self.user_id, self.updates)
+
+
+def _update(user_id, update):
+    """
+    Call 'update(stats)' on the locked stats of the user, & save them,
+    when the transaction commits. Nothing is done if the user has no
+    stats yet.
+
+    The updates made in the same transaction, e.g. of a new recipe & of
+    its tags, lock & save the row once.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _apply(user_id, [update])
+        return
+
+    # Django starts a new list of the callbacks when a transaction ends or
+    # a savepoint is rolled back, so the updates are never added to the
+    # callback of an earlier transaction, nor to a discarded one. The
+    # callbacks of the savepoints are separate, so they can be discarded
+    # on their own ('None' is an atomic block without a savepoint).
+    pending = getattr(_pending, 'updates', None)
+    if pending is None or pending[0] is not connection.run_on_commit:
+        pending = _pending.updates = (connection.run_on_commit, {})
+    key = (user_id, frozenset(filter(None, connection.savepoint_ids)))
+    updates = pending[1].get(key)
+    if updates is None or updates.applied:
+        updates = pending[1][key] = _Updates(user_id)
+        transaction.on_commit(updates)
+    updates.updates.append(update)
+
+
+def _apply(user_id, updates):
+    """
+    Call each 'update(stats)' on the locked stats of the user, & save
+    them.
+    """
+    with transaction.atomic():
+        stats = RecipeStats.objects.select_for_update().filter(
+            user_id=user_id,
+        ).first()
+        if stats is None:
+            return
+        for update in updates:
+            update(stats)
+        stats.save()
+
+
+def add_recipe(user_id, time_minutes, price, tag_ids=(), sign=1):
+    """
+    Count a new recipe in the stats of the user, or with 'sign=-1' stop
+    counting a deleted one, with its tags.
+    """
+    def update(stats):
+        stats.recipe_count += sign
+        stats.total_time_minutes += sign * int(time_minutes)
+        stats.total_price += sign * Decimal(str(price))
+        _add(stats.price_buckets, price_bucket(price), sign)
+        for tag_id in tag_ids:
+            _add(stats.tag_counts, tag_id, sign)
+
+    _update(user_id, update)
+
+
+def change_recipe(user_id, old, new):
+    """Count the new (time, price) of a recipe instead of the old one."""
+    old_time, old_price = int(old[0]), Decimal(str(old[1]))
+    new_time, new_price = int(new[0]), Decimal(str(new[1]))
+
+    def update(stats):
+        stats.total_time_minutes += new_time - old_time
+        stats.total_price += new_price - old_price
+        _add(stats.price_buckets, price_bucket(old_price), -1)
+        _add(stats.price_buckets, price_bucket(new_price), 1)
+
+    if (old_time, old_price) != (new_time, new_price):
+        _update(user_id, update)
+
+
+def add_tags(user_id, counts):
+    """Add to the number of recipes of tags, 'counts' by tag id."""
+    def update(stats):
+        for tag_id, number in counts.items():
+            _add(stats.tag_counts, tag_id, number)
+
+    if counts:
+        _update(user_id, update)
+
+
+def remove_tag(user_id, tag_id):
+    """Stop counting the recipes of a deleted tag."""
+    def update(stats):
+        stats.tag_counts.pop(str(tag_id), None)
+
+    _update(user_id, update)
+
+
+def add_difference(user_id, old, new):
+    """
+    Count the totals 'new' instead of 'old' in the stats of the user, two
+    (unsaved) stats of the same recipes, e.g. before & after a bulk write
+    (see 'recipe.snapshots').
+    """
+    def update(stats):
+        stats.recipe_count += new.recipe_count - old.recipe_count
+        stats.total_time_minutes += (
+            new.total_time_minutes - old.total_time_minutes
+        )
+        stats.total_price += (
+            Decimal(str(new.total_price)) - Decimal(str(old.total_price))
+        )
+        for field in ('price_buckets', 'tag_counts'):
+            counts = getattr(stats, field)
+            new_counts, old_counts = getattr(new, field), getattr(old, field)
+            for key in new_counts.keys() | old_counts.keys():
+                number = new_counts.get(key, 0) - old_counts.get(key, 0)
+                if number:
+                    _add(counts, key, number)
+
+    _update(user_id, update)
+
+
+def totals(recipes):
+    """
+    Return the stats of the recipes of a queryset, new (unsaved) stats by
+    user id.
+    """
+    bounds = (Decimal(0),) + PRICE_BUCKETS + (None,)
+    buckets = {}
+    for index, (low, high) in enumerate(zip(bounds, bounds[1:])):
+        in_bucket = Q(price__gte=low) if index else Q()
+        if high is not None:
+            in_bucket &= Q(price__lt=high)
+        buckets[f'bucket_{index}'] = Count('id', filter=in_bucket)
+    rows = recipes.order_by().values('user_id').annotate(
+        recipe_count=Count('id'),
+        total_time_minutes=Sum('time_minutes'),
+        total_price=Sum('price'),
+        **buckets,
+    )
+    by_user = {
+        row['user_id']: RecipeStats(
+            user_id=row['user_id'],
+            recipe_count=row['recipe_count'],
+            total_time_minutes=row['total_time_minutes'] or 0,
+            total_price=row['total_price'] or 0,
+            price_buckets={
+                str(index): row[f'bucket_{index}']
+                for index in range(len(PRICE_BUCKETS) + 1)
+                if row[f'bucket_{index}']
+            },
+            tag_counts={},
+        )
+        for row in rows
+    }
+
+    tag_counts = Recipe.tags.through.objects.filter(
+        recipe__in=recipes,
+    ).values('recipe__user_id', 'tag_id').annotate(count=Count('id'))
+    for row in tag_counts:
+        stats = by_user[row['recipe__user_id']]
+        stats.tag_counts[str(row['tag_id'])] = row['count']
+    return by_user
+
+
+def build(user_id):
+    """Return new (unsaved) stats of the user, built from the recipes."""
+    built = totals(Recipe.objects.filter(user_id=user_id))
+    return built.get(user_id) or RecipeStats(user_id=user_id)
+
+
+def rebuild(user_id):
+    """Build the stats of the user again, from the recipes."""
+    with transaction.atomic():
+        # Locked, so the changes made meanwhile wait for the new stats.
+        RecipeStats.objects.select_for_update().filter(
+            user_id=user_id,
+        ).first()
+        stats = build(user_id)
+        stats.save()
+    return stats
+
+
+def get_stats(user_id):
+    """Return the stats of the user, building them the first time."""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is not None:
+        return stats
+
+    stats = build(user_id)
+    try:
+        with transaction.atomic():
+            stats.save(force_insert=True)
+    except IntegrityError:
+        # Built at the same time by another request.
+        stats = RecipeStats.objects.get(user_id=user_id)
+    return stats
+
+
+def _average(total, count, exponent):
+    """
+    Return the average of 'count' numbers of the 'total', as a Decimal
+    rounded half up to the exponent, e.g. 20.25 -> 20.3 with '0.1', or
+    None without numbers. Unlike a float, it's never off by the binary
+    approximation of the total.
+    """
+    if not count:
+        return None
+    return (Decimal(str(total)) / count).quantize(
+        exponent,
+        rounding=ROUND_HALF_UP,
+    )
+
+
+def to_dict(stats):
+    """Return the stats as the API shows them."""
+    count = stats.recipe_count
+    bounds = (Decimal(0),) + PRICE_BUCKETS + (None,)
+    top_tags = sorted(
+        stats.tag_counts.items(),
+        key=lambda item: (-item[1], int(item[0])),
+    )[:TOP_TAGS]
+    names = dict(Tag.objects.filter(
+        pk__in=[tag_id for tag_id, number in top_tags],
+    ).values_list('id', 'name'))
+
+    return {
+        'recipe_count': count,
+        'average_time_minutes': _average(
+            stats.total_time_minutes,
+            count,
+            Decimal('0.1'),
+        ),
+        'average_price': _average(stats.total_price, count, Decimal('0.01')),
+        'price_distribution': [
+            {
+                'min_price': low,
+                'max_price': high,
+                'recipe_count': stats.price_buckets.get(str(index), 0),
+            }
+            for index, (low, high) in enumerate(zip(bounds, bounds[1:]))
+        ],
+        'top_tags': [
+            {
+                'id': int(tag_id),
+                'name': names[int(tag_id)],
+                'recipe_count': number,
+            }
+            for tag_id, number in top_tags
+            if int(tag_id) in names
+        ],
+        'updated_at': stats.updated_at,
+    }
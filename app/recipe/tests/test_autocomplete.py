@@ -0,0 +1,203 @@
+"""
+Tests for the autocomplete of the tag & ingredient names.
+"""
+from unittest.mock import patch
+
+from core.models import Ingredient, Tag
+from core.signals import touch_user
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from recipe import autocomplete
+from rest_framework import status
+from rest_framework.test import APIClient
+
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+# The version of the index is read on every call.
+WARM_QUERIES = 1
+# Without an index, the names are read from the database, and the index is
+# built, which the tests do right away instead of in the background.
+COLD_QUERIES = 4
+
+
+def tag_detail_url(tag_id):
+    """Create and return a tag detail URL."""
+    return reverse('recipe:tag-detail', args=[tag_id])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class AutocompleteTests(TestCase):
+    """Test the autocomplete API."""
+
+    def setUp(self):
+        cache.clear()
+        autocomplete._indexes.clear()
+        autocomplete._building.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _complete(self, prefix, url=TAGS_AUTOCOMPLETE_URL, **params):
+        """Call the autocomplete, return the names, run the tasks."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.get(url, {'q': prefix, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [item['name'] for item in res.data]
+
+    def _write(self, func, *args, **kwargs):
+        """Call func & run its on commit callbacks."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def test_autocomplete_from_index(self):
+        """Test the index is built on the first call & used after it."""
+        for name in ('Crème fraîche', 'cream', 'Dessert', 'Creole'):
+            Tag.objects.create(user=self.user, name=name)
+
+        with self.assertNumQueries(COLD_QUERIES):
+            cold = self._complete('Cre')
+        with self.assertNumQueries(WARM_QUERIES):
+            warm = self._complete('cre')
+
+        # The same names in the same order, with or without the index.
+        self.assertEqual(cold, ['cream', 'Crème fraîche', 'Creole'])
+        self.assertEqual(warm, cold)
+        self.assertEqual(self._complete('CREME'), ['Crème fraîche'])
+
+    def test_autocomplete_limit(self):
+        """Test the limit caps the number of names."""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+        self._complete('tag')
+
+        self.assertEqual(
+            self._complete('tag', limit=2),
+            ['Tag 0', 'Tag 1'],
+        )
+
+    def test_index_follows_changes(self):
+        """Test creating, renaming & deleting tags updates the index."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self._complete('v')
+
+        self._write(Tag.objects.create, user=self.user, name='Vegetarian')
+        self._write(
+            self.client.patch,
+            tag_detail_url(tag.id),
+            {'name': 'Spicy'},
+        )
+
+        with self.assertNumQueries(2 * WARM_QUERIES):
+            self.assertEqual(self._complete('v'), ['Vegetarian'])
+            self.assertEqual(self._complete('s'), ['Spicy'])
+
+        self._write(self.client.delete, tag_detail_url(tag.id))
+
+        self.assertEqual(self._complete('s'), [])
+
+    def test_tags_created_with_recipe(self):
+        """Test tags created in bulk with a recipe show up."""
+        self._complete('d')
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 5,
+            'price': '1.00',
+            'tags': [{'name': 'Dinner'}],
+        }
+        self._write(self.client.post, RECIPES_URL, payload, format='json')
+
+        self.assertEqual(self._complete('d'), ['Dinner'])
+
+    def test_recipe_changes_keep_index(self):
+        """Test changing the recipes alone doesn't drop the index."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self._complete('v')
+
+        self._write(self.client.post, RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 5,
+            'price': '1.00',
+            'tags': [{'name': 'Vegan'}],
+        }, format='json')
+        self._write(Tag.objects.get(pk=vegan.pk).recipe_set.clear)
+
+        with self.assertNumQueries(WARM_QUERIES):
+            self.assertEqual(self._complete('v'), ['Vegan'])
+
+    def test_change_by_other_worker(self):
+        """Test an index is dropped when another worker made a change."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self._complete('v')
+
+        # Another worker renames the tag, we only see the version change.
+        Tag.objects.filter(user=self.user).update(name='Vegetarian')
+        touch_user(self.user.pk, names=True)
+
+        with self.assertNumQueries(COLD_QUERIES):
+            self.assertEqual(self._complete('v'), ['Vegetarian'])
+
+    def test_build_rolled_back_scheduled_again(self):
+        """Test a build lost with its transaction is scheduled again."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        # The build waits for a commit that never comes.
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'v'})
+
+        # Answered from the database, without a build.
+        with self.assertNumQueries(2):
+            self._complete('v')
+
+        later = autocomplete.time.monotonic() + autocomplete.BUILD_TIMEOUT
+        with patch.object(autocomplete.time, 'monotonic', return_value=later):
+            with self.assertNumQueries(COLD_QUERIES):
+                self._complete('v')
+        with self.assertNumQueries(WARM_QUERIES):
+            self.assertEqual(self._complete('v'), ['Vegan'])
+
+    @override_settings(AUTOCOMPLETE_MAX_INDEXES=1)
+    def test_least_recently_used_evicted(self):
+        """Test only the most recently used indexes are kept."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Vanilla')
+        self._complete('v')
+
+        self._complete('v', url=INGREDIENTS_AUTOCOMPLETE_URL)
+
+        self.assertEqual(len(autocomplete._indexes), 1)
+        with self.assertNumQueries(COLD_QUERIES):
+            self.assertEqual(self._complete('v'), ['Vegan'])
+
+    def test_other_users_names_hidden(self):
+        """Test only the user's own names are returned."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        Tag.objects.create(user=other_user, name='Vegan')
+
+        self.assertEqual(self._complete('v'), [])
+        self.assertEqual(self._complete('v'), [])
+
+    def test_concurrent_changes_not_lost(self):
+        """Test changes by two workers at once both reach the index."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self._complete('v')
+
+        # Both workers change the names, this one's callback runs last.
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Vegetarian')
+            Tag.objects.bulk_create([Tag(user=self.user, name='Vanilla')])
+            touch_user(self.user.pk, names=True)
+
+        self.assertEqual(
+            self._complete('v'),
+            ['Vanilla', 'Vegan', 'Vegetarian'],
+        )
@@ -0,0 +1,194 @@
+"""
+Tests for the bulk recipe API.
+"""
+from decimal import Decimal
+
+from core.models import Ingredient, Recipe, Tag
+from core.tests.utils import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(**params):
+    """Create and return a sample recipe payload."""
+    payload = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': '5.25',
+    }
+    payload.update(params)
+
+    return payload
+
+
+class PublicBulkApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to call the bulk API."""
+        res = APIClient().post(BULK_URL, [recipe_payload()], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBulkApiTests(QueryBudgetMixin, TestCase):
+    """Test authenticated bulk API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        """Test creating many recipes with one request."""
+        payload = [
+            recipe_payload(
+                title='Thai Curry',
+                tags=[{'name': 'Thai'}, {'name': 'Dinner'}],
+                ingredients=[{'name': 'Rice'}],
+            ),
+            recipe_payload(
+                title='Pad Thai',
+                tags=[{'name': 'Thai'}],
+                ingredients=[{'name': 'Rice'}, {'name': 'Noodles'}],
+            ),
+        ]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in res.data], ['created'] * 2)
+        curry = Recipe.objects.get(id=res.data[0]['id'])
+        pad_thai = Recipe.objects.get(id=res.data[1]['id'])
+        self.assertEqual(curry.title, 'Thai Curry')
+        self.assertEqual(curry.user, self.user)
+        self.assertEqual(curry.price, Decimal('5.25'))
+        self.assertEqual(
+            set(curry.tags.values_list('name', flat=True)),
+            {'Thai', 'Dinner'},
+        )
+        self.assertEqual(
+            set(pad_thai.ingredients.values_list('name', flat=True)),
+            {'Rice', 'Noodles'},
+        )
+        # The tags & ingredients shared by the recipes are created once.
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_reuses_existing_tags(self):
+        """Test the bulk API assigns tags that already exist."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        payload = [recipe_payload(tags=[{'name': 'Breakfast'}])]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data[0]['id'])
+        self.assertEqual(list(recipe.tags.all()), [tag])
+
+    def test_bulk_update(self):
+        """Test items with an id update the existing recipe."""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Old title',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        old_tag = Tag.objects.create(user=self.user, name='Old')
+        kept_tag = Tag.objects.create(user=self.user, name='Kept')
+        recipe.tags.add(old_tag, kept_tag)
+        payload = [
+            recipe_payload(
+                id=recipe.id,
+                title='New title',
+                tags=[{'name': 'Kept'}, {'name': 'New'}],
+            ),
+            recipe_payload(title='Brand new'),
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['status'], 'updated')
+        self.assertEqual(res.data[0]['id'], recipe.id)
+        self.assertEqual(res.data[1]['status'], 'created')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New title')
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Kept', 'New'},
+        )
+
+    def test_bulk_partial_errors(self):
+        """Test invalid items are reported without failing the batch."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        other_recipe = Recipe.objects.create(
+            user=other_user,
+            title='Not yours',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        payload = [
+            recipe_payload(title='Valid'),
+            recipe_payload(time_minutes='not a number'),
+            recipe_payload(id=other_recipe.id, title='Stolen'),
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data[0]['status'], 'created')
+        self.assertIn('time_minutes', res.data[1]['errors'])
+        self.assertIn('id', res.data[2]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+        other_recipe.refresh_from_db()
+        self.assertEqual(other_recipe.title, 'Not yours')
+
+    def test_bulk_all_invalid(self):
+        """Test a batch where every item is invalid returns a 400."""
+        payload = [recipe_payload(price='free')]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('price', res.data[0]['errors'])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_requires_list(self):
+        """Test the bulk API rejects a payload that isn't a list."""
+        for payload in ({'title': 'Not a list'}, []):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_query_count_is_constant(self):
+        """Test the query count doesn't grow with the batch size."""
+        def payload(prefix, count):
+            return [
+                recipe_payload(
+                    title=f'{prefix} {i}',
+                    tags=[{'name': f'{prefix} tag {i}'}, {'name': 'Shared'}],
+                    ingredients=[{'name': f'{prefix} ingredient {i}'}],
+                )
+                for i in range(count)
+            ]
+
+        small = self.countQueries(
+            self.client.post, BULK_URL, payload('Small', 2), format='json',
+        )
+        large = self.countQueries(
+            self.client.post, BULK_URL, payload('Large', 50), format='json',
+        )
+
+        self.assertEqual(small, large)
+        self.assertEqual(Recipe.objects.count(), 52)
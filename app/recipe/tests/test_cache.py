@@ -0,0 +1,187 @@
+"""
+Tests for the response cache of the recipe APIs.
+"""
+from decimal import Decimal
+
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+CACHE_STATS_URL = reverse('recipe:cache-stats')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ResponseCacheTests(TestCase):
+    """Test caching the responses of the recipe APIs."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_second_read_is_cached(self):
+        """Test repeating a read is served from the cache."""
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+
+    def test_detail_is_cached(self):
+        """Test the recipe detail is cached."""
+        recipe = create_recipe(user=self.user)
+        self.client.get(detail_url(recipe.id))
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data['id'], recipe.id)
+
+    def test_not_found_is_not_cached(self):
+        """Test error responses aren't cached."""
+        self.client.get(detail_url(1234))
+
+        res = self.client.get(detail_url(1234))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotEqual(res.get('X-Cache'), 'HIT')
+
+    def test_query_params_part_of_key(self):
+        """Test different query parameters are cached separately."""
+        self.client.get(RECIPES_URL, {'tags': '1', 'ingredients': '2'})
+
+        other = self.client.get(RECIPES_URL, {'tags': '2'})
+        reordered = self.client.get(
+            f'{RECIPES_URL}?ingredients=2&tags=1',
+        )
+
+        self.assertEqual(other['X-Cache'], 'MISS')
+        self.assertEqual(reordered['X-Cache'], 'HIT')
+
+    def test_api_write_invalidates(self):
+        """Test creating a recipe through the API invalidates the list."""
+        self.client.get(RECIPES_URL)
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 30,
+            'price': Decimal('5.99'),
+        }
+        self.client.post(RECIPES_URL, payload)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data), 1)
+
+    def test_model_write_invalidates(self):
+        """Test a write outside the API (e.g. the admin) invalidates."""
+        recipe = create_recipe(user=self.user)
+        self.client.get(detail_url(recipe.id))
+
+        recipe.title = 'New title'
+        recipe.save()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_tag_rename_invalidates_recipes(self):
+        """Test renaming a tag invalidates the recipes using it."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Vegetarian')
+
+    def test_m2m_change_invalidates(self):
+        """Test linking a tag to a recipe invalidates the cache."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.recipe_set.add(recipe)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_bulk_write_invalidates(self):
+        """Test the bulk API invalidates the cache."""
+        self.client.get(RECIPES_URL)
+        payload = [{'title': 'Bulk', 'time_minutes': 5, 'price': '1.00'}]
+        self.client.post(BULK_URL, payload, format='json')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_other_users_write_keeps_cache(self):
+        """Test writes of another user don't invalidate our cache."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.get(RECIPES_URL)
+
+        create_recipe(user=other_user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_cache_stats(self):
+        """Test the cache statistics count hits & misses."""
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com',
+            'testpass123',
+        )
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        self.client.force_authenticate(admin)
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['hits'], 2)
+        self.assertEqual(res.data['misses'], 1)
+
+    def test_cache_stats_admin_only(self):
+        """Test the cache statistics are only shown to admins."""
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
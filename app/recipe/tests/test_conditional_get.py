@@ -0,0 +1,193 @@
+"""
+Tests for the conditional GET requests of the recipe API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    """Test the ETag & Last-Modified validators of the recipe API."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def _etag(self, url):
+        """Return the ETag of the url."""
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res['ETag']
+
+    def test_validators_set(self):
+        """Test the responses have an ETag & a Last-Modified header."""
+        for url in (RECIPES_URL, detail_url(self.recipe.id)):
+            res = self.client.get(url)
+
+            self.assertIn('ETag', res)
+            self.assertIn('Last-Modified', res)
+
+    def test_if_none_match(self):
+        """Test a matching ETag returns an empty 304."""
+        for url in (RECIPES_URL, detail_url(self.recipe.id)):
+            etag = self._etag(url)
+
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(res.content, b'')
+            self.assertEqual(res['ETag'], etag)
+
+    def test_if_modified_since(self):
+        """Test an up to date If-Modified-Since returns a 304."""
+        later = http_date((timezone.now() + timedelta(seconds=5)).timestamp())
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=later,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_not_modified_runs_one_query(self):
+        """Test a 304 only looks up the validators."""
+        url = detail_url(self.recipe.id)
+        etag = self._etag(url)
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_update_changes_etag(self):
+        """Test updating a recipe changes the ETags."""
+        list_etag = self._etag(RECIPES_URL)
+        detail_etag = self._etag(detail_url(self.recipe.id))
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New'})
+
+        url = detail_url(self.recipe.id)
+        self.assertNotEqual(self._etag(RECIPES_URL), list_etag)
+        self.assertNotEqual(self._etag(url), detail_etag)
+
+    def test_tag_changes_change_etag(self):
+        """Test linking & renaming a tag changes the recipe's ETag."""
+        url = detail_url(self.recipe.id)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        before = self._etag(url)
+
+        tag.recipe_set.add(self.recipe)
+        linked = self._etag(url)
+        tag.name = 'Vegetarian'
+        tag.save()
+        renamed = self._etag(url)
+
+        self.assertNotEqual(before, linked)
+        self.assertNotEqual(linked, renamed)
+
+    def test_delete_changes_list_etag(self):
+        """Test deleting a recipe changes the ETag of the list."""
+        other = create_recipe(user=self.user, title='Other')
+        etag = self._etag(RECIPES_URL)
+
+        other.delete()
+
+        self.assertNotEqual(self._etag(RECIPES_URL), etag)
+
+    def test_create_marks_modified_once(self):
+        """
+        Test creating a recipe with tags & ingredients writes each
+        timestamp once.
+        """
+        self._etag(RECIPES_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Curry',
+                'time_minutes': 30,
+                'price': '2.50',
+                'tags': [{'name': 'Thai'}, {'name': 'Dinner'}],
+                'ingredients': [{'name': 'Prawns'}],
+            }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "core_user"')
+        ]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('recipes_modified_at', updates[0])
+        self.assertIn('names_modified_at', updates[1])
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('UPDATE "core_recipe" SET "modified')
+        ])
+
+    def test_rolled_back_mark_written_again(self):
+        """Test a mark rolled back with its savepoint is written again."""
+        etag = self._etag(RECIPES_URL)
+
+        with transaction.atomic():
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    create_recipe(user=self.user, title='Lost')
+                    raise ValueError
+            create_recipe(user=self.user, title='Kept')
+
+        self.assertNotEqual(self._etag(RECIPES_URL), etag)
+
+    def test_query_params_part_of_etag(self):
+        """Test filtered lists have their own ETag."""
+        etag = self._etag(RECIPES_URL)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': '1'},
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_not_found(self):
+        """Test a missing recipe still returns a 404."""
+        res = self.client.get(detail_url(1234), HTTP_IF_NONE_MATCH='"x"')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,269 @@
+"""
+Tests for the numbers of recipes of the tags & ingredients.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recipe.counts import actual_count
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe counts are kept up to date."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def assertCountsUpToDate(self):
+        """Assert the kept counts are the numbers of linked recipes."""
+        for model in (Tag, Ingredient):
+            rows = model.objects.annotate(actual=actual_count(model))
+            for row in rows:
+                self.assertEqual(row.recipe_count, row.actual, row.name)
+
+    def counts(self, model):
+        """Return the kept counts of a model, by name."""
+        return dict(model.objects.values_list('name', 'recipe_count'))
+
+    def test_counts_kept_through_api(self):
+        """Test the counts follow the creates, updates & deletes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Curry',
+                'time_minutes': 30,
+                'price': '7.00',
+                'tags': [{'name': 'Spicy'}, {'name': 'Dinner'}],
+                'ingredients': [{'name': 'Rice'}],
+            }, format='json')
+            self.client.post(RECIPES_URL, {
+                'title': 'Risotto',
+                'time_minutes': 40,
+                'price': '9.00',
+                'tags': [{'name': 'Dinner'}],
+                'ingredients': [{'name': 'Rice'}, {'name': 'Cheese'}],
+            }, format='json')
+        self.assertEqual(self.counts(Tag), {'Spicy': 1, 'Dinner': 2})
+        self.assertEqual(self.counts(Ingredient), {'Rice': 2, 'Cheese': 1})
+
+        recipe_id = res.data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(recipe_id), {
+                'tags': [{'name': 'Vegan'}],
+                'ingredients': [],
+            }, format='json')
+        self.assertEqual(self.counts(Tag),
+                         {'Spicy': 0, 'Dinner': 1, 'Vegan': 1})
+        self.assertEqual(self.counts(Ingredient), {'Rice': 1, 'Cheese': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url(recipe_id))
+        self.assertEqual(self.counts(Tag)['Vegan'], 0)
+        self.assertCountsUpToDate()
+
+    def test_counts_kept_through_relations(self):
+        """Test the counts follow the links, changed from either side."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes = [create_recipe(self.user) for _ in range(3)]
+            vegan.recipe_set.add(*recipes)
+            rice.recipe_set.add(recipes[0])
+            recipes[1].ingredients.add(rice)
+        self.assertEqual(self.counts(Tag), {'Vegan': 3})
+        self.assertEqual(self.counts(Ingredient), {'Rice': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.remove(recipes[1])
+            recipes[0].ingredients.clear()
+        self.assertEqual(self.counts(Tag), {'Vegan': 2})
+        self.assertEqual(self.counts(Ingredient), {'Rice': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.clear()
+            recipes[2].ingredients.set([rice])
+        self.assertCountsUpToDate()
+        self.assertEqual(self.counts(Tag), {'Vegan': 0})
+        self.assertEqual(self.counts(Ingredient), {'Rice': 2})
+
+    def test_bulk_write_counted(self):
+        """Test the bulk writes, without model signals, update the counts."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(BULK_URL, [
+                {'title': 'A', 'time_minutes': 5, 'price': '1.00',
+                 'tags': [{'name': 'Quick'}],
+                 'ingredients': [{'name': 'Eggs'}]},
+                {'title': 'B', 'time_minutes': 50, 'price': '25.00',
+                 'tags': [{'name': 'Quick'}]},
+            ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.counts(Tag), {'Quick': 2})
+        self.assertEqual(self.counts(Ingredient), {'Eggs': 1})
+
+    def test_bulk_update_counts_changed_links(self):
+        """Test a bulk update counts the links it removes & adds."""
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(quick)
+            recipe.ingredients.add(eggs)
+            create_recipe(self.user).tags.add(quick)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(BULK_URL, [
+                {'id': recipe.id, 'title': 'A', 'time_minutes': 5,
+                 'price': '1.00', 'tags': [{'name': 'Slow'}],
+                 'ingredients': [{'name': 'Eggs'}, {'name': 'Rice'}]},
+            ], format='json')
+
+        self.assertCountsUpToDate()
+        self.assertEqual(self.counts(Tag), {'Quick': 1, 'Slow': 1})
+        self.assertEqual(self.counts(Ingredient), {'Eggs': 1, 'Rice': 1})
+
+    def test_rolled_back_links_not_counted(self):
+        """Test the links are only counted once they're committed."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    recipe.tags.add(vegan)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+
+        vegan.refresh_from_db()
+        self.assertEqual(vegan.recipe_count, 0)
+
+    def test_cached_list_shows_new_counts(self):
+        """Test a list cached before the counts change isn't served."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(vegan)
+            # Cached after the links changed, before the count did.
+            self.client.get(TAGS_URL)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['recipe_count'], 1)
+
+    def test_assigned_only_without_join(self):
+        """Test listing the used tags reads the tags alone."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Unused')
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.add(create_recipe(self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(
+            res.data,
+            [{'id': vegan.id, 'name': 'Vegan', 'recipe_count': 1}],
+        )
+        through = Recipe.tags.through._meta.db_table
+        self.assertFalse(
+            any(through in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_sort_by_popularity(self):
+        """Test listing the most used tags first, paginated or not."""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Quick', 'Dinner')
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes = [create_recipe(self.user) for _ in range(3)]
+            tags[1].recipe_set.add(*recipes)
+            tags[2].recipe_set.add(recipes[0])
+
+        res = self.client.get(TAGS_URL, {'sort': 'popularity'})
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Quick', 'Dinner', 'Vegan'],
+        )
+
+        res = self.client.get(TAGS_URL, {
+            'sort': 'popularity',
+            'page_size': 2,
+        })
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']],
+            ['Quick', 'Dinner'],
+        )
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']],
+            ['Vegan'],
+        )
+
+    def test_unknown_sort_error(self):
+        """Test an unknown sort is rejected."""
+        res = self.client.get(TAGS_URL, {'sort': 'random'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sort', res.data)
+
+    def test_autocomplete_without_counts(self):
+        """Test the autocomplete still returns the names alone."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(reverse('recipe:tag-autocomplete'), {'q': 'v'})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Vegan'}])
+
+    def test_repair_command_fixes_drift(self):
+        """Test the command counts the recipes again."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.add(create_recipe(self.user))
+        Tag.objects.filter(pk=vegan.pk).update(recipe_count=7)
+
+        out = StringIO()
+        call_command('repair_recipe_counts', '--check', stdout=out)
+        self.assertIn('Checked the tags: 1 drifted.', out.getvalue())
+        vegan.refresh_from_db()
+        self.assertEqual(vegan.recipe_count, 7)
+
+        out = StringIO()
+        call_command('repair_recipe_counts', stdout=out)
+        self.assertIn('Repaired the tags: 1 drifted.', out.getvalue())
+        self.assertIn('Repaired the ingredients: 0 drifted.', out.getvalue())
+        self.assertCountsUpToDate()
@@ -0,0 +1,219 @@
+"""
+Tests for the normalized names of the tags & ingredients.
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class NormalizedNameTests(TestCase):
+    """Test the names differing by case or spaces are the same."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_normalized_name_set(self):
+        """Test the normalized name is set on save & bulk create."""
+        tag = Tag.objects.create(user=self.user, name=' Sea  SALT')
+        ingredient, = Ingredient.objects.bulk_create([
+            Ingredient(user=self.user, name='Crème  Fraîche'),
+        ])
+
+        self.assertEqual(tag.normalized_name, 'sea salt')
+        self.assertEqual(ingredient.normalized_name, 'crème fraîche')
+
+    def test_duplicate_name_rejected_by_database(self):
+        """Test the database stops a name differing only by case."""
+        Tag.objects.create(user=self.user, name='Salt')
+
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(user=self.user, name='salt ')
+
+    def test_create_recipe_reuses_normalized_name(self):
+        """Test a recipe gets the existing tag with a different case."""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Fries',
+            'time_minutes': 20,
+            'price': '3.00',
+            'ingredients': [{'name': 'salt'}, {'name': 'SALT'}],
+            'tags': [{'name': 'Snack'}, {'name': 'snack'}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(list(recipe.ingredients.all()), [salt])
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)),
+            ['Snack'],
+        )
+
+    def test_rename_to_normalized_duplicate_error(self):
+        """Test renaming a tag to another's name in another case fails."""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='After Dinner')
+
+        res = self.client.patch(
+            reverse('recipe:tag-detail', args=[tag.id]),
+            {'name': 'DESSERT'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_from_database_case_insensitive(self):
+        """Test the autocomplete without an index matches any case."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(
+            reverse('recipe:tag-autocomplete'),
+            {'q': 'VEG'},
+        )
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Vegan'}])
+
+
+class MergeDuplicatesTests(TransactionTestCase):
+    """
+    Test merging the duplicates made before the names were normalized.
+    The unique constraints on the normalized names are dropped for the
+    tests, or the duplicates couldn't be created.
+    """
+
+    def setUp(self):
+        constraints = [
+            (model, constraint)
+            for model in (Tag, Ingredient)
+            for constraint in model._meta.constraints
+            if 'normalized_name' in constraint.fields
+        ]
+        with connection.schema_editor() as editor:
+            for model, constraint in constraints:
+                # SQLite makes the table again from the model's
+                # constraints, which mustn't have the dropped one.
+                kept = [c for c in model._meta.constraints
+                        if c is not constraint]
+                with patch.object(model._meta, 'constraints', kept):
+                    editor.remove_constraint(model, constraint)
+        self.addCleanup(self.restore_constraints, constraints)
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+
+    def restore_constraints(self, constraints):
+        """Add the dropped constraints back, for the next tests."""
+        # The tables are flushed after the test anyway, but the duplicates
+        # left by the test have to go before the constraints are back.
+        for model in (Tag, Ingredient):
+            model.objects.all().delete()
+        with connection.schema_editor() as editor:
+            for model, constraint in constraints:
+                editor.add_constraint(model, constraint)
+
+    def test_merge_duplicates(self):
+        """Test the duplicates are merged into the oldest one."""
+        salt, lower, spaced = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'salt', 'SALT ')
+        ]
+        others = Tag.objects.create(user=self.other, name='salt')
+        first, second, third = [create_recipe(self.user) for _ in range(3)]
+        first.tags.add(salt, lower)
+        second.tags.add(lower, spaced)
+        third.tags.add(spaced)
+        create_recipe(self.other).tags.add(others)
+
+        out = StringIO()
+        call_command('merge_duplicates', stdout=out)
+
+        self.assertIn('Merged 2 duplicate tags in 1 groups.', out.getvalue())
+        self.assertEqual(
+            list(Tag.objects.filter(user=self.user)),
+            [salt],
+        )
+        for recipe in (first, second, third):
+            self.assertEqual(list(recipe.tags.all()), [salt])
+        self.assertTrue(Tag.objects.filter(pk=others.pk).exists())
+        salt.refresh_from_db()
+        self.assertEqual(salt.recipe_count, 3)
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).tag_counts,
+            {str(salt.pk): 3},
+        )
+
+    def test_merge_in_batches(self):
+        """Test the groups of both models are merged, a batch at a time."""
+        for name in ('Salt', 'salt', 'Pepper', 'pepper'):
+            Ingredient.objects.create(user=self.user, name=name)
+        Tag.objects.create(user=self.other, name='Quick')
+        Tag.objects.create(user=self.other, name='quick')
+
+        out = StringIO()
+        call_command('merge_duplicates', '--batch-size', '1', stdout=out)
+
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['Pepper', 'Salt'],
+        )
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)),
+            ['Quick'],
+        )
+        self.assertIn('Merged 2 duplicate ingredients in 2 groups.',
+                      out.getvalue())
+
+    def test_dry_run(self):
+        """Test the dry run only reports the duplicates."""
+        Tag.objects.create(user=self.user, name='Salt')
+        Tag.objects.create(user=self.user, name='salt')
+
+        out = StringIO()
+        call_command('merge_duplicates', '--dry-run', stdout=out)
+
+        self.assertIn(f'User {self.user.pk}: 2 tags named "salt".',
+                      out.getvalue())
+        self.assertIn('Found 1 duplicate tags in 1 groups.', out.getvalue())
+        self.assertEqual(Tag.objects.count(), 2)
+
+
+class MergeDuplicatesAfterMigrationTests(TestCase):
+    """Test the merge of the duplicates once the names are unique."""
+
+    def test_refuses_to_run(self):
+        """Test the command refuses to run with the unique constraints."""
+        with self.assertRaises(CommandError):
+            call_command('merge_duplicates', stdout=StringIO())
@@ -0,0 +1,167 @@
+"""
+Tests for the recipe exports.
+"""
+import csv
+import io
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from recipe.serializers import RecipeExportSerializer
+from rest_framework import status
+from rest_framework.test import APIClient
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'Sample description',
+        'link': 'http://example.com/recipe.pdf',
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicExportTests(TestCase):
+    """Test unauthenticated export requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to export recipes."""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@patch.object(RecipeExportSerializer, 'chunk_size', 2)
+class PrivateExportTests(TestCase):
+    """Test exporting the recipes of a user."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan, quick')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user,
+            name='Rice',
+        )
+        for i in range(5):
+            recipe = create_recipe(
+                self.user,
+                title=f'Recipe {i}',
+                description='' if i % 2 else 'Line one\nline "two"',
+            )
+            if i % 2:
+                recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(other_user, title='Not mine')
+
+    def _export(self, params=None):
+        """Export the recipes, return the response & its content."""
+        res = self.client.get(EXPORT_URL, params or {})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+
+        return res, b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test the default export is one JSON recipe per line."""
+        res, content = self._export()
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        lines = content.splitlines()
+        recipes = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [recipe['title'] for recipe in recipes],
+            [f'Recipe {i}' for i in reversed(range(5))],
+        )
+        detail = self.client.get(
+            reverse('recipe:recipe-detail', args=[recipes[0]['id']]),
+        )
+        for name, value in recipes[0].items():
+            self.assertEqual(value, detail.data[name])
+
+    def test_export_csv(self):
+        """Test exporting as CSV."""
+        res, content = self._export({'file_format': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], 'Recipe 4')
+        self.assertEqual(rows[0]['price'], '5.25')
+        self.assertEqual(rows[0]['description'], 'Line one\nline "two"')
+        self.assertEqual(json.loads(rows[0]['tags']), [])
+        self.assertEqual(json.loads(rows[1]['tags']), ['Vegan, quick'])
+        self.assertEqual(json.loads(rows[1]['ingredients']), ['Rice'])
+
+    def test_export_csv_escapes_formulas(self):
+        """Test the CSV cells a spreadsheet would run are escaped."""
+        Recipe.objects.filter(user=self.user).delete()
+        create_recipe(
+            self.user,
+            title='=HYPERLINK("http://example.com")',
+            description="'@SUM(A1)",
+            link='+1',
+        )
+        create_recipe(self.user, title='-1', description='\tTab')
+
+        res, content = self._export({'file_format': 'csv'})
+
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(
+            [(row['title'], row['description'], row['link']) for row in rows],
+            [
+                ("'-1", "'\tTab", 'http://example.com/recipe.pdf'),
+                ("'=HYPERLINK(\"http://example.com\")", "''@SUM(A1)", "'+1"),
+            ],
+        )
+
+    def test_export_filtered(self):
+        """Test the export is filtered like the list."""
+        res, content = self._export({'tags': self.tag.id})
+
+        titles = [json.loads(line)['title'] for line in content.splitlines()]
+        self.assertEqual(titles, ['Recipe 3', 'Recipe 1'])
+
+    def test_export_empty(self):
+        """Test exporting without recipes."""
+        Recipe.objects.filter(user=self.user).delete()
+
+        res, content = self._export({'file_format': 'csv'})
+
+        self.assertEqual(content.splitlines(), [
+            'id,title,time_minutes,price,link,tags,ingredients,description',
+        ])
+
+    def test_queries_per_chunk(self):
+        """Test each chunk takes the same two queries, whatever its size."""
+        res = self.client.get(EXPORT_URL)
+        # 5 recipes in chunks of 2.
+        with self.assertNumQueries(3 * 2):
+            b''.join(res.streaming_content)
+
+    def test_invalid_format(self):
+        """Test an unknown format is rejected."""
+        res = self.client.get(EXPORT_URL, {'file_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file_format', res.data)
@@ -0,0 +1,159 @@
+"""
+Tests for the fast serializer of the recipe list.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from recipe.serializers import FastRecipeListSerializer
+from recipe.views import RecipeViewSet
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class FastListParityTests(TestCase):
+    """Test the fast list has the same output as 'RecipeSerializer'."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Dinner', 'Ünïcödé "quoted"')
+        ]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Rice', 'Beans')
+        ]
+        prices = [Decimal('5.5'), Decimal('0.00'), Decimal('999.99')]
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i} ☃ <b>',
+                time_minutes=i,
+                price=prices[i % len(prices)],
+                link='' if i % 2 else f'https://example.com/{i}',
+            )
+            recipe.tags.add(*tags[:i % 4])
+            recipe.ingredients.add(*ingredients[i % 3:])
+
+    def _get(self, fast, params):
+        """Return the raw response of the list in the given mode."""
+        cache.clear()
+        with patch.object(RecipeViewSet, 'fast_list', fast):
+            res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, 200)
+
+        return res
+
+    def assertParity(self, params=None):
+        """Assert both modes return byte for byte the same response."""
+        slow = self._get(False, params or {})
+        fast = self._get(True, params or {})
+
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_list_parity(self):
+        """Test the full list."""
+        res = self.assertParity()
+
+        self.assertEqual(len(res.data), 12)
+
+    def test_filtered_parity(self):
+        """Test the list filtered by tags & ingredients."""
+        tag = Tag.objects.get(name='Vegan')
+        ingredient = Ingredient.objects.get(name='Rice')
+
+        self.assertParity({'tags': tag.id, 'ingredients': ingredient.id})
+
+    def test_paginated_parity(self):
+        """Test the pages of the cursor pagination."""
+        res = self.assertParity({'page_size': 5})
+        next_page = parse_qs(urlparse(res.data['next']).query)
+
+        self.assertParity({'page_size': 5, 'cursor': next_page['cursor']})
+
+    def test_fields_parity(self):
+        """Test the lists trimmed with '?fields='."""
+        for fields in ('id,title', 'price,tags', 'ingredients', 'link'):
+            self.assertParity({'fields': fields})
+
+    def test_search_parity(self):
+        """Test the search results."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                user=self.user,
+                title='Curry',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+
+        res = self.assertParity({'search': 'recipe', 'page_size': 3})
+
+        self.assertEqual(len(res.data['results']), 3)
+
+    def test_empty_parity(self):
+        """Test a list without recipes."""
+        Recipe.objects.all().delete()
+
+        self.assertParity()
+
+    def test_expand_uses_serializer(self):
+        """Test expanding detail fields falls back to the serializer."""
+        res = self.assertParity({'expand': 'description'})
+
+        self.assertIn('description', res.data[0])
+
+    @patch.object(FastRecipeListSerializer, 'chunk_size', 5)
+    def test_streamed_parity(self):
+        """Test the streamed list is the same as the regular one."""
+        slow = self._get(False, {})
+        for fields in (None, 'id,price,tags'):
+            with self.subTest(fields=fields):
+                params = {'stream': 1}
+                if fields:
+                    params['fields'] = fields
+                res = self._get(True, params)
+
+                self.assertTrue(res.streaming)
+                content = b''.join(res.streaming_content)
+                if fields is None:
+                    self.assertEqual(content, slow.content)
+                else:
+                    expected = self._get(True, {'fields': fields})
+                    self.assertEqual(content, expected.content)
+
+    def test_streamed_empty_list(self):
+        """Test streaming a list without recipes."""
+        Recipe.objects.all().delete()
+
+        res = self._get(True, {'stream': 1})
+
+        self.assertEqual(b''.join(res.streaming_content), b'[]')
+
+    def test_streamed_list_not_cached(self):
+        """Test a streamed list is streamed again, not cached."""
+        self.client.get(RECIPES_URL, {'stream': 1})
+        res = self.client.get(RECIPES_URL, {'stream': 1})
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertIn('ETag', res)
+
+    def test_stream_ignored_when_paginated(self):
+        """Test the pages of the list aren't streamed."""
+        res = self._get(True, {'stream': 1, 'page_size': 5})
+
+        self.assertFalse(res.streaming)
+        self.assertEqual(len(res.data['results']), 5)
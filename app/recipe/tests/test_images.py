@@ -0,0 +1,180 @@
+"""
+Tests for the renditions of the recipe images.
+"""
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from core.models import Recipe
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from recipe import images
+from recipe.images import RENDITION_SIZES, process_recipe_image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL."""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def create_photo(width=2000, height=1000, orientation=None):
+    """Create and return a JPEG like the ones taken with a phone."""
+    image = Image.new('RGB', (width, height), 'red')
+    exif = Image.Exif()
+    # The camera model & the orientation the phone was held in.
+    exif[0x0110] = 'Test Phone'
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', exif=exif)
+
+    return SimpleUploadedFile(
+        'photo.jpg',
+        buffer.getvalue(),
+        content_type='image/jpeg',
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_TASKS_EAGER=True)
+class RecipeImageRenditionTests(TestCase):
+    """Test making the renditions of the uploaded images."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.00'),
+        )
+
+    def _upload(self, photo):
+        """Upload the photo & run the background tasks."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': photo},
+                format='multipart',
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+
+    def test_upload_makes_renditions(self):
+        """Test uploading an image makes the resized renditions."""
+        photo = create_photo()
+        self._upload(photo)
+
+        self.assertEqual(self.recipe.image_width, 2000)
+        self.assertEqual(self.recipe.image_height, 1000)
+        self.assertEqual(self.recipe.image_size, photo.size)
+        self.assertEqual(
+            set(self.recipe.image_renditions),
+            set(RENDITION_SIZES),
+        )
+        thumbnail = self.recipe.image_renditions['thumbnail']
+        self.assertEqual(thumbnail['width'], RENDITION_SIZES['thumbnail'])
+        self.assertEqual(thumbnail['height'], RENDITION_SIZES['thumbnail'] / 2)
+        storage = self.recipe.image.storage
+        with storage.open(thumbnail['webp']) as webp:
+            self.assertEqual(Image.open(webp).format, 'WEBP')
+        with storage.open(thumbnail['jpeg']) as jpeg:
+            image = Image.open(jpeg)
+            self.assertEqual(image.size, (160, 80))
+
+    def test_renditions_strip_exif(self):
+        """Test the renditions are rotated upright & have no EXIF data."""
+        # Orientation 6 means the phone was held on its side.
+        self._upload(create_photo(orientation=6))
+
+        self.assertEqual(self.recipe.image_width, 1000)
+        self.assertEqual(self.recipe.image_height, 2000)
+        large = self.recipe.image_renditions['large']
+        with self.recipe.image.storage.open(large['jpeg']) as jpeg:
+            image = Image.open(jpeg)
+            self.assertEqual(image.size, (640, 1280))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_small_image_not_enlarged(self):
+        """Test images smaller than a rendition aren't scaled up."""
+        self._upload(create_photo(width=300, height=200))
+
+        large = self.recipe.image_renditions['large']
+        self.assertEqual((large['width'], large['height']), (300, 200))
+
+    def test_detail_shows_rendition_urls(self):
+        """Test the recipe detail has the URLs of the renditions."""
+        self._upload(create_photo())
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data['image_width'], 2000)
+        thumbnail = res.data['image_renditions']['thumbnail']
+        self.assertTrue(thumbnail['webp'].startswith('http://testserver/'))
+        self.assertTrue(thumbnail['webp'].endswith('-thumbnail.webp'))
+
+    def test_new_upload_replaces_renditions(self):
+        """Test uploading another image deletes the old renditions."""
+        self._upload(create_photo())
+        old = self.recipe.image_renditions['small']['webp']
+
+        self._upload(create_photo(width=100, height=100))
+
+        storage = self.recipe.image.storage
+        self.assertFalse(storage.exists(old))
+        self.assertEqual(self.recipe.image_width, 100)
+
+    def test_stale_task_ignored(self):
+        """Test a task for an image replaced meanwhile saves nothing."""
+        self.recipe.image = create_photo()
+        self.recipe.save()
+        real_open = images._open
+
+        def open_and_replace(image_file):
+            # Another upload replaces the image while we're resizing.
+            Recipe.objects.filter(id=self.recipe.id).update(
+                image='uploads/recipe/newer.jpg',
+            )
+            return real_open(image_file)
+
+        with patch('recipe.images._open', side_effect=open_and_replace):
+            process_recipe_image(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_renditions, {})
+        self.assertIsNone(self.recipe.image_width)
+
+    def test_command_processes_missing_renditions(self):
+        """Test the command makes the renditions that are missing."""
+        self.recipe.image = create_photo()
+        self.recipe.save()
+
+        call_command('process_recipe_images', stdout=io.StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_width, 2000)
+        self.assertIn('small', self.recipe.image_renditions)
@@ -7,7 +7,7 @@ from core.models import Ingredient, Recipe
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
-from recipe.serializers import IngredientSerializer
+from recipe.serializers import IngredientUsageSerializer
 from rest_framework import status
 from rest_framework.test import APIClient
 
@@ -53,7 +53,7 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         ingredients = Ingredient.objects.all().order_by('-name')
-        serializer = IngredientSerializer(ingredients, many=True)
+        serializer = IngredientUsageSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
@@ -103,12 +103,14 @@ class PrivateIngredientsApiTests(TestCase):
             price=Decimal('4.50'),
             user=self.user,
         )
-        recipe.ingredients.add(in1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.ingredients.add(in1)
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        s1 = IngredientSerializer(in1)
-        s2 = IngredientSerializer(in2)
+        in1.refresh_from_db()
+        s1 = IngredientUsageSerializer(in1)
+        s2 = IngredientUsageSerializer(in2)
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
@@ -128,8 +130,9 @@ class PrivateIngredientsApiTests(TestCase):
             price=Decimal('4.00'),
             user=self.user,
         )
-        recipe1.ingredients.add(ing)
-        recipe2.ingredients.add(ing)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe1.ingredients.add(ing)
+            recipe2.ingredients.add(ing)
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
@@ -0,0 +1,192 @@
+"""
+Tests for the cursor pagination of the recipe APIs.
+"""
+import base64
+import json
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from core.models import Ingredient, Recipe, Tag
+from core.tests.utils import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class CursorPaginationTests(QueryBudgetMixin, TestCase):
+    """Test paginating recipes, tags and ingredients."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _collect_pages(self, url, page_size, **params):
+        """Follow the 'next' links and return every page."""
+        pages = []
+        res = self.client.get(url, {'page_size': page_size, **params})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data['results'])
+            if not res.data['next']:
+                return pages
+            # A cursor that stops moving would never end.
+            self.assertLess(len(pages), 100)
+            res = self.client.get(res.data['next'])
+
+    def test_list_unpaginated_by_default(self):
+        """Test the list isn't paginated unless the client asks for it."""
+        create_recipe(user=self.user)
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data, list)
+        self.assertEqual(len(res.data), 2)
+
+    def test_paginate_recipes(self):
+        """Test walking the recipes page by page, newest first."""
+        recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+
+        pages = self._collect_pages(RECIPES_URL, 2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [item['id'] for page in pages for item in page]
+        self.assertEqual(ids, [r.id for r in reversed(recipes)])
+
+    def test_paginate_tags_and_ingredients(self):
+        """Test walking tags and ingredients ordered by name."""
+        names = ['Apple', 'Banana', 'Cherry', 'Date', 'Elderberry']
+        for name in names:
+            Tag.objects.create(user=self.user, name=name)
+            Ingredient.objects.create(user=self.user, name=name)
+
+        for url in (TAGS_URL, INGREDIENTS_URL):
+            pages = self._collect_pages(url, 2)
+
+            self.assertEqual([len(page) for page in pages], [2, 2, 1])
+            result = [item['name'] for page in pages for item in page]
+            self.assertEqual(result, sorted(names, reverse=True))
+
+    def test_paginate_ties_to_the_end(self):
+        """Test walking past more tags of the same count than DRF's cap."""
+        tags = Tag.objects.bulk_create([
+            Tag(user=self.user, name=f'Tag {i}') for i in range(1600)
+        ])
+        used = Tag.objects.create(user=self.user, name='Used')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(user=self.user).tags.add(used)
+
+        pages = self._collect_pages(TAGS_URL, 500, sort='popularity')
+
+        self.assertEqual([len(page) for page in pages], [500, 500, 500, 101])
+        ids = [item['id'] for page in pages for item in page]
+        self.assertEqual(ids, [used.id] + [tag.id for tag in tags])
+
+    def test_previous_page_of_ties(self):
+        """Test the previous link goes back to the same tied tags."""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        first = self.client.get(TAGS_URL, {
+            'page_size': 2,
+            'sort': 'popularity',
+        })
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_invalid_cursor_error(self):
+        """Test a cursor that wasn't made by the API is rejected."""
+        res = self.client.get(TAGS_URL, {'cursor': 'cD1bMV0='})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor_values_error(self):
+        """
+        Test a cursor with values that don't fit the columns of the order
+        is rejected.
+        """
+        positions = [
+            ['Vegan', 'x'],
+            ['Vegan', None],
+            [['Vegan'], 1],
+            ['Vegan', 10 ** 30],
+        ]
+        for position in positions:
+            cursor = base64.b64encode(
+                urlencode({'p': json.dumps(position)}).encode(),
+            ).decode()
+
+            res = self.client.get(TAGS_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pagination_limited_to_user(self):
+        """Test the pages only contain the user's own recipes."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(user=other_user)
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'page_size': 10})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['id'], recipe.id)
+
+    def test_pagination_does_not_count(self):
+        """Test paginating never runs a COUNT over the user's recipes."""
+        for i in range(5):
+            create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(RECIPES_URL, {'page_size': 2})
+
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_deep_page_costs_the_same(self):
+        """Test a deep page runs as many queries as the first page."""
+        for i in range(10):
+            create_recipe(user=self.user)
+
+        first = self.countQueries(
+            self.client.get, RECIPES_URL, {'page_size': 2},
+        )
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        for i in range(3):
+            res = self.client.get(res.data['next'])
+        deep = self.countQueries(self.client.get, res.data['next'])
+
+        self.assertEqual(first, deep)
@@ -0,0 +1,232 @@
+"""
+Tests for the SQL query budgets of the recipe APIs.
+"""
+from decimal import Decimal
+
+from core.models import Ingredient, Recipe, Tag
+from core.signals import forget_marks
+from core.tests.utils import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+# The maximum number of queries each endpoint may run. These must not
+# depend on how many recipes, tags or ingredients the user has.
+# The reads include the lookup of their ETag, and the writes include
+# marking the recipes & their owner as modified (see 'core.signals') &
+# the 'on_commit' work: the counts, the stats & the search index.
+LIST_BUDGET = 4
+RETRIEVE_BUDGET = 4
+# Creating a recipe with new tags & ingredients:
+#   - the savepoint of the serializer & its release (2),
+#   - inserting the recipe (1),
+#   - marking the recipes & the names of the user as modified (2),
+#   - for the tags & for the ingredients: reading the existing ones,
+#     inserting the missing ones, reading them back, reading the links
+#     already there (which Django's 'add()' does) & inserting the links
+#     (5 + 5),
+#   - the response reading the tags & the ingredients (2),
+#   - the search index: deleting & inserting the row of the recipe (2),
+#   - the stats: a savepoint, locking the row, saving it & the release
+#     (4),
+#   - the counts of the tags & of the ingredients (2).
+CREATE_BUDGET = 25
+# Updating the tags & ingredients of a recipe, one of each new:
+#   - reading the recipe with its tags & ingredients (3),
+#   - the savepoint of the serializer & its release (2),
+#   - saving the recipe (1),
+#   - marking the recipes & the names of the user as modified (2),
+#   - for the tags & for the ingredients: reading the existing ones,
+#     inserting the missing ones, reading them back, deleting the old
+#     links, reading the links already there & inserting the new ones
+#     (6 + 6),
+#   - the response reading the tags & the ingredients (2),
+#   - the search index (2),
+#   - the stats (4),
+#   - the counts of the unlinked & of the linked tags & ingredients (4).
+UPDATE_BUDGET = 32
+ATTR_LIST_BUDGET = 1
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipes(user, count, tags_per_recipe=3, ingredients_per_recipe=3):
+    """Create 'count' recipes, each with its own tags and ingredients."""
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=10,
+            price=Decimal('5.50'),
+        )
+        for j in range(tags_per_recipe):
+            tag, _ = Tag.objects.get_or_create(user=user, name=f'Tag {j}')
+            recipe.tags.add(tag)
+        for j in range(ingredients_per_recipe):
+            ingredient, _ = Ingredient.objects.get_or_create(
+                user=user,
+                name=f'Ingredient {i}-{j}',
+            )
+            recipe.ingredients.add(ingredient)
+        recipes.append(recipe)
+
+    return recipes
+
+
+class RecipeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test the recipe endpoints run a constant number of queries."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_query_count_is_constant(self):
+        """Test listing recipes doesn't run a query per recipe."""
+        create_recipes(self.user, 2)
+        small = self.countQueries(self.client.get, RECIPES_URL)
+
+        create_recipes(self.user, 20)
+        large = self.countQueries(self.client.get, RECIPES_URL)
+
+        self.assertEqual(small, large)
+
+    def test_list_budget(self):
+        """Test listing recipes stays within the query budget."""
+        create_recipes(self.user, 10)
+
+        with self.assertMaxQueries(LIST_BUDGET):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 10)
+        self.assertEqual(len(res.data[0]['tags']), 3)
+        self.assertEqual(len(res.data[0]['ingredients']), 3)
+
+    def test_filtered_list_budget(self):
+        """Test filtering recipes stays within the query budget."""
+        create_recipes(self.user, 10)
+        tag = Tag.objects.filter(user=self.user).first()
+
+        with self.assertMaxQueries(LIST_BUDGET):
+            res = self.client.get(RECIPES_URL, {'tags': f'{tag.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 10)
+
+    def test_retrieve_budget(self):
+        """Test retrieving a recipe stays within the query budget."""
+        recipe = create_recipes(self.user, 1, 10, 10)[0]
+
+        with self.assertMaxQueries(RETRIEVE_BUDGET):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 10)
+
+    def test_create_budget(self):
+        """Test creating a recipe stays within the query budget."""
+        payload = {
+            'title': 'Thai Prawn Curry',
+            'time_minutes': 30,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'Thai'}, {'name': 'Dinner'}],
+            'ingredients': [{'name': 'Prawns'}, {'name': 'Ginger'}],
+        }
+
+        with self.assertMaxQueries(CREATE_BUDGET):
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_create_query_count_is_constant(self):
+        """Test creating a recipe doesn't run queries per tag."""
+        def payload(count):
+            return {
+                'title': 'Thai Prawn Curry',
+                'time_minutes': 30,
+                'price': Decimal('2.50'),
+                'tags': [{'name': f'Tag {i}'} for i in range(count)],
+                'ingredients': [
+                    {'name': f'Ingredient {i}'} for i in range(count)
+                ],
+            }
+
+        small = self.countQueries(
+            self.client.post, RECIPES_URL, payload(2), format='json',
+        )
+        large = self.countQueries(
+            self.client.post, RECIPES_URL, payload(30), format='json',
+        )
+
+        self.assertEqual(small, large)
+
+    def test_update_budget(self):
+        """Test updating a recipe stays within the query budget."""
+        recipe = create_recipes(self.user, 1)[0]
+        # The recipe was created in another transaction in real life, the
+        # update marks everything again.
+        forget_marks()
+        payload = {
+            'tags': [{'name': 'Tag 0'}, {'name': 'Lunch'}],
+            'ingredients': [{'name': 'Salt'}, {'name': 'Pepper'}],
+        }
+
+        with self.assertMaxQueries(UPDATE_BUDGET):
+            res = self.client.patch(
+                detail_url(recipe.id),
+                payload,
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_tag_and_ingredient_list_budget(self):
+        """Test listing tags and ingredients stays within the budget."""
+        create_recipes(self.user, 10)
+
+        for url in (TAGS_URL, INGREDIENTS_URL):
+            with self.assertMaxQueries(ATTR_LIST_BUDGET):
+                res = self.client.get(url, {'assigned_only': 1})
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_update_query_count_is_constant(self):
+        """Test updating a recipe doesn't run queries per ingredient."""
+        small_recipe, large_recipe = create_recipes(self.user, 2, 30, 30)
+
+        def payload(prefix, count):
+            return {
+                'tags': [{'name': f'{prefix} tag {i}'} for i in range(count)],
+                'ingredients': [
+                    {'name': f'{prefix} ingredient {i}'} for i in range(count)
+                ],
+            }
+
+        small = self.countQueries(
+            self.client.patch,
+            detail_url(small_recipe.id),
+            payload('Small', 2),
+            format='json',
+        )
+        large = self.countQueries(
+            self.client.patch,
+            detail_url(large_recipe.id),
+            payload('Large', 30),
+            format='json',
+        )
+
+        self.assertEqual(small, large)
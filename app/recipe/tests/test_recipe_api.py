@@ -281,6 +281,44 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_create_recipe_with_duplicate_tags(self):
+        """Test a tag named twice in the payload is created once."""
+        payload = {
+            'title': 'Pad Thai',
+            'time_minutes': 20,
+            'price': Decimal('3.50'),
+            'tags': [{'name': 'Thai'}, {'name': 'Thai'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+
+    def test_update_keeps_unchanged_tags(self):
+        """Test updating tags only writes the links that changed."""
+        tag_keep = Tag.objects.create(user=self.user, name='Keep')
+        tag_drop = Tag.objects.create(user=self.user, name='Drop')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag_keep, tag_drop)
+        link = Recipe.tags.through.objects.get(recipe=recipe, tag=tag_keep)
+
+        payload = {'tags': [{'name': 'Keep'}, {'name': 'New'}]}
+        url = detail_url(recipe.id)
+        res = self.client.patch(url, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Keep', 'New'},
+        )
+        # The link to the unchanged tag is the very same row as before.
+        self.assertTrue(
+            Recipe.tags.through.objects.filter(id=link.id).exists()
+        )
+        self.assertTrue(Tag.objects.filter(id=tag_drop.id).exists())
+
     def test_create_recipe_with_new_ingredients(self):
         """Test creating a recipe with new ingredients."""
         payload = {
@@ -407,6 +445,33 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_filter_by_tags_and_ingredients_unique(self):
+        """Test a recipe matching many filters is listed once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        in1 = Ingredient.objects.create(user=self.user, name='Rice')
+        in2 = Ingredient.objects.create(user=self.user, name='Beans')
+        recipe.tags.add(tag1, tag2)
+        recipe.ingredients.add(in1, in2)
+
+        params = {
+            'tags': f'{tag1.id},{tag2.id}',
+            'ingredients': f'{in1.id},{in2.id}',
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['id'], recipe.id)
+
+    def test_filter_invalid_ids_error(self):
+        """Test filter IDs that aren't numbers are rejected."""
+        for name in ('tags', 'ingredients'):
+            res = self.client.get(RECIPES_URL, {name: '1,abc'})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(name, res.data)
+
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
@@ -0,0 +1,216 @@
+"""
+Tests for reading from the replicas of the database.
+"""
+import math
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from core.db import routers
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+REPLICA = 'replica'
+
+
+@override_settings(
+    DATABASE_REPLICAS=[REPLICA],
+    REPLICA_STICKY_SECONDS=60,
+    REPLICA_MAX_LAG=5,
+    REPLICA_LAG_CHECK_INTERVAL=0,
+)
+class ReplicaTests(TestCase):
+    """
+    Test the routing of the reads, with a replica that is a second SQLite
+    database, which only has the rows the tests put there, like a replica
+    lagging behind.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test case is set up, which only allows the
+        # databases known to the test runner.
+        cls.directory = tempfile.mkdtemp()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'],
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        # The rows written to the replica are rolled back after the test,
+        # like the ones of the test database.
+        atomic = transaction.atomic(using=REPLICA)
+        atomic.__enter__()
+        self.addCleanup(atomic.__exit__, None, None, None)
+        self.addCleanup(transaction.set_rollback, True, using=REPLICA)
+
+        cache.clear()
+        routers._lags.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        get_user_model().objects.using(REPLICA).create(
+            id=self.user.id,
+            email=self.user.email,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_recipe(self, database, title):
+        """Create a recipe of the user in one of the databases."""
+        return Recipe.objects.using(database).create(
+            user_id=self.user.id,
+            title=title,
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+
+    def _end_window(self):
+        """
+        Let the reads of the user go to the replica again, after the rows
+        of the test were written, which sends them to the primary.
+        """
+        cache.delete(routers._sticky_key(self.user.id))
+
+    def _titles(self):
+        """Return the titles of the recipes listed."""
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data]
+
+    def test_list_read_from_replica(self):
+        """Test the lists are read from the replica."""
+        self._create_recipe('default', 'Primary recipe')
+        self._create_recipe(REPLICA, 'Replica recipe')
+        Tag.objects.using(REPLICA).create(user_id=self.user.id, name='Vegan')
+        self._end_window()
+
+        self.assertEqual(self._titles(), ['Replica recipe'])
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([tag['name'] for tag in res.data], ['Vegan'])
+
+    def test_detail_read_from_replica(self):
+        """Test a recipe is read from the replica."""
+        recipe = self._create_recipe(REPLICA, 'Replica recipe')
+        self._end_window()
+
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Replica recipe')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test a user reads their own writes, though the replica lags."""
+        self._create_recipe(REPLICA, 'Replica recipe')
+        payload = {'title': 'New recipe', 'time_minutes': 5, 'price': '2.50'}
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self._titles(), ['New recipe'])
+
+    def test_stickiness_per_user(self):
+        """Test the writes of a user don't send the others to the primary."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+        res = client.post(
+            RECIPES_URL,
+            {'title': 'New recipe', 'time_minutes': 5, 'price': '2.50'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self._create_recipe(REPLICA, 'Replica recipe')
+        self._end_window()
+
+        self.assertEqual(self._titles(), ['Replica recipe'])
+
+    def test_back_to_replica_after_window(self):
+        """Test the reads go back to the replica after the window."""
+        self._create_recipe(REPLICA, 'Replica recipe')
+        self.client.post(
+            RECIPES_URL,
+            {'title': 'New recipe', 'time_minutes': 5, 'price': '2.50'},
+        )
+        self._end_window()
+
+        self.assertEqual(self._titles(), ['Replica recipe'])
+
+    def test_reads_stick_to_primary_after_change_elsewhere(self):
+        """
+        Test a change made outside the API, e.g. in the admin, sends the
+        reads to the primary too, so no stale list gets cached.
+        """
+        self._create_recipe(REPLICA, 'Replica recipe')
+        self._end_window()
+        self.assertEqual(self._titles(), ['Replica recipe'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_recipe('default', 'Admin recipe')
+
+        self.assertEqual(self._titles(), ['Admin recipe'])
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data[0]['title'], 'Admin recipe')
+
+    def test_lagging_replica_skipped(self):
+        """Test a replica too far behind isn't read from."""
+        self._create_recipe('default', 'Primary recipe')
+        self._create_recipe(REPLICA, 'Replica recipe')
+
+        with patch.object(routers, 'replica_lag', return_value=60):
+            self.assertEqual(self._titles(), ['Primary recipe'])
+
+    def test_unreachable_replica_skipped(self):
+        """Test a replica that is down isn't read from."""
+        self._create_recipe('default', 'Primary recipe')
+
+        with patch.object(routers, 'replica_lag', return_value=math.inf):
+            self.assertEqual(self._titles(), ['Primary recipe'])
+
+    @override_settings(REPLICA_LAG_CHECK_INTERVAL=60)
+    def test_lag_checked_once_per_interval(self):
+        """Test the lag of a replica isn't checked on every request."""
+        with patch.object(routers, 'replica_lag', return_value=0) as lag:
+            self._titles()
+            cache.clear()
+            self._titles()
+
+        lag.assert_called_once_with(REPLICA)
+
+    def test_writes_and_other_reads_use_primary(self):
+        """Test the reads outside of the API & all writes use the primary."""
+        self._create_recipe(REPLICA, 'Replica recipe')
+        recipe = Recipe.objects.using(REPLICA).get()
+
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(
+            routers.ReplicaRouter().db_for_write(Recipe, instance=recipe),
+            'default',
+        )
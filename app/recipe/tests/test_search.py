@@ -0,0 +1,152 @@
+"""
+Tests for the full-text search of the recipe API.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchTests(TestCase):
+    """Test searching the recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, text, **params):
+        """Search the recipes, return the ids of the results."""
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def _write(self, func, *args, **kwargs):
+        """Call func & let the index update as if the request committed."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def test_search_title_and_description(self):
+        """Test searching the titles & descriptions."""
+        curry = self._write(create_recipe, self.user, title='Thai Curry')
+        soup = self._write(
+            create_recipe,
+            self.user,
+            title='Soup',
+            description='A mild curry soup.',
+        )
+        self._write(create_recipe, self.user, title='Pancakes')
+
+        # The title weighs more than the description.
+        self.assertEqual(self._search('curry'), [curry.id, soup.id])
+
+    def test_search_tags_and_ingredients(self):
+        """Test the names of the tags & ingredients are searched."""
+        recipe = self._write(create_recipe, self.user, title='Dinner')
+        tag = Tag.objects.create(user=self.user, name='Vegetarian')
+        self._write(recipe.tags.add, tag)
+
+        self.assertEqual(self._search('vegetarian'), [recipe.id])
+
+    def test_search_all_words(self):
+        """Test every word has to match, the last one as a prefix."""
+        curry = self._write(create_recipe, self.user, title='Red Curry')
+        self._write(create_recipe, self.user, title='Green Curry')
+
+        self.assertEqual(self._search('curry re'), [curry.id])
+
+    def test_search_other_users_hidden(self):
+        """Test the search only returns the user's own recipes."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self._write(create_recipe, other_user, title='Curry')
+
+        self.assertEqual(self._search('curry'), [])
+
+    def test_index_follows_changes(self):
+        """Test the index is updated when a recipe or its tags change."""
+        recipe = self._write(create_recipe, self.user, title='Curry')
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        self._write(recipe.tags.add, tag)
+
+        recipe.title = 'Soup'
+        self._write(recipe.save)
+        tag.name = 'Mild'
+        self._write(tag.save)
+
+        self.assertEqual(self._search('curry'), [])
+        self.assertEqual(self._search('spicy'), [])
+        self.assertEqual(self._search('soup mild'), [recipe.id])
+
+        self._write(recipe.delete)
+
+        self.assertEqual(self._search('soup'), [])
+
+    def test_bulk_write_indexed(self):
+        """Test the recipes written with the bulk API are indexed."""
+        payload = [{'title': 'Bulk Curry', 'time_minutes': 5, 'price': '1'}]
+        res = self._write(self.client.post, BULK_URL, payload, format='json')
+
+        self.assertEqual(self._search('curry'), [res.data[0]['id']])
+
+    def test_search_paginated(self):
+        """Test the search results are paginated without a COUNT."""
+        for i in range(3):
+            self._write(create_recipe, self.user, title=f'Curry {i}')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry', 'page_size': 2})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['previous'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIsNone(res.data['next'])
+        self.assertIsNotNone(res.data['previous'])
+
+    def test_search_operators_ignored(self):
+        """Test search syntax typed by the user doesn't cause errors."""
+        self._write(create_recipe, self.user, title='Curry')
+
+        for text in ('"', 'curry AND', 'NOT', '*', '-curry'):
+            res = self.client.get(RECIPES_URL, {'search': text})
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_rebuild_command(self):
+        """Test the command rebuilds the index from the recipes."""
+        recipe = create_recipe(self.user, title='Curry')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM core_recipe_search')
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual(self._search('curry'), [recipe.id])
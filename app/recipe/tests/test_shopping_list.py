@@ -0,0 +1,195 @@
+"""
+Tests for the shopping list of many recipes.
+"""
+from decimal import Decimal
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recipe.views import MAX_SHOPPING_LIST_IDS
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def ids_param(recipes):
+    """Return the comma separated ids of the recipes."""
+    return ','.join(str(recipe.id) for recipe in recipes)
+
+
+class PublicShoppingListApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required for the shopping list."""
+        res = APIClient().get(SHOPPING_LIST_URL, {'ids': '1'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateShoppingListApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.salt, self.eggs, self.rice = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'Eggs', 'Rice')
+        ]
+
+    def test_shopping_list_of_ids(self):
+        """Test the ingredients of the recipes, each once, with counts."""
+        omelette = create_recipe(self.user)
+        omelette.ingredients.add(self.salt, self.eggs)
+        risotto = create_recipe(self.user)
+        risotto.ingredients.add(self.salt, self.rice)
+        create_recipe(self.user).ingredients.add(self.eggs)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(SHOPPING_LIST_URL, {
+                'ids': ids_param([omelette, risotto]),
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.eggs.id, 'name': 'Eggs', 'recipe_count': 1},
+            {'id': self.rice.id, 'name': 'Rice', 'recipe_count': 1},
+            {'id': self.salt.id, 'name': 'Salt', 'recipe_count': 2},
+        ])
+
+    def test_shopping_list_of_tags(self):
+        """Test the recipes can be picked by tags, counted once each."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        salad = create_recipe(self.user)
+        salad.tags.add(vegan, quick)
+        salad.ingredients.add(self.salt)
+        create_recipe(self.user).ingredients.add(self.eggs)
+
+        res = self.client.get(SHOPPING_LIST_URL, {
+            'tags': f'{vegan.id},{quick.id}',
+        })
+
+        self.assertEqual(res.data, [
+            {'id': self.salt.id, 'name': 'Salt', 'recipe_count': 1},
+        ])
+
+    def test_shopping_list_of_ingredients(self):
+        """Test the recipes can be picked by ingredients alone."""
+        omelette = create_recipe(self.user)
+        omelette.ingredients.add(self.salt, self.eggs)
+        create_recipe(self.user).ingredients.add(self.rice)
+
+        res = self.client.get(SHOPPING_LIST_URL, {
+            'ingredients': str(self.eggs.id),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.eggs.id, 'name': 'Eggs', 'recipe_count': 1},
+            {'id': self.salt.id, 'name': 'Salt', 'recipe_count': 1},
+        ])
+
+    def test_shopping_list_limited_to_user(self):
+        """Test the recipes of other users are left out."""
+        other = get_user_model().objects.create_user('other@example.com')
+        sugar = Ingredient.objects.create(user=other, name='Sugar')
+        recipe = create_recipe(other)
+        recipe.ingredients.add(sugar)
+
+        res = self.client.get(SHOPPING_LIST_URL, {'ids': str(recipe.id)})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_shopping_list_of_many_recipes(self):
+        """Test hundreds of recipes are summed up in one query."""
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=5,
+                   price=Decimal('1.00'))
+            for i in range(300)
+        ])
+        through = Recipe.ingredients.through
+        through.objects.bulk_create([
+            through(recipe=recipe, ingredient=ingredient)
+            for recipe in recipes
+            for ingredient in (self.salt, self.eggs)
+        ])
+
+        with self.assertNumQueries(2):
+            res = self.client.get(SHOPPING_LIST_URL, {
+                'ids': ids_param(recipes),
+            })
+
+        self.assertEqual(
+            [(item['name'], item['recipe_count']) for item in res.data],
+            [('Eggs', 300), ('Salt', 300)],
+        )
+
+    def test_shopping_list_cached(self):
+        """Test the shopping list is cached until the recipes change."""
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(self.salt)
+        params = {'ids': str(recipe.id)}
+        res = self.client.get(SHOPPING_LIST_URL, params)
+        etag = res['ETag']
+
+        res = self.client.get(SHOPPING_LIST_URL, params,
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        recipe.ingredients.add(self.rice)
+        res = self.client.get(SHOPPING_LIST_URL, params)
+        self.assertEqual(
+            [item['name'] for item in res.data],
+            ['Rice', 'Salt'],
+        )
+
+    def test_recipes_required(self):
+        """Test the recipes have to be picked by ids or tags."""
+        res = self.client.get(SHOPPING_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_ids_error(self):
+        """Test ids that aren't numbers are rejected."""
+        res = self.client.get(SHOPPING_LIST_URL, {'ids': '1,salt'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ids', res.data)
+
+    def test_invalid_filter_ids_error(self):
+        """Test tag or ingredient IDs that aren't numbers are rejected."""
+        for name in ('tags', 'ingredients'):
+            res = self.client.get(SHOPPING_LIST_URL, {name: 'abc'})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(name, res.data)
+
+    def test_too_many_ids_error(self):
+        """Test the number of ids is limited."""
+        ids = ','.join(map(str, range(1, MAX_SHOPPING_LIST_IDS + 2)))
+
+        res = self.client.get(SHOPPING_LIST_URL, {'ids': ids})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,106 @@
+"""
+Tests for picking the fields of the recipe API responses.
+"""
+from decimal import Decimal
+
+from core.models import Ingredient, Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class SparseFieldsTests(TestCase):
+    """Test the '?fields=' & '?expand=' of the recipe API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            description='Sample description',
+            time_minutes=5,
+            price=Decimal('5.00'),
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Tag'))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Ingredient'),
+        )
+
+    def test_list_fields(self):
+        """Test the list only returns the fields asked for."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.recipe.id, 'title': 'Sample recipe'},
+        ])
+        # Neither the tags nor the ingredients are prefetched, and only
+        # the columns needed are read.
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+        self.assertNotIn('"core_recipe"."price"', sql)
+
+    def test_list_fields_with_tags(self):
+        """Test only the relations asked for are prefetched."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,tags'})
+
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Tag')
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+
+    def test_list_expand(self):
+        """Test the list can include fields of the detail."""
+        res = self.client.get(RECIPES_URL, {'expand': 'description'})
+
+        self.assertEqual(res.data[0]['description'], 'Sample description')
+        self.assertEqual(res.data[0]['title'], 'Sample recipe')
+        self.assertNotIn('image', res.data[0])
+
+    def test_detail_fields(self):
+        """Test the detail only returns the fields asked for."""
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            {'fields': 'title,image_renditions'},
+        )
+
+        self.assertEqual(res.data, {
+            'title': 'Sample recipe',
+            'image_renditions': {},
+        })
+
+    def test_unknown_field(self):
+        """Test asking for a field that doesn't exist returns a 400."""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,password'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fields_ignored_when_writing(self):
+        """Test updating a recipe isn't affected by the fields."""
+        res = self.client.patch(
+            f'{detail_url(self.recipe.id)}?fields=id',
+            {'title': 'New title'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'New title')
@@ -0,0 +1,302 @@
+"""
+Tests for the recipe statistics.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from core.models import Recipe, RecipeStats, Tag
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recipe import stats
+
+STATS_URL = reverse('recipe:stats')
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicStatsApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to read the stats."""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatsApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def assertStatsUpToDate(self):
+        """Assert the kept stats are the ones built from the recipes."""
+        kept = RecipeStats.objects.get(user=self.user)
+        built = stats.build(self.user.pk)
+        for field in ('recipe_count', 'total_time_minutes', 'total_price',
+                      'price_buckets', 'tag_counts'):
+            self.assertEqual(
+                getattr(kept, field),
+                getattr(built, field),
+                field,
+            )
+
+    def test_retrieve_stats(self):
+        """Test reading the stats of the user's recipes."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = create_recipe(self.user, time_minutes=10, price='4.00')
+            first.tags.add(vegan, quick)
+            second = create_recipe(self.user, time_minutes=31,
+                                   price='12.50')
+            second.tags.add(vegan)
+            other = get_user_model().objects.create_user('other@example.com')
+            create_recipe(other, price='500')
+
+        with self.assertNumQueries(2):
+            res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_time_minutes'], 20.5)
+        self.assertEqual(res.data['average_price'], '8.25')
+        distribution = res.data['price_distribution']
+        self.assertEqual(
+            [bucket['recipe_count'] for bucket in distribution],
+            [1, 0, 1, 0, 0, 0],
+        )
+        self.assertEqual(distribution[0]['min_price'], '0.00')
+        self.assertIsNone(distribution[-1]['max_price'])
+        self.assertEqual(res.data['top_tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'recipe_count': 2},
+            {'id': quick.id, 'name': 'Quick', 'recipe_count': 1},
+        ])
+
+    def test_averages_rounded_half_up(self):
+        """Test the averages are rounded half up, like on paper."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for time_minutes, price in ((20, '0.01'), (20, '0.01'),
+                                        (20, '0.03'), (21, '0.05')):
+                create_recipe(self.user, time_minutes=time_minutes,
+                              price=price)
+
+        res = self.client.get(STATS_URL)
+
+        # 81 / 4 = 20.25 & 0.10 / 4 = 0.025.
+        self.assertEqual(res.data['average_time_minutes'], 20.3)
+        self.assertEqual(res.data['average_price'], '0.03')
+
+    def test_empty_stats(self):
+        """Test the stats of a user without recipes."""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['average_time_minutes'])
+        self.assertIsNone(res.data['average_price'])
+        self.assertEqual(res.data['top_tags'], [])
+
+    def test_stats_kept_through_api(self):
+        """Test the stats follow the creates, updates & deletes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Curry',
+                'time_minutes': 30,
+                'price': '7.00',
+                'tags': [{'name': 'Spicy'}, {'name': 'Dinner'}],
+            }, format='json')
+            self.client.post(RECIPES_URL, {
+                'title': 'Salad',
+                'time_minutes': 5,
+                'price': '3.00',
+                'tags': [{'name': 'Dinner'}],
+            }, format='json')
+        self.assertStatsUpToDate()
+
+        recipe_id = res.data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(recipe_id), {
+                'price': '70.00',
+                'tags': [{'name': 'Dinner'}, {'name': 'Vegan'}],
+            }, format='json')
+        self.assertStatsUpToDate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url(recipe_id))
+        self.assertStatsUpToDate()
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(res.data['top_tags'][0]['name'], 'Dinner')
+
+    def test_stats_kept_through_relations(self):
+        """Test the stats follow the tags, changed from either side."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes = [create_recipe(self.user) for _ in range(3)]
+            vegan.recipe_set.add(*recipes)
+            recipes[0].tags.add(quick)
+        self.assertStatsUpToDate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.remove(recipes[1])
+            recipes[0].tags.clear()
+        self.assertStatsUpToDate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vegan.recipe_set.clear()
+            recipes[2].tags.set([quick])
+        self.assertStatsUpToDate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quick.delete()
+        self.assertStatsUpToDate()
+        self.assertEqual(RecipeStats.objects.get(user=self.user).tag_counts,
+                         {})
+
+    def test_bulk_write_counted(self):
+        """Test the bulk writes, without model signals, update the stats."""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(BULK_URL, [
+                {'title': 'A', 'time_minutes': 5, 'price': '1.00',
+                 'tags': [{'name': 'Quick'}]},
+                {'title': 'B', 'time_minutes': 50, 'price': '25.00'},
+            ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertStatsUpToDate()
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).recipe_count,
+            2,
+        )
+
+    def test_bulk_update_counts_changes(self):
+        """Test a bulk update counts the old values of the recipes out."""
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user, time_minutes=5, price='1.00')
+            recipe.tags.add(quick)
+            create_recipe(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(BULK_URL, [
+                {'id': recipe.id, 'title': 'A', 'time_minutes': 60,
+                 'price': '75.00', 'tags': [{'name': 'Slow'}]},
+            ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertStatsUpToDate()
+
+    def test_bulk_write_reads_its_recipes_only(self):
+        """Test a bulk write adds its changes, the stats aren't built."""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user)
+        # Drifted, which a rebuild would fix.
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(BULK_URL, [
+                {'title': 'A', 'time_minutes': 5, 'price': '1.00'},
+            ], format='json')
+
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).recipe_count,
+            8,
+        )
+
+    def test_changes_of_transaction_saved_once(self):
+        """Test the changes made in a transaction update the stats once."""
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = create_recipe(self.user)
+            recipe.tags.add(quick)
+
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+
+        updates = [
+            query for query in queries
+            if query['sql'].startswith('UPDATE "core_recipestats"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertStatsUpToDate()
+
+    def test_rolled_back_changes_not_counted(self):
+        """Test the changes are only counted once they're committed."""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    create_recipe(self.user)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            create_recipe(self.user, time_minutes=5)
+
+        kept = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(kept.recipe_count, 1)
+        self.assertEqual(kept.total_time_minutes, 5)
+
+    def test_missing_stats_built_on_read(self):
+        """Test the stats of a user without a row are built when read."""
+        create_recipe(self.user, time_minutes=40)
+        RecipeStats.objects.filter(user=self.user).delete()
+        # Changes are skipped until the stats are built.
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user, time_minutes=20)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_time_minutes'], 30)
+        self.assertStatsUpToDate()
+
+    def test_rebuild_command_fixes_drift(self):
+        """Test the command reconciles the stats with the recipes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user)
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=7)
+
+        out = StringIO()
+        call_command('rebuild_recipe_stats', '--check', stdout=out)
+        self.assertIn(f'User {self.user.pk}: recipe_count drifted.',
+                      out.getvalue())
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).recipe_count,
+            7,
+        )
+
+        out = StringIO()
+        call_command('rebuild_recipe_stats', stdout=out)
+        self.assertIn('1 drifted', out.getvalue())
+        self.assertStatsUpToDate()
@@ -7,7 +7,7 @@ from core.models import Recipe, Tag
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
-from recipe.serializers import TagSerializer
+from recipe.serializers import TagUsageSerializer
 from rest_framework import status
 from rest_framework.test import APIClient
 
@@ -53,7 +53,7 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         tags = Tag.objects.all().order_by('-name')
-        serializer = TagSerializer(tags, many=True)
+        serializer = TagUsageSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
@@ -82,6 +82,27 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_retrieve_tag_not_allowed(self):
+        """Test a tag can't be read on its own, only in the list."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(detail_url(tag.id))
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_update_tag_duplicate_name_error(self):
+        """Test renaming a tag to a name the user already has fails."""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='After Dinner')
+
+        payload = {'name': 'Dessert'}
+        url = detail_url(tag.id)
+        res = self.client.patch(url, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'After Dinner')
+
     def test_delete_tag(self):
         """Test deleting a tag."""
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -103,12 +124,14 @@ class PrivateTagsApiTests(TestCase):
             price=Decimal('2.50'),
             user=self.user,
         )
-        recipe.tags.add(tag1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(tag1)
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        s1 = TagSerializer(tag1)
-        s2 = TagSerializer(tag2)
+        tag1.refresh_from_db()
+        s1 = TagUsageSerializer(tag1)
+        s2 = TagUsageSerializer(tag2)
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
@@ -128,9 +151,17 @@ class PrivateTagsApiTests(TestCase):
             price=Decimal('2.00'),
             user=self.user,
         )
-        recipe1.tags.add(tag)
-        recipe2.tags.add(tag)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe1.tags.add(tag)
+            recipe2.tags.add(tag)
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_invalid_assigned_only_error(self):
+        """Test an assigned_only other than 0 or 1 is a bad request."""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('assigned_only', res.data)
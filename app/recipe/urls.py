@@ -26,4 +26,10 @@ app_name = 'recipe'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    path(
+        'cache-stats/',
+        views.CacheStatsView.as_view(),
+        name='cache-stats',
+    ),
 ]
@@ -1,16 +1,307 @@
 """
 Views for the recipe APIs
 """
+import hashlib
+
+from core.asynchronous import async_view
+from core.db import routers
 from core.models import Ingredient, Recipe, Tag
+from core.signals import forget_marks
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.utils.translation import gettext as _
 from drf_spectacular.utils import (OpenApiParameter, OpenApiTypes,
                                    extend_schema, extend_schema_view)
-from rest_framework import mixins, status, viewsets
+from rest_framework import mixins, status, views, viewsets
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from user.authentication import SignedTokenAuthentication
+
+from recipe import (autocomplete, cache, export, pagination, search,
+                    serializers, stats)
+from recipe.bulk import MAX_BULK_ITEMS, RecipeBulkWriter
+
+# The most names the autocomplete returns at once.
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+# The most recipe ids a shopping list takes at once.
+MAX_SHOPPING_LIST_IDS = 1000
+
+# The orders of the tag & ingredient lists, by the '?sort=' asking for it.
+ATTR_SORTS = {
+    'name': ('-name', 'id'),
+    'popularity': ('-recipe_count', 'id'),
+}
+
+# The columns needed by the fields that aren't a column of their own.
+FIELD_COLUMNS = {
+    'image_renditions': ['image', 'image_renditions'],
+}
+
+FIELDS_PARAMETER = OpenApiParameter(
+    'fields',
+    OpenApiTypes.STR,
+    description='Comma separated list of the fields to return, \
+                e.g. "id,title"',
+)
+EXPAND_PARAMETER = OpenApiParameter(
+    'expand',
+    OpenApiTypes.STR,
+    description='Comma separated list of the detail fields to add \
+                to the list, e.g. "description,image"',
+)
+
+STREAM_PARAMETER = OpenApiParameter(
+    'stream',
+    OpenApiTypes.INT,
+    enum=[0, 1],
+    description='1 to stream the unpaginated list, \
+                without holding all of it in memory',
+)
+
+
+class AsyncViewMixin:
+    """
+    Serve the viewset with async views when 'settings.ASYNC_VIEWS' is on,
+    for ASGI, see 'core.asynchronous'. The requests (the writes too, as
+    e.g. the list & the creation share a view) then run in a shared pool
+    of threads, which keep their database connections, and a slow client
+    only holds the event loop, not a thread.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if settings.ASYNC_VIEWS:
+            return async_view(view)
+        return view
+
+
+class ReplicaReadMixin:
+    """
+    Read from a replica of the database in the safe requests (GET, HEAD &
+    OPTIONS), & from the primary in the others & the next requests of the
+    same user for a while, see 'core.db.routers'. The authentication is
+    read from the primary, as it happens before the routing starts, and
+    so is the rest of a streamed response, sent after it ends.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._routing = routers.start_request(
+            request.user.pk,
+            request.method in SAFE_METHODS,
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        self._routing = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._routing is not None:
+                routers.end_request(self._routing)
+
+
+class CachedListMixin:
+    """
+    Cache the 'list' responses of a viewset per user.
+
+    The responses are cached under the user, the path & the query
+    parameters, and any write to the user's recipes, tags or ingredients
+    invalidates them (see 'recipe.cache' & 'recipe.signals'). The
+    'X-Cache' header of the response tells if it came from the cache.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
 
-from recipe import serializers
+    def _cached(self, handler, request, *args, **kwargs):
+        """Return the cached response, or call 'handler' & cache it."""
+        key = cache.response_key(request)
+        data = cache.get_response(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        # Only cache successful responses, not e.g. a 404, nor a streamed
+        # one, which is sent before it's complete.
+        if (
+            response.status_code == status.HTTP_200_OK
+            and not response.streaming
+        ):
+            cache.set_response(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class CachedReadMixin(CachedListMixin):
+    """
+    Cache the 'list' & 'retrieve' responses of a viewset per user.
+
+    Only for viewsets with a 'retrieve': the router routes the GETs of
+    the details to any viewset with the method, even a mixin's.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
+
+
+class FastListMixin:
+    """
+    Serve the 'list' without the serializer when the view has a faster
+    way to build the same output, i.e. 'get_fast_list_serializer()'
+    returns an object with 'values(queryset)', 'to_representation(rows)'
+    & 'chunks(rows)'.
+
+    An unpaginated list is streamed with '?stream=1', if the renderer can
+    ('ORJSONRenderer' can): the recipes are read, serialized & sent a
+    chunk at a time, so the memory used doesn't grow with the length of
+    the list. The output is the same as without '?stream=1'.
+    """
+
+    def get_fast_list_serializer(self):
+        """Return the fast serializer for the request, or None."""
+        return None
+
+    def _stream_requested(self):
+        """Return True if the client asked for a streamed list."""
+        return (
+            self.request.query_params.get(STREAM_PARAMETER.name) == '1'
+            and hasattr(self.request.accepted_renderer, 'render_stream')
+        )
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_fast_list_serializer()
+        if serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = serializer.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.to_representation(page),
+            )
+
+        if self._stream_requested():
+            renderer = request.accepted_renderer
+            return StreamingHttpResponse(
+                renderer.render_stream(serializer.chunks(rows)),
+                content_type=renderer.media_type,
+            )
+
+        return Response(serializer.to_representation(rows))
+
+
+class ConditionalGetMixin:
+    """
+    Support conditional GET requests on 'list' & 'retrieve' of recipes.
+
+    The responses get a strong 'ETag' & a 'Last-Modified' header, computed
+    with one primary key lookup (or none at all, when cached):
+        - the detail uses the 'modified_at' of the recipe,
+        - the list uses the 'recipes_modified_at' of the user, which
+          changes on any write to their recipes, tags or ingredients,
+          deletes included (see 'core.signals').
+    If the client already has the current version, i.e. it sent a matching
+    'If-None-Match' or 'If-Modified-Since' header, we answer with an
+    empty '304 Not Modified' before the serializer runs.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            self._list_validators,
+            super().list,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            self._detail_validators,
+            super().retrieve,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def _etag(self, *parts):
+        """Return an ETag of the parts, the request & response format."""
+        parts += (
+            self.request.accepted_renderer.format,
+            sorted(self.request.query_params.lists()),
+        )
+        return hashlib.md5(
+            repr(parts).encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+
+    def _list_validators(self):
+        """Return the validators of the list of recipes."""
+        # 'request.user' isn't loaded from the database with the signed
+        # tokens, so the marker is always read by the primary key.
+        modified_at = get_user_model().objects.filter(
+            pk=self.request.user.pk,
+        ).values_list('recipes_modified_at', flat=True).first()
+        forget_marks()
+        if modified_at is None:
+            return None
+
+        return self._validators(modified_at)
+
+    def _detail_validators(self):
+        """Return the validators of a recipe, or None if not found."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        modified_at = self.get_queryset().filter(**{
+            self.lookup_field: self.kwargs[lookup_url_kwarg],
+        }).values_list('modified_at', flat=True).first()
+        forget_marks()
+        if modified_at is None:
+            return None
+
+        return self._validators(modified_at, self.kwargs[lookup_url_kwarg])
+
+    def _validators(self, modified_at, *parts):
+        """Return the ETag & Last-Modified of a version of a response."""
+        etag = self._etag(modified_at, *parts)
+        # HTTP dates have a resolution of one second.
+        return (etag, int(modified_at.timestamp()))
+
+    def _conditional(self, validators, handler, request, *args, **kwargs):
+        """Answer with a 304 if the client has the current version."""
+        validators = cache.get_validators(request, validators)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request,
+            etag=quote_etag(etag),
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            response['ETag'] = quote_etag(etag)
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
 
 
 @extend_schema_view(
@@ -26,16 +317,34 @@ from recipe import serializers
                 OpenApiTypes.STR,
                 description='Comma separated list \
                             of ingredient IDs to filter',
-            )
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Words to search in the titles, descriptions, \
+                            tags & ingredients, best matches first',
+            ),
+            FIELDS_PARAMETER,
+            EXPAND_PARAMETER,
+            STREAM_PARAMETER,
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=[FIELDS_PARAMETER]),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AsyncViewMixin,
+                    ReplicaReadMixin,
+                    ConditionalGetMixin,
+                    CachedReadMixin,
+                    FastListMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = pagination.RecipeCursorPagination
+    # Build the list with 'FastRecipeListSerializer' when it can.
+    fast_list = True
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers."""
@@ -43,28 +352,128 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # format ["1, 2, 3"] and turn it into an integer list [1, 2, 3].
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _ids_param(self, name):
+        """
+        Return the IDs of a comma separated query parameter, or None when
+        it isn't given.
+        """
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return self._params_to_ints(value)
+        except ValueError:
+            msg = _('Expected a comma separated list of IDs.')
+            raise ValidationError({name: [msg]})
+
     # Override the 'get_queryset' method, so this viewset
     # will show only recipes that the authenticated user
     # requesting the page has made. IT'S BASICALLY AN ADDITIONAL
     # FILTER TO THE 'Recipe.objects.all()' QUERYSET!
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        tag_ids = self._ids_param('tags')
+        ingredient_ids = self._ids_param('ingredients')
         queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        # The filters are EXISTS subqueries instead of joins, a recipe with
+        # two matching tags would be joined twice, so the joins needed a
+        # 'distinct()', i.e. sorting & deduplicating the whole result.
+        if tag_ids is not None:
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'),
+                    tag_id__in=tag_ids,
+                )
+            ))
+        if ingredient_ids is not None:
+            queryset = queryset.filter(Exists(
+                Recipe.ingredients.through.objects.filter(
+                    recipe_id=OuterRef('pk'),
+                    ingredient_id__in=ingredient_ids,
+                )
+            ))
 
-        return queryset.filter(
+        # 'prefetch_related' loads the tags & ingredients of every recipe
+        # on the page with one extra query each, instead of the serializer
+        # firing two queries per recipe (the classic N+1 problem).
+        # Only the relations & the columns of the fields the client asked
+        # for are loaded, e.g. '?fields=id,title' needs no prefetch.
+        # They're ordered by id, like in 'FastRecipeListSerializer'.
+        fields = self._response_fields()
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).prefetch_related(*(
+            Prefetch(name, queryset=model.objects.order_by('id'))
+            for name, model in (('tags', Tag), ('ingredients', Ingredient))
+            if fields is None or name in fields
+        ))
+        if fields is not None:
+            queryset = queryset.only(*self._columns(fields))
 
-    def get_serializer_class(self):
-        """Return the serializer class for request."""
+        if self._search_text():
+            queryset = search.search(queryset, self._search_text())
+            return queryset.order_by('-rank', '-id')
+
+        return queryset.order_by('-id')
+
+    def _search_text(self):
+        """Return the text the recipe list is searched for, if any."""
+        if self.action != 'list':
+            return ''
+        return self.request.query_params.get('search', '').strip()
+
+    @property
+    def paginator(self):
+        """
+        Return the paginator, the search results are always paginated.
+        """
+        if not hasattr(self, '_paginator') and self._search_text():
+            self._paginator = pagination.RecipeSearchPagination()
+        return super().paginator
+
+    def _split_param(self, name):
+        """Return the comma separated values of a query parameter."""
+        value = self.request.query_params.get(name, '')
+        return {item.strip() for item in value.split(',') if item.strip()}
+
+    def _response_fields(self):
+        """
+        Return the names of the fields to return, or None for all the
+        fields of the serializer.
+
+        '?fields=id,title' returns only the fields listed, and on the list
+        '?expand=description' adds fields of the recipe detail to the
+        fields of the list. Both apply to reading only.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None
+        fields = self._split_param('fields')
+        expand = self._split_param('expand')
+        if not fields and not expand:
+            return None
+
+        available = serializers.RecipeDetailSerializer.Meta.fields
+        unknown = (fields | expand) - set(available)
+        if unknown:
+            msg = _('Unknown fields: %(fields)s.') % {
+                'fields': ', '.join(sorted(unknown)),
+            }
+            raise ValidationError({'fields': [msg]})
+
+        if not fields:
+            fields = set(self._default_serializer_class().Meta.fields)
+        return fields | expand
+
+    def _columns(self, fields):
+        """Return the columns of the recipe table the fields need."""
+        columns = {'id'}
+        for name in fields - {'tags', 'ingredients'}:
+            columns.update(FIELD_COLUMNS.get(name, [name]))
+
+        return columns
+
+    def _default_serializer_class(self):
+        """Return the serializer class of the action, ignoring 'expand'."""
         # If the action is 'list' we return the 'RecipeSerializer'
         # and if it's not we return the serializer
         # configured in the 'serializer_class'
@@ -75,6 +484,38 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def get_serializer_class(self):
+        """Return the serializer class for request."""
+        serializer_class = self._default_serializer_class()
+        # The list is rendered with the detail serializer when fields of
+        # the detail were asked for.
+        fields = self._response_fields()
+        if (
+            fields is not None
+            and self.action == 'list'
+            and fields - set(serializer_class.Meta.fields)
+        ):
+            return serializers.RecipeDetailSerializer
+
+        return serializer_class
+
+    def get_fast_list_serializer(self):
+        """Return the fast serializer, unless 'expand' needs the slow one."""
+        if (
+            not self.fast_list
+            or self.get_serializer_class() is not serializers.RecipeSerializer
+        ):
+            return None
+
+        return serializers.FastRecipeListSerializer(self._response_fields())
+
+    def get_serializer_context(self):
+        """Pass the fields to return to the serializer."""
+        context = super().get_serializer_context()
+        context['fields'] = self._response_fields()
+
+        return context
+
     def perform_create(self, serializer):
         """
         Create a new recipe.
@@ -104,6 +545,179 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # A list action (detail=False) for importing many recipes with one
+    # request, instead of one POST per recipe.
+    @extend_schema(
+        request=serializers.RecipeSerializer(many=True),
+        responses=serializers.RecipeBulkResultSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """
+        Create or update many recipes at once.
+
+        Takes a list of recipes, the ones with an 'id' update that recipe
+        & the others create a new one. Items that fail validation are
+        reported back with their errors, the valid ones are still saved.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            msg = _('Expected a non-empty list of recipes.')
+            return Response(
+                {'non_field_errors': [msg]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > MAX_BULK_ITEMS:
+            msg = _('Send at most %(max)d recipes at once.') % {
+                'max': MAX_BULK_ITEMS,
+            }
+            return Response(
+                {'non_field_errors': [msg]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        writer = RecipeBulkWriter(request.user, self.get_serializer_context())
+        results = writer.write(items)
+
+        failed = sum('errors' in result for result in results)
+        if failed == len(results):
+            status_code = status.HTTP_400_BAD_REQUEST
+        elif failed:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_201_CREATED
+
+        return Response(results, status=status_code)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ids',
+                OpenApiTypes.STR,
+                description=f'Comma separated list of recipe IDs, at most \
+                            {MAX_SHOPPING_LIST_IDS}',
+            ),
+            OpenApiParameter(
+                'tags',
+                OpenApiTypes.STR,
+                description='Comma separated list of IDs to filter',
+            ),
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated list \
+                            of ingredient IDs to filter',
+            ),
+        ],
+        responses=serializers.ShoppingListItemSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """
+        Return the ingredients of many recipes, each once, with the number
+        of those recipes using it, alphabetically.
+
+        The recipes are the ones in 'ids', or filtered like the list (by
+        'tags' or 'ingredients'), or both. Like the list, the response is
+        cached & has an ETag, until the user changes their recipes.
+        """
+        return self._conditional(
+            self._list_validators,
+            lambda request: self._cached(self._shopping_list, request),
+            request,
+        )
+
+    def _shopping_list(self, request):
+        """Build the shopping list, see 'shopping_list()'."""
+        if not any(
+            request.query_params.get(name)
+            for name in ('ids', 'tags', 'ingredients')
+        ):
+            msg = _('Give the recipe "ids", or "tags" or "ingredients" to '
+                    'filter them.')
+            raise ValidationError({'non_field_errors': [msg]})
+
+        recipes = self.get_queryset()
+        recipe_ids = self._ids_param('ids')
+        if recipe_ids is not None:
+            if len(recipe_ids) > MAX_SHOPPING_LIST_IDS:
+                msg = _('Give at most %(max)d recipes at once.') % {
+                    'max': MAX_SHOPPING_LIST_IDS,
+                }
+                raise ValidationError({'ids': [msg]})
+            recipes = recipes.filter(id__in=recipe_ids)
+
+        # One grouped query over the links of the recipes, with the
+        # recipes as a subquery, however many there are.
+        items = Recipe.ingredients.through.objects.filter(
+            recipe__in=recipes.values('id'),
+        ).values('ingredient_id', 'ingredient__name').annotate(
+            recipe_count=Count('recipe_id'),
+        ).order_by('ingredient__name', 'ingredient_id')
+
+        return Response(
+            serializers.ShoppingListItemSerializer(items, many=True).data,
+        )
+
+    # The format is read from 'file_format', because 'format' is what DRF
+    # uses to pick the renderer of the response.
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'file_format',
+                OpenApiTypes.STR,
+                enum=list(export.CONTENT_TYPES),
+                description='The format of the export, "ndjson" (the \
+                            default) or "csv"',
+            ),
+            OpenApiParameter(
+                'tags',
+                OpenApiTypes.STR,
+                description='Comma separated list of IDs to filter',
+            ),
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated list \
+                            of ingredient IDs to filter',
+            ),
+        ],
+        responses={
+            (status.HTTP_200_OK, content_type.split(';')[0]): OpenApiTypes.STR
+            for content_type in export.CONTENT_TYPES.values()
+        },
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """
+        Download all the recipes of the user at once.
+
+        The recipes are streamed as NDJSON (one JSON object per line) or as
+        CSV, newest first, and can be filtered like the list.
+        """
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in export.CONTENT_TYPES:
+            msg = _('Choose one of: %(formats)s.') % {
+                'formats': ', '.join(export.CONTENT_TYPES),
+            }
+            raise ValidationError({'file_format': [msg]})
+
+        serializer = serializers.RecipeExportSerializer()
+        chunks = serializer.chunks(serializer.values(self.get_queryset()))
+        if file_format == 'csv':
+            content = export.csv_stream(chunks, serializer.fields)
+        else:
+            content = export.ndjson_stream(chunks)
+
+        response = StreamingHttpResponse(
+            content,
+            content_type=export.CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{file_format}"'
+        )
+        return response
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -112,40 +726,135 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes.',
-            )
+            ),
+            OpenApiParameter(
+                'sort',
+                OpenApiTypes.STR, enum=list(ATTR_SORTS),
+                description='By name (the default), or the most used first.',
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(AsyncViewMixin,
+                            ReplicaReadMixin,
+                            CachedListMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = pagination.RecipeAttrCursorPagination
+    # The order of the list, also followed by the pagination.
+    ordering = ATTR_SORTS['name']
 
     def get_queryset(self):
         """Filter queryset to authenticated user."""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
+        assigned_only = self.request.query_params.get('assigned_only', '0')
+        if assigned_only not in ('0', '1'):
+            msg = _('Choose one of: 0, 1.')
+            raise ValidationError({'assigned_only': [msg]})
+        sort = self.request.query_params.get('sort', 'name')
+        if sort not in ATTR_SORTS:
+            msg = _('Choose one of: %(sorts)s.') % {
+                'sorts': ', '.join(ATTR_SORTS),
+            }
+            raise ValidationError({'sort': [msg]})
+        self.ordering = ATTR_SORTS[sort]
+
         queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        if assigned_only == '1':
+            # The number of recipes is kept on the row (see
+            # 'recipe.counts'), so this is answered from a partial index,
+            # without joining the links.
+            queryset = queryset.filter(recipe_count__gt=0)
         # Let's filter the ingredients & tags to only
         # those that the user requesting the serializer has created.
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by(*self.ordering)
+
+    def get_serializer_class(self):
+        # The autocomplete matches come from an index of the names alone.
+        if self.action == 'autocomplete':
+            return self.autocomplete_serializer_class
+        return super().get_serializer_class()
+
+    # Called on every keystroke of the recipe editor, so this is answered
+    # from an index in memory instead of the database when possible.
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='The start of the name, case & accent \
+                            insensitive',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description=f'The maximum number of names returned, \
+                            at most {MAX_AUTOCOMPLETE_LIMIT}',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Return the names starting with a prefix, alphabetically."""
+        prefix = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, MAX_AUTOCOMPLETE_LIMIT))
+
+        matches = autocomplete.complete(
+            self.queryset.model,
+            request.user.pk,
+            prefix,
+            limit,
+        )
+        serializer = self.get_serializer(matches, many=True)
+
+        return Response(serializer.data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
-    serializer_class = serializers.TagSerializer
+    serializer_class = serializers.TagUsageSerializer
+    autocomplete_serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database."""
-    serializer_class = serializers.IngredientSerializer
+    serializer_class = serializers.IngredientUsageSerializer
+    autocomplete_serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class RecipeStatsView(views.APIView):
+    """
+    Show the statistics of the recipes of the user, read from the summary
+    kept up to date as they change, see 'recipe.stats'.
+    """
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses=serializers.RecipeStatsSerializer)
+    def get(self, request):
+        summary = stats.get_stats(request.user.pk)
+        return Response(
+            serializers.RecipeStatsSerializer(stats.to_dict(summary)).data,
+        )
+
+
+class CacheStatsView(views.APIView):
+    """Show the hit & miss counters of the recipe response cache."""
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses=serializers.CacheStatsSerializer)
+    def get(self, request):
+        return Response(cache.get_stats())
@@ -11,6 +11,8 @@ from django.utils.translation import gettext as _
 # or create a model instance to our database
 from rest_framework import serializers
 
+from user import tokens
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object"""
@@ -57,6 +59,9 @@ class UserSerializer(serializers.ModelSerializer):
         if password:
             user.set_password(password)
             user.save()
+            # The signed tokens issued with the old password must not
+            # keep working after the password has been changed.
+            tokens.revoke_user_tokens(user)
 
         return user
 
@@ -93,3 +98,45 @@ class AuthTokenSerializer(serializers.Serializer):
         # 'user' attribute
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for swapping a refresh token for new tokens."""
+    refresh = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, attrs):
+        """Check the refresh token & issue a new pair of tokens."""
+        try:
+            attrs['tokens'] = tokens.refresh_tokens(attrs['refresh'])
+        except tokens.InvalidToken:
+            msg = _('Invalid or expired refresh token.')
+            raise serializers.ValidationError(msg, code='authorization')
+
+        return attrs
+
+
+class RevokeTokenSerializer(serializers.Serializer):
+    """Serializer for revoking (logging out) signed tokens."""
+    refresh = serializers.CharField(required=False, trim_whitespace=False)
+
+    def save(self):
+        """Revoke the refresh token, if one was given."""
+        refresh = self.validated_data.get('refresh')
+        if not refresh:
+            return
+
+        try:
+            tokens.revoke_refresh_token(refresh)
+        except tokens.InvalidToken:
+            msg = _('Invalid or expired refresh token.')
+            raise serializers.ValidationError(
+                {'refresh': [msg]},
+                code='authorization',
+            )
+
+
+class TokenPairSerializer(serializers.Serializer):
+    """Serializer for a pair of signed tokens."""
+    access = serializers.CharField()
+    refresh = serializers.CharField()
+    expires_in = serializers.IntegerField()
@@ -0,0 +1,45 @@
+"""
+Signal receivers of the user app.
+
+The access tokens carry the permission flags of the user (see
+'user.tokens'), so they're checked without loading the user. When a user
+is deactivated, or gains or loses admin rights, the tokens issued before
+are revoked, so the old flags stop working at once rather than when the
+tokens expire. Only saving the user is seen: a 'QuerySet.update()' of
+the flags must call 'user.tokens.revoke_user_tokens()' itself.
+"""
+from django.conf import settings
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from user import tokens
+
+
+def _permissions(user):
+    """
+    Return the permission flags of the user, the loaded ones only, so a
+    deferred field isn't read from the database just for this.
+    """
+    return {
+        field: user.__dict__[field]
+        for field in tokens.PERMISSION_CLAIMS.values()
+        if field in user.__dict__
+    }
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_permissions(sender, instance, **kwargs):
+    instance._token_permissions = _permissions(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_on_permission_change(sender, instance, created, **kwargs):
+    permissions = _permissions(instance)
+    changed = any(
+        permissions[field] != value
+        for field, value in instance._token_permissions.items()
+        if field in permissions
+    )
+    if not created and changed:
+        tokens.revoke_user_tokens(instance)
+    instance._token_permissions = permissions
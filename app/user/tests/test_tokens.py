@@ -0,0 +1,292 @@
+"""
+Tests for the signed access & refresh tokens.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from user.tokens import (InvalidToken, issue_tokens, revoke_user_tokens,
+                         verify_access_token)
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+CACHE_STATS_URL = reverse('recipe:cache-stats')
+
+
+def create_user(**params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(**params)
+
+
+class SignedTokenTests(TestCase):
+    """Test authenticating with signed tokens."""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        caches['tokens'].clear()
+
+    def _login(self, password='testpass123'):
+        """Log in and return the tokens."""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': password,
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def _get(self, url, access):
+        """GET the url authenticated with a signed access token."""
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_create_token_returns_signed_tokens(self):
+        """Test the token endpoint returns both kinds of tokens."""
+        tokens = self._login()
+
+        self.assertIn('token', tokens)
+        self.assertIn('access', tokens)
+        self.assertIn('refresh', tokens)
+        self.assertIn('expires_in', tokens)
+
+    def test_access_token_authenticates(self):
+        """Test a signed access token authenticates the user."""
+        tokens = self._login()
+
+        res = self._get(ME_URL, tokens['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'name': self.user.name,
+            'email': self.user.email,
+        })
+
+    def test_access_token_needs_no_query(self):
+        """Test checking an access token doesn't query the database."""
+        tokens = self._login()
+        # The revocations are read from the database by the first request
+        # after the cache was emptied.
+        self._get(ME_URL, tokens['access'])
+
+        # The only query is the one listing the tags.
+        with self.assertNumQueries(1):
+            res = self._get(TAGS_URL, tokens['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_opaque_token_still_works(self):
+        """Test the opaque token keeps working next to the signed ones."""
+        tokens = self._login()
+
+        res = self.client.get(
+            ME_URL,
+            HTTP_AUTHORIZATION=f'Token {tokens["token"]}',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_tampered_token_rejected(self):
+        """Test a token with a broken signature is rejected."""
+        tokens = self._login()
+
+        res = self._get(ME_URL, tokens['access'][:-2] + 'xx')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_is_not_an_access_token(self):
+        """Test a refresh token can't be used to authenticate."""
+        tokens = self._login()
+
+        res = self._get(ME_URL, tokens['refresh'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_access_token_rejected(self):
+        """Test an expired access token is rejected."""
+        tokens = self._login()
+
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            res = self._get(ME_URL, tokens['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_profile_with_access_token(self):
+        """Test updating the profile keeps the fields not in the token."""
+        tokens = self._login()
+
+        res = self.client.patch(
+            ME_URL,
+            {'email': 'new@example.com'},
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'new@example.com')
+        self.assertEqual(self.user.name, 'Test Name')
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    def test_refresh_tokens(self):
+        """Test swapping a refresh token for new tokens."""
+        tokens = self._login()
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['refresh'], tokens['refresh'])
+        res = self._get(ME_URL, res.data['access'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_refresh_token_single_use(self):
+        """Test a refresh token can only be used once."""
+        tokens = self._login()
+        self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_inactive_user_rejected(self):
+        """Test a deactivated user can't refresh their tokens."""
+        tokens = self._login()
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_access_token(self):
+        """Test an access token of an admin opens the admin views."""
+        tokens = self._login()
+        res = self._get(CACHE_STATS_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        tokens = self._login()
+        res = self._get(CACHE_STATS_URL, tokens['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user_access_token_rejected(self):
+        """Test deactivating a user revokes their access tokens."""
+        tokens = self._login()
+
+        self.user.is_active = False
+        self.user.save()
+
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        # Also when the revocation is read from the database again.
+        caches['tokens'].clear()
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_issued_just_before_revocation_rejected(self):
+        """Test a token issued less than a millisecond before is revoked."""
+        issued = timezone.now().replace(microsecond=600)
+        with patch('user.tokens.timezone.now', return_value=issued):
+            access = issue_tokens(self.user)['access']
+        revoked = issued.replace(microsecond=800)
+        with patch('user.tokens.timezone.now', return_value=revoked):
+            revoke_user_tokens(self.user)
+
+        with self.assertRaises(InvalidToken):
+            verify_access_token(access)
+
+    def test_admin_rights_removed_revokes_tokens(self):
+        """Test an admin losing their rights revokes their tokens."""
+        self.user.is_staff = True
+        self.user.save()
+        tokens = self._login()
+
+        user = get_user_model().objects.get(pk=self.user.pk)
+        user.is_staff = False
+        user.save()
+
+        res = self._get(CACHE_STATS_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_change_keeps_tokens(self):
+        """Test saving the profile of the user keeps the tokens working."""
+        tokens = self._login()
+
+        self.user.name = 'New Name'
+        self.user.save()
+
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_revoke_tokens(self):
+        """Test logging out revokes the access & refresh tokens."""
+        tokens = self._login()
+
+        res = self.client.post(
+            REVOKE_URL,
+            {'refresh': tokens['refresh']},
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_change_revokes_tokens(self):
+        """Test changing the password revokes the signed tokens."""
+        tokens = self._login()
+
+        res = self.client.patch(
+            ME_URL,
+            {'password': 'newpassword123'},
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        # The tokens issued with the new password work.
+        new_tokens = self._login(password='newpassword123')
+        res = self._get(ME_URL, new_tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_revocations_kept_when_cache_lost(self):
+        """Test the revoked tokens stay revoked after the cache is lost."""
+        revoked = self._login()
+        self.client.post(
+            REVOKE_URL,
+            {'refresh': revoked['refresh']},
+            HTTP_AUTHORIZATION=f'Bearer {revoked["access"]}',
+        )
+        tokens = self._login()
+        self.client.patch(
+            ME_URL,
+            {'password': 'newpassword123'},
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+        )
+        new_tokens = self._login(password='newpassword123')
+
+        caches['tokens'].clear()
+
+        res = self._get(ME_URL, revoked['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self._get(ME_URL, tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self._get(ME_URL, new_tokens['access'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,318 @@
+"""
+Signed access & refresh tokens for the user API.
+
+An access token is a short lived, HMAC signed (with the SECRET_KEY) set of
+claims about the user, so checking one needs no database query at all,
+unlike the opaque tokens of 'rest_framework.authtoken' that have to be
+looked up from the 'authtoken_token' table on every request.
+
+A refresh token lives longer and is only used to get a new pair of
+tokens. Refreshing loads the user from the database, so deactivating a
+user, changing their password or logging out stops the refresh token from
+working, for good.
+
+Revoked access tokens are kept in the 'tokens' cache until they would
+have expired anyway. The cache is the only thing checked on each request,
+so for the revocation to reach every worker the cache has to be shared by
+them, and it must never evict an entry (see 'CACHES' in the settings).
+The revocations are saved to the database as well: a cache that comes up
+empty, e.g. after a restart, is filled again from there before it's
+trusted.
+"""
+import time
+import uuid
+from datetime import timedelta
+
+from core.models import RevokedToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+# The signing salt makes an access token useless as a refresh token, and
+# the other way around, even though both are signed with the same key.
+SALTS = {
+    ACCESS: 'user.tokens.access',
+    REFRESH: 'user.tokens.refresh',
+}
+
+
+# The fields of the user, by claim, that decide what the user may do.
+# They're copied into the access tokens, & changing any of them revokes
+# the tokens issued before, see 'user.signals'.
+PERMISSION_CLAIMS = {
+    'active': 'is_active',
+    'staff': 'is_staff',
+    'superuser': 'is_superuser',
+}
+
+# Set in the cache once the revocations were loaded into it from the
+# database, see '_load_revocations()'.
+LOADED_KEY = 'user-tokens:loaded'
+
+
+class InvalidToken(Exception):
+    """The token is malformed, expired, revoked or of the wrong type."""
+
+
+def _lifetime(token_type):
+    """Return the lifetime of the given token type, in seconds."""
+    if token_type == ACCESS:
+        return settings.ACCESS_TOKEN_LIFETIME
+    return settings.REFRESH_TOKEN_LIFETIME
+
+
+def _password_fingerprint(user):
+    """
+    Return a short fingerprint of the password hash of the user.
+
+    Refresh tokens carry this, so they stop working as soon as the
+    password changes, without us having to keep track of them.
+    """
+    return salted_hmac(
+        'user.tokens.password',
+        user.password,
+    ).hexdigest()[:16]
+
+
+def _revoked_key(jti):
+    """Return the cache key that marks a token as revoked."""
+    return f'user-tokens:revoked:{jti}'
+
+
+def _not_before_key(user_id):
+    """Return the cache key of the 'issued after' cut-off of a user."""
+    return f'user-tokens:not-before:{user_id}'
+
+
+def _cache():
+    """Return the cache of the revoked access tokens."""
+    return caches['tokens']
+
+
+def _load_revocations():
+    """
+    Copy the revocations of the access tokens still valid from the
+    database into the cache.
+    """
+    now = timezone.now()
+    lifetime = timedelta(seconds=settings.ACCESS_TOKEN_LIFETIME)
+    entries = {}
+    # The refresh tokens are checked against the database anyway, only
+    # the ones expiring as soon as an access token could are read too.
+    for jti, expires_at in RevokedToken.objects.filter(
+        expires_at__gt=now,
+        expires_at__lte=now + lifetime,
+    ).values_list('jti', 'expires_at'):
+        entries[_revoked_key(jti)] = (True, expires_at - now)
+    for user_id, revoked_at in get_user_model().objects.filter(
+        tokens_revoked_at__gt=now - lifetime,
+    ).values_list('id', 'tokens_revoked_at'):
+        entries[_not_before_key(user_id)] = (
+            revoked_at.timestamp(),
+            revoked_at + lifetime - now,
+        )
+
+    token_cache = _cache()
+    for key, (value, remaining) in entries.items():
+        # Only added, not to undo a newer revocation stored meanwhile.
+        token_cache.add(key, value, int(remaining.total_seconds()) + 1)
+    token_cache.set(LOADED_KEY, True, None)
+
+
+def _encode(token_type, claims):
+    """Sign and return the claims as a token of the given type."""
+    claims = {
+        **claims,
+        'jti': uuid.uuid4().hex,
+        # Microseconds, like the cut-off of 'revoke_user_tokens()', so a
+        # token issued right before a revocation is never rounded up
+        # past it, & one issued right after is told apart.
+        'iat': timezone.now().timestamp(),
+    }
+    return signing.dumps(claims, salt=SALTS[token_type])
+
+
+def _decode(token_type, token):
+    """Check the signature & age of the token, return its claims."""
+    try:
+        return signing.loads(
+            token,
+            salt=SALTS[token_type],
+            max_age=_lifetime(token_type),
+        )
+    except signing.BadSignature as error:
+        # 'SignatureExpired' is a subclass of 'BadSignature'.
+        raise InvalidToken(str(error)) from error
+
+
+def issue_tokens(user):
+    """Create and return a new pair of tokens for the user."""
+    access = _encode(ACCESS, {
+        'uid': user.pk,
+        'email': user.email,
+        **{
+            claim: getattr(user, field)
+            for claim, field in PERMISSION_CLAIMS.items()
+        },
+    })
+    refresh = _encode(REFRESH, {
+        'uid': user.pk,
+        'pwd': _password_fingerprint(user),
+    })
+
+    return {
+        'access': access,
+        'refresh': refresh,
+        'expires_in': settings.ACCESS_TOKEN_LIFETIME,
+    }
+
+
+def verify_access_token(token):
+    """
+    Return the claims of a valid access token.
+
+    This is called on every authenticated request, so it must not touch
+    the database: the signature check is pure computation and the
+    revocation list lives in the cache, only read from the database when
+    the cache lost it.
+    """
+    claims = _decode(ACCESS, token)
+
+    keys = [
+        _revoked_key(claims['jti']),
+        _not_before_key(claims['uid']),
+        LOADED_KEY,
+    ]
+    revoked = _cache().get_many(keys)
+    if LOADED_KEY not in revoked:
+        _load_revocations()
+        revoked = _cache().get_many(keys)
+    if _revoked_key(claims['jti']) in revoked:
+        raise InvalidToken('Token has been revoked.')
+    not_before = revoked.get(_not_before_key(claims['uid']))
+    if not_before is not None and claims['iat'] < not_before:
+        raise InvalidToken('Token has been revoked.')
+
+    return claims
+
+
+def user_from_claims(claims):
+    """
+    Return a user built from the claims of an access token.
+
+    The user is NOT loaded from the database, it only has its id, email
+    & permission flags set, which is all the API needs to filter objects
+    by their owner & to check the permissions of the views. Anything that
+    needs the rest of the user must load it.
+    """
+    user = get_user_model()(
+        id=claims['uid'],
+        email=claims['email'],
+        # The tokens issued before the permission claims were added are
+        # of active users without any admin rights.
+        is_active=claims.get('active', True),
+        is_staff=claims.get('staff', False),
+        is_superuser=claims.get('superuser', False),
+    )
+    # Mark the user as an existing row, like one loaded from the database.
+    user._state.adding = False
+
+    return user
+
+
+def refresh_tokens(token):
+    """
+    Swap a refresh token for a new pair of tokens.
+
+    The refresh token is rotated, i.e. the old one is revoked, so a
+    stolen refresh token can only be used once.
+    """
+    claims = _decode(REFRESH, token)
+    user = get_user_model().objects.filter(
+        pk=claims['uid'],
+        is_active=True,
+    ).first()
+    if user is None:
+        raise InvalidToken('User not found.')
+    if not constant_time_compare(claims['pwd'], _password_fingerprint(user)):
+        raise InvalidToken('Token has been revoked.')
+    # Revoking the token also tells us if it was revoked already, even
+    # when two requests try to use the same token at the same time.
+    if not _revoke_refresh_claims(claims):
+        raise InvalidToken('Token has been revoked.')
+
+    return issue_tokens(user)
+
+
+def _remaining(claims, token_type):
+    """Return the number of seconds until the token expires."""
+    expires = claims['iat'] + _lifetime(token_type)
+    return max(0, expires - time.time())
+
+
+def _store_revoked(claims, token_type):
+    """
+    Store the token as revoked until it would expire.
+    Returns False if the token had been revoked before.
+    """
+    revoked_token, created = RevokedToken.objects.get_or_create(
+        jti=claims['jti'],
+        defaults={
+            'expires_at': timezone.now() + timedelta(
+                seconds=_remaining(claims, token_type),
+            ),
+        },
+    )
+    # The list only needs to remember tokens that haven't expired yet.
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+
+    return created
+
+
+def _revoke_refresh_claims(claims):
+    """
+    Store the refresh token as revoked until it would expire.
+    Returns False if the token had been revoked before.
+    """
+    return _store_revoked(claims, REFRESH)
+
+
+def revoke_access_claims(claims):
+    """Revoke an access token until it would have expired."""
+    remaining = _remaining(claims, ACCESS)
+    if remaining:
+        _store_revoked(claims, ACCESS)
+        _cache().set(_revoked_key(claims['jti']), True, int(remaining) + 1)
+
+
+def revoke_refresh_token(token):
+    """Revoke a refresh token, e.g. when the user logs out."""
+    _revoke_refresh_claims(_decode(REFRESH, token))
+
+
+def revoke_user_tokens(user):
+    """
+    Revoke every signed token issued to the user so far.
+
+    Used when the password or the permissions of the user change: the
+    refresh tokens stop working because of the password fingerprint, or
+    because they load the user, and the access tokens issued up to now
+    are cut off with a timestamp, in the database & the cache.
+    """
+    revoked_at = timezone.now()
+    get_user_model().objects.filter(pk=user.pk).update(
+        tokens_revoked_at=revoked_at,
+    )
+    # So saving the user again doesn't put back the old cut-off.
+    user.tokens_revoked_at = revoked_at
+    _cache().set(
+        _not_before_key(user.pk),
+        revoked_at.timestamp(),
+        settings.ACCESS_TOKEN_LIFETIME + 1,
+    )
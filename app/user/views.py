@@ -1,12 +1,20 @@
 """
 Views for the user API.
 """
-from rest_framework import authentication, generics, permissions
+from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema
+from rest_framework import authentication, generics, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from user import tokens
+from user.authentication import SignedTokenAuthentication
 # Create your views here.
-from user.serializers import AuthTokenSerializer, UserSerializer
+from user.serializers import (AuthTokenSerializer, RefreshTokenSerializer,
+                              RevokeTokenSerializer, TokenPairSerializer,
+                              UserSerializer)
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -19,6 +27,62 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """
+        Return the auth tokens of the user.
+
+        'token' is the opaque token of the 'rest_framework.authtoken' app,
+        sent as "Authorization: Token <token>". 'access' & 'refresh' are
+        the signed tokens, the access token is sent as
+        "Authorization: Bearer <access>" and checking it doesn't need a
+        database query. Both keep working, so clients can move over to
+        the signed tokens at their own pace.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+
+        return Response({'token': token.key, **tokens.issue_tokens(user)})
+
+
+class RefreshTokenView(generics.GenericAPIView):
+    """Swap a refresh token for a new pair of signed tokens."""
+    serializer_class = RefreshTokenSerializer
+
+    @extend_schema(responses=TokenPairSerializer)
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(serializer.validated_data['tokens'])
+
+
+class RevokeTokenView(generics.GenericAPIView):
+    """
+    Log out, i.e. revoke the signed tokens of the request.
+
+    The access token used to authenticate the request is revoked, and so
+    is the refresh token in the body, if there's one.
+    """
+    serializer_class = RevokeTokenSerializer
+    authentication_classes = [
+        SignedTokenAuthentication,
+        authentication.TokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses={204: None})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        if isinstance(request.successful_authenticator,
+                      SignedTokenAuthentication):
+            tokens.revoke_access_claims(request.auth)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 # generics.RetrieveUpdateAPIView -> provided by the Django REST Framework
 # to provide the functionality needed for retrieving & updating
@@ -28,7 +92,10 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     # Our update serializer is going to be the same as our create serializer
     # but luckily, the serializer knows which method to use
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        authentication.TokenAuthentication,
+    ]
     # Make sure that the user that uses this API is authenticated
     permission_classes = [permissions.IsAuthenticated]
 
@@ -36,4 +103,10 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     # the update API page.
     def get_object(self):
         """Retrieve and return the authenticated user."""
+        # The user of a signed access token is built from the token
+        # alone, so here we need to load the whole user from the database.
+        if isinstance(self.request.successful_authenticator,
+                      SignedTokenAuthentication):
+            return get_user_model().objects.get(pk=self.request.user.pk)
+
         return self.request.user
@@ -2,5 +2,12 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
-nginx -g 'daemon off;'
\ No newline at end of file
+# APP_PROTOCOL=http for the app served by uvicorn (SERVER=asgi), the
+# uwsgi protocol otherwise.
+TEMPLATE=/etc/nginx/default.conf.tpl
+if [ "$APP_PROTOCOL" = "http" ]; then
+    TEMPLATE=/etc/nginx/default-http.conf.tpl
+fi
+
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT}' < $TEMPLATE > /etc/nginx/conf.d/default.conf
+nginx -g 'daemon off;'
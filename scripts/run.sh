@@ -6,4 +6,15 @@ python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+# SERVER=asgi serves the app with uvicorn, on 'app.asgi', with the recipe,
+# tag & ingredient APIs as async views (ASYNC_VIEWS, see
+# 'core.asynchronous'), instead of uwsgi's 4 sync workers. uvicorn speaks
+# HTTP, not the uwsgi protocol: set APP_PROTOCOL=http on the proxy too.
+# See docs/asgi-benchmark.md for how the two compare.
+if [ "$SERVER" = "asgi" ]; then
+    ASYNC_VIEWS=1 exec uvicorn app.asgi:application --host 0.0.0.0 \
+        --port 9000 --workers 4 --no-access-log \
+        --proxy-headers --forwarded-allow-ips '*'
+fi
+
+uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi